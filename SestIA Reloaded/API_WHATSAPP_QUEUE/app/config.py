@@ -3,7 +3,7 @@ Configuración de la aplicación usando pydantic-settings.
 Todas las variables de entorno se cargan desde el archivo .env
 """
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Optional, Literal, Dict
 
 
 class Settings(BaseSettings):
@@ -11,18 +11,66 @@ class Settings(BaseSettings):
 
     # API WhatsApp
     API_WHATSAPP_URL: str
+    WHATSAPP_SENDER: Literal["middleware", "graph"] = "middleware"  # Envío por el middleware o directo a la Graph API de Meta
+    WHATSAPP_SENDER_BUZON_OVERRIDES: Dict[str, Literal["middleware", "graph"]] = {}  # Sender por buzon, JSON: {"14": "graph"}
+    META_GRAPH_URL: str = "https://graph.facebook.com"  # URL base de la Graph API (envío directo)
+    META_GRAPH_API_VERSION: str = "v21.0"  # Versión de la Graph API
+    CIRCUIT_BREAKER_ENABLED: bool = True  # Pausar envíos si el middleware o un phone_id no responden
+    CIRCUIT_FAILURE_THRESHOLD: int = 10  # Fallos consecutivos que abren el circuito
+    CIRCUIT_ERROR_RATE_THRESHOLD: float = 0.5  # Tasa de fallos (últimos 50 envíos) que abre el circuito
+    CIRCUIT_OPEN_SECONDS: int = 30  # Tiempo abierto antes de un envío de prueba
+    HTTP_MAX_CONNECTIONS: int = 0  # Conexiones simultáneas con el middleware (0 = envíos en vuelo del worker)
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 0  # Conexiones inactivas abiertas (0 = HTTP_MAX_CONNECTIONS)
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30  # Segundos que una conexión inactiva sigue abierta
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 5  # Tiempo máximo para abrir una conexión (TCP + TLS)
+    HTTP_READ_TIMEOUT_SECONDS: float = 30  # Tiempo máximo esperando la respuesta del middleware
+    HTTP_POOL_TIMEOUT_SECONDS: float = 30  # Tiempo máximo esperando una conexión libre del pool
+    HTTP2_ENABLED: bool = False  # Multiplexar los envíos en HTTP/2 (solo https)
+    HTTP_CONNECTIONS_PER_POOL: int = 10  # Conexiones por pool interno (pools grandes de httpcore consumen CPU por envío)
+    HTTP_WARMUP_CONNECTIONS: int = 10  # Conexiones que se abren al iniciar (0 = ninguna)
 
     # Configuración de envíos paralelos
     BATCH_SIZE: int = 100  # Mensajes por lote
     MAX_CONCURRENT_BATCHES: int = 5  # Lotes en paralelo
     INTERVALO_ENVIO_MS: int = 0  # Delay entre lotes (0 = sin delay)
+    EMBEDDED_WORKER: bool = True  # Enviar desde el proceso de la API (false = solo python -m app.worker)
+    WORKER_PROCESSES: int = 1  # Procesos de envío de python -m app.worker
+    WORKER_CONCURRENCY: int = 0  # Envíos simultáneos (0 = BATCH_SIZE * MAX_CONCURRENT_BATCHES)
+    ADAPTIVE_CONCURRENCY: bool = True  # Ajustar envíos en vuelo según latencia/errores (máximo: WORKER_CONCURRENCY)
+    PRIORITY_CONCURRENCY: int = 20  # Envíos simultáneos reservados para mensajes individuales (/api/encolar-mensaje)
+    ADAPTIVE_MIN_CONCURRENCY: int = 5  # Mínimo de envíos en vuelo con control adaptativo
+    ADAPTIVE_LATENCY_TARGET_MS: int = 2000  # Objetivo de p95 de latencia por envío
+    ADAPTIVE_ERROR_RATE_TARGET: float = 0.05  # Tasa máxima de timeouts/429/5xx antes de reducir
+    RATE_LIMIT_PER_SECOND: float = 80  # Mensajes/s por phone_id, compartido entre réplicas (0 = sin límite)
+    RATE_LIMIT_BURST: int = 0  # Ráfaga máxima por phone_id (0 = igual a RATE_LIMIT_PER_SECOND; los overrides por buzon la escalan a su rate)
+    RATE_LIMIT_BUZON_OVERRIDES: Dict[str, float] = {}  # Mensajes/s por buzon, JSON: {"14": 250}
+    RETRY_MAX_ATTEMPTS: int = 5  # Reintentos por mensaje ante timeouts/errores de red/429/5xx (0 = sin reintentos)
+    RETRY_BASE_DELAY_MS: int = 2000  # Espera antes del primer reintento (se duplica en cada intento, con jitter)
+    RETRY_MAX_DELAY_MS: int = 300000  # Espera máxima entre reintentos
+    LEASE_TIMEOUT_SECONDS: int = 120  # Tiempo máximo en vuelo sin ack antes de reencolar
+    LEASE_REAP_INTERVAL_SECONDS: int = 15  # Frecuencia del reaper de leases vencidos
+    STATS_FLUSH_INTERVAL_MS: int = 250  # Intervalo máximo entre escrituras de stats acumuladas
+    STATS_FLUSH_MAX_PENDING: int = 500  # Mensajes acumulados que fuerzan escribir stats
+    CREDENTIALS_CACHE_TTL_SECONDS: int = 300  # Vigencia de las credenciales de cada buzon en memoria
+    CREDENTIALS_CACHE_ENCRYPTION_KEY: str = ""  # Clave Fernet del cache de credenciales en Redis ("" = sin cache compartido)
+    CREDENTIALS_SHARED_CACHE_TTL_SECONDS: int = 900  # Vigencia de las credenciales en el cache compartido de Redis
 
     # Supabase
     SUPABASE_URL: str
     SUPABASE_KEY: str
+    SUPABASE_TIMEOUT_SECONDS: float = 10  # Tiempo máximo por consulta a Supabase
+    CREDENTIALS_REFRESH_SECONDS: int = 300  # Recarga en memoria de las credenciales de todos los buzones (0 = consulta por buzon)
+    SUPABASE_PAGE_SIZE: int = 1000  # Filas por página al cargar las credenciales
+    RESULTS_PERSIST_ENABLED: bool = False  # Guardar el resultado de cada envío en Supabase (tabla RESULTS_TABLE)
+    RESULTS_TABLE: str = "envios_resultados"  # Tabla de resultados (esquema instancia_sofia)
+    RESULTS_FLUSH_BATCH_SIZE: int = 500  # Resultados por inserción en Supabase
+    RESULTS_FLUSH_INTERVAL_MS: int = 1000  # Espera entre lecturas de resultados sin atraso
+    RESULTS_STREAM_MAX_LENGTH: int = 1000000  # Resultados sin guardar en Redis (se descartan los más viejos; 0 = sin límite)
 
     # Redis
     REDIS_URL: str
+    REDIS_ENQUEUE_CHUNK_SIZE: int = 1000  # Mensajes por bloque al encolar campañas grandes
+    QUEUE_BACKEND: Literal["list", "stream"] = "list"  # Colas en listas o en Redis Streams
 
     # General
     DEBUG: bool = False
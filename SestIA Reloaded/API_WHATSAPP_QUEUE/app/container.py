@@ -0,0 +1,140 @@
+"""
+Instancias de los servicios, compartidas por la API (app.main) y el proceso
+worker independiente (app.worker)
+"""
+import socket
+
+from app.config import settings
+from app.services.redis_service import RedisService
+from app.services.redis_stream_service import RedisStreamService
+from app.services.supabase_service import SupabaseService
+from app.services.whatsapp_service import WhatsAppService
+from app.services.meta_graph_service import MetaGraphService
+from app.services.sender_router import SenderRouter
+from app.services.worker import WorkerService
+from app.services.rate_limiter import RateLimiter
+from app.services.concurrency_controller import ConcurrencyController
+from app.services.circuit_breaker import CircuitBreakers
+from app.services.credential_cache import SharedCredentialStore
+from app.services.results_flusher import ResultsFlusher
+
+redis_service_class = RedisStreamService if settings.QUEUE_BACKEND == "stream" else RedisService
+redis_service = redis_service_class(
+    redis_url=settings.REDIS_URL,
+    campaign_ttl=settings.REDIS_CAMPAIGN_TTL,
+    enqueue_chunk_size=settings.REDIS_ENQUEUE_CHUNK_SIZE,
+    lease_timeout=settings.LEASE_TIMEOUT_SECONDS,
+    results_max_length=settings.RESULTS_STREAM_MAX_LENGTH
+)
+
+supabase_service = SupabaseService(
+    supabase_url=settings.SUPABASE_URL,
+    supabase_key=settings.SUPABASE_KEY,
+    timeout_seconds=settings.SUPABASE_TIMEOUT_SECONDS,
+    refresh_interval_seconds=settings.CREDENTIALS_REFRESH_SECONDS,
+    page_size=settings.SUPABASE_PAGE_SIZE,
+    results_table=settings.RESULTS_TABLE
+)
+
+rate_limiter = RateLimiter(
+    redis=redis_service,
+    default_rate=settings.RATE_LIMIT_PER_SECOND,
+    default_burst=settings.RATE_LIMIT_BURST,
+    buzon_rates=settings.RATE_LIMIT_BUZON_OVERRIDES
+)
+
+worker_concurrency = settings.WORKER_CONCURRENCY or settings.BATCH_SIZE * settings.MAX_CONCURRENT_BATCHES
+
+# Una conexión por envío en vuelo (campañas + carril prioritario): sin espera en el pool
+http_max_connections = settings.HTTP_MAX_CONNECTIONS or worker_concurrency + settings.PRIORITY_CONCURRENCY
+
+sender_options = dict(
+    max_connections=http_max_connections,
+    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS or None,
+    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    connect_timeout=settings.HTTP_CONNECT_TIMEOUT_SECONDS,
+    read_timeout=settings.HTTP_READ_TIMEOUT_SECONDS,
+    pool_timeout=settings.HTTP_POOL_TIMEOUT_SECONDS,
+    http2=settings.HTTP2_ENABLED,
+    connections_per_pool=settings.HTTP_CONNECTIONS_PER_POOL,
+    warmup_connections=settings.HTTP_WARMUP_CONNECTIONS
+)
+
+# Senders en uso: el default y los de WHATSAPP_SENDER_BUZON_OVERRIDES
+senders_in_use = {settings.WHATSAPP_SENDER, *settings.WHATSAPP_SENDER_BUZON_OVERRIDES.values()}
+
+# Cada sender tiene sus propios circuitos: un servicio caído no pausa los
+# envíos por el otro
+circuit_breakers = {
+    name: CircuitBreakers(
+        service=name,
+        failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+        error_rate_threshold=settings.CIRCUIT_ERROR_RATE_THRESHOLD,
+        open_seconds=settings.CIRCUIT_OPEN_SECONDS
+    )
+    for name in senders_in_use
+} if settings.CIRCUIT_BREAKER_ENABLED else {}
+
+senders = {}
+if "middleware" in senders_in_use:
+    senders["middleware"] = WhatsAppService(
+        api_url=settings.API_WHATSAPP_URL,
+        circuit_breakers=circuit_breakers.get("middleware"),
+        **sender_options
+    )
+if "graph" in senders_in_use:
+    senders["graph"] = MetaGraphService(
+        graph_url=settings.META_GRAPH_URL,
+        api_version=settings.META_GRAPH_API_VERSION,
+        circuit_breakers=circuit_breakers.get("graph"),
+        **sender_options
+    )
+
+whatsapp_service = SenderRouter(
+    senders=senders,
+    default=settings.WHATSAPP_SENDER,
+    buzon_senders=settings.WHATSAPP_SENDER_BUZON_OVERRIDES
+)
+
+concurrency_controller = ConcurrencyController(
+    max_limit=worker_concurrency,
+    min_limit=settings.ADAPTIVE_MIN_CONCURRENCY,
+    latency_target_ms=settings.ADAPTIVE_LATENCY_TARGET_MS,
+    error_rate_target=settings.ADAPTIVE_ERROR_RATE_TARGET
+) if settings.ADAPTIVE_CONCURRENCY else None
+
+shared_credentials = SharedCredentialStore(
+    redis=redis_service,
+    encryption_key=settings.CREDENTIALS_CACHE_ENCRYPTION_KEY,
+    ttl_seconds=settings.CREDENTIALS_SHARED_CACHE_TTL_SECONDS
+) if settings.CREDENTIALS_CACHE_ENCRYPTION_KEY else None
+
+results_flusher = ResultsFlusher(
+    redis=redis_service,
+    supabase=supabase_service,
+    batch_size=settings.RESULTS_FLUSH_BATCH_SIZE,
+    flush_interval_ms=settings.RESULTS_FLUSH_INTERVAL_MS
+) if settings.RESULTS_PERSIST_ENABLED else None
+
+worker_service = WorkerService(
+    redis=redis_service,
+    supabase=supabase_service,
+    whatsapp=whatsapp_service,
+    delay_ms=settings.INTERVALO_ENVIO_MS,
+    batch_size=settings.BATCH_SIZE,
+    max_concurrent_batches=settings.MAX_CONCURRENT_BATCHES,
+    consumer_name=f"{settings.INSTANCE_ID}-{socket.gethostname()}",
+    lease_reap_interval=settings.LEASE_REAP_INTERVAL_SECONDS,
+    stats_flush_interval_ms=settings.STATS_FLUSH_INTERVAL_MS,
+    stats_flush_max_pending=settings.STATS_FLUSH_MAX_PENDING,
+    concurrency=worker_concurrency,
+    rate_limiter=rate_limiter,
+    concurrency_controller=concurrency_controller,
+    priority_concurrency=settings.PRIORITY_CONCURRENCY,
+    retry_max_attempts=settings.RETRY_MAX_ATTEMPTS,
+    retry_base_delay_ms=settings.RETRY_BASE_DELAY_MS,
+    retry_max_delay_ms=settings.RETRY_MAX_DELAY_MS,
+    credentials_ttl_seconds=settings.CREDENTIALS_CACHE_TTL_SECONDS,
+    shared_credentials=shared_credentials,
+    results_flusher=results_flusher
+)
@@ -9,11 +9,9 @@ import logging
 import sys
 
 from app.config import settings
-from app.services.redis_service import RedisService
-from app.services.supabase_service import SupabaseService
-from app.services.whatsapp_service import WhatsAppService
-from app.services.worker import WorkerService
+from app.container import redis_service, supabase_service, whatsapp_service, worker_service
 from app.routes import campaign, status
+from app.services.circuit_breaker import open_services
 
 # Configurar logging
 logging.basicConfig(
@@ -26,30 +24,6 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-# Inicializar servicios globales
-redis_service = RedisService(
-    redis_url=settings.REDIS_URL,
-    campaign_ttl=settings.REDIS_CAMPAIGN_TTL
-)
-
-supabase_service = SupabaseService(
-    supabase_url=settings.SUPABASE_URL,
-    supabase_key=settings.SUPABASE_KEY
-)
-
-whatsapp_service = WhatsAppService(
-    api_url=settings.API_WHATSAPP_URL
-)
-
-worker_service = WorkerService(
-    redis=redis_service,
-    supabase=supabase_service,
-    whatsapp=whatsapp_service,
-    delay_ms=settings.INTERVALO_ENVIO_MS,
-    batch_size=settings.BATCH_SIZE,
-    max_concurrent_batches=settings.MAX_CONCURRENT_BATCHES
-)
-
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -58,16 +32,17 @@ async def lifespan(app: FastAPI):
 
     Startup:
     - Conecta a Redis
-    - Conecta a Supabase
-    - Inicia cliente HTTP de WhatsApp
-    - Inicia worker background
+    - Conecta a Supabase y precarga las credenciales de los buzones
+    - Inicia cliente HTTP de WhatsApp y worker background (si
+      EMBEDDED_WORKER; si no, los envíos los hace el proceso independiente
+      python -m app.worker y la API no abre conexiones con el middleware)
 
     Shutdown:
     - Detiene worker
     - Cierra conexiones
     """
     logger.info("=" * 60)
-    logger.info(f"Iniciando API Gestor de Colas WhatsApp - Instancia: {settings.INSTANCE_ID}")
+    logger.info(f"Iniciando API Gestor de Colas WhatsApp - Instancia: {settings.INSTANCE_ID} - Backend de colas: {settings.QUEUE_BACKEND}")
     logger.info("=" * 60)
 
     # Conectar a servicios
@@ -77,9 +52,11 @@ async def lifespan(app: FastAPI):
 
         logger.info("Conectando a Supabase...")
         await supabase_service.connect()
+        await supabase_service.start_credentials_refresh()
 
-        logger.info("Inicializando cliente WhatsApp...")
-        await whatsapp_service.connect()
+        if settings.EMBEDDED_WORKER:
+            logger.info("Inicializando cliente WhatsApp...")
+            await whatsapp_service.connect()
 
         logger.info("Servicios conectados exitosamente")
 
@@ -89,13 +66,16 @@ async def lifespan(app: FastAPI):
 
     # Iniciar worker background
     worker_task = None
-    try:
-        logger.info(f"Iniciando worker background (delay: {settings.INTERVALO_ENVIO_MS}ms)...")
-        worker_task = asyncio.create_task(worker_service.start_worker())
-        logger.info("Worker iniciado exitosamente")
-    except Exception as e:
-        logger.error(f"Error al iniciar worker: {str(e)}")
-        raise
+    if not settings.EMBEDDED_WORKER:
+        logger.info("Worker embebido desactivado: los envíos los hace python -m app.worker")
+    else:
+        try:
+            logger.info(f"Iniciando worker background (delay: {settings.INTERVALO_ENVIO_MS}ms)...")
+            worker_task = asyncio.create_task(worker_service.start_worker())
+            logger.info("Worker iniciado exitosamente")
+        except Exception as e:
+            logger.error(f"Error al iniciar worker: {str(e)}")
+            raise
 
     logger.info("=" * 60)
     logger.info("API lista para recibir requests")
@@ -116,6 +96,7 @@ async def lifespan(app: FastAPI):
 
     logger.info("Cerrando conexiones...")
     await redis_service.disconnect()
+    await supabase_service.disconnect()
     await whatsapp_service.disconnect()
 
     logger.info("Aplicación detenida")
@@ -162,6 +143,8 @@ async def root():
             "crear_campana": "/api/crear-campana (POST)",
             "crear_campana_json": "/api/crear-campana-json (POST)",
             "estado_cola": "/api/estado-cola/{campaign_id} (GET)",
+            "consumidores": "/api/estado-cola/{campaign_id}/consumidores (GET)",
+            "resultados": "/api/estado-cola/{campaign_id}/resultados?formato=csv|ndjson (GET)",
             "estado_sistema": "/api/estado-sistema (GET)",
             "listar_campanas": "/api/listar-campanas (GET)",
             "health": "/health (GET)",
@@ -180,11 +163,20 @@ async def health():
         # Verificar Supabase
         supabase_ok = await supabase_service.health_check()
 
-        # Verificar Worker
-        worker_ok = worker_service.is_running
+        # Verificar Worker (sin worker embebido, los envíos no dependen de esta réplica)
+        worker_ok = worker_service.is_running or not settings.EMBEDDED_WORKER
+
+        # Circuitos de cada sender de WhatsApp (sin worker embebido, los que
+        # publican los workers independientes)
+        if settings.EMBEDDED_WORKER:
+            circuits = whatsapp_service.get_circuit_status()
+        else:
+            circuits = await worker_service.get_published_circuit_status()
+        circuits_open = open_services(circuits)
+        whatsapp_ok = not circuits_open
 
         status = "healthy"
-        if not redis_ok or not supabase_ok or not worker_ok:
+        if not redis_ok or not supabase_ok or not worker_ok or not whatsapp_ok:
             status = "degraded"
 
         return {
@@ -193,8 +185,10 @@ async def health():
             "services": {
                 "redis": "ok" if redis_ok else "error",
                 "supabase": "ok" if supabase_ok else "error",
-                "worker": "running" if worker_ok else "stopped"
+                "worker": ("running" if worker_ok else "stopped") if settings.EMBEDDED_WORKER else "disabled",
+                "whatsapp": "ok" if whatsapp_ok else f"circuito no cerrado: {', '.join(circuits_open)}"
             },
+            "circuits": circuits,
             "uptime_seconds": worker_service.get_uptime_seconds()
         }
     except Exception as e:
@@ -5,6 +5,8 @@ from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
+from app.services.scheduler import MAX_WEIGHT
+
 
 class MessageData(BaseModel):
     """Modelo para un mensaje individual"""
@@ -39,6 +41,7 @@ class CreateCampaignRequest(BaseModel):
     plantilla: str = Field(..., description="Nombre de la plantilla Meta")
     buzon: str = Field(..., description="ID del canal en Supabase")
     idioma: str = Field(default="es", description="Código de idioma de la plantilla")
+    peso: float = Field(default=1.0, gt=0, le=MAX_WEIGHT, allow_inf_nan=False, description="Peso de la campaña en el reparto entre campañas activas")
     mensajes: List[MessageData] = Field(..., description="Lista de mensajes a enviar")
 
     @field_validator('mensajes')
@@ -67,6 +70,7 @@ class CampaignStatus(BaseModel):
     pendientes: int
     enviados: int
     fallidos: int
+    reintentos: int = 0  # Reintentos programados por fallos transitorios (acumulado)
     estado: str  # "procesando", "completado", "encolado"
     progreso_porcentaje: float
     ultimo_envio: Optional[datetime] = None
@@ -82,6 +86,10 @@ class SystemStatus(BaseModel):
     supabase_conectado: bool
     ultima_actividad: Optional[datetime] = None
     uptime_segundos: int
+    concurrencia: Optional[Dict[str, Any]] = None
+    circuitos: Optional[Dict[str, Any]] = None
+    http_pool: Optional[Dict[str, Any]] = None
+    resultados: Optional[Dict[str, Any]] = None
 
 
 class WhatsAppCredentials(BaseModel):
@@ -107,6 +115,8 @@ class WhatsAppResponse(BaseModel):
     success: bool
     wamid: Optional[str] = None
     error: Optional[str] = None
+    status_code: Optional[int] = None
+    retryable: bool = False
 
 
 class EnqueueMessageRequest(BaseModel):
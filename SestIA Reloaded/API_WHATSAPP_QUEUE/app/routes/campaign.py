@@ -11,6 +11,8 @@ from app.models import CreateCampaignRequest, CreateCampaignResponse, MessageDat
 from app.services.redis_service import RedisService
 from app.services.supabase_service import SupabaseService
 from app.utils.csv_parser import parse_csv, validate_csv_size
+from app.utils.message_codec import encode_row
+from app.services.scheduler import MAX_WEIGHT
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -43,6 +45,7 @@ async def crear_campana_csv(
     plantilla: str = Form(..., description="Nombre de la plantilla Meta"),
     buzon: str = Form(..., description="ID del canal en Supabase"),
     idioma: str = Form(default="es", description="Código de idioma"),
+    peso: float = Form(default=1.0, gt=0, le=MAX_WEIGHT, allow_inf_nan=False, description="Peso de la campaña en el reparto entre campañas activas"),
     archivo_csv: Optional[UploadFile] = File(None, description="Archivo CSV con mensajes"),
     redis: RedisService = Depends(get_redis),
     supabase: SupabaseService = Depends(get_supabase)
@@ -90,39 +93,23 @@ async def crear_campana_csv(
             f"{len(messages_data)} mensajes, plantilla '{plantilla}', buzon '{buzon}'"
         )
 
-        # Verificar que el buzon existe en Supabase
+        # Verificar que el buzon existe (credenciales precargadas de Supabase)
         try:
             credentials = await supabase.get_credentials(buzon)
             logger.info(f"Credenciales validadas para buzon '{buzon}': {credentials['custom_name']}")
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
 
-        # Preparar mensajes para encolar
-        # IMPORTANTE: Cada mensaje debe incluir plantilla, buzon, idioma
-        messages_to_enqueue = []
-        for msg_data in messages_data:
-            message = {
-                "numero": msg_data.get("numero"),
-                "plantilla": plantilla,
-                "buzon": buzon,
-                "idioma": idioma,
-                # Campos opcionales del CSV
-                "cedula": msg_data.get("cedula"),
-                "estatus_servicio": msg_data.get("estatus_servicio"),
-                "variable1": msg_data.get("variable1"),
-                "variable2": msg_data.get("variable2"),
-                "variable3": msg_data.get("variable3"),
-                "variable4": msg_data.get("variable4"),
-                "variable5": msg_data.get("variable5"),
-                "url_imagen": msg_data.get("url_imagen")
-            }
-            messages_to_enqueue.append(message)
+        # Preparar mensajes para encolar (generador: se serializan por bloques al encolar)
+        # Formato compacto: plantilla, buzon e idioma solo viven en la metadata de la campaña
+        messages_to_enqueue = (encode_row(msg_data) for msg_data in messages_data)
 
         # Metadata de la campaña
         metadata = {
             "plantilla": plantilla,
             "buzon": buzon,
             "idioma": idioma,
+            "peso": peso,
             "created_at": datetime.utcnow().isoformat()
         }
 
@@ -165,6 +152,7 @@ async def crear_campana_json(
     - plantilla
     - buzon
     - idioma
+    - peso (opcional, default 1.0)
     - mensajes (array de MessageData)
     """
     try:
@@ -173,37 +161,23 @@ async def crear_campana_json(
             f"{len(request.mensajes)} mensajes, plantilla '{request.plantilla}', buzon '{request.buzon}'"
         )
 
-        # Verificar que el buzon existe en Supabase
+        # Verificar que el buzon existe (credenciales precargadas de Supabase)
         try:
             credentials = await supabase.get_credentials(request.buzon)
             logger.info(f"Credenciales validadas para buzon '{request.buzon}': {credentials['custom_name']}")
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
 
-        # Preparar mensajes para encolar
-        messages_to_enqueue = []
-        for msg in request.mensajes:
-            message = {
-                "numero": msg.numero,
-                "plantilla": request.plantilla,
-                "buzon": request.buzon,
-                "idioma": request.idioma,
-                "cedula": msg.cedula,
-                "estatus_servicio": msg.estatus_servicio,
-                "variable1": msg.variable1,
-                "variable2": msg.variable2,
-                "variable3": msg.variable3,
-                "variable4": msg.variable4,
-                "variable5": msg.variable5,
-                "url_imagen": msg.url_imagen
-            }
-            messages_to_enqueue.append(message)
+        # Preparar mensajes para encolar (generador: se serializan por bloques al encolar)
+        # Formato compacto: plantilla, buzon e idioma solo viven en la metadata de la campaña
+        messages_to_enqueue = (encode_row(msg.model_dump()) for msg in request.mensajes)
 
         # Metadata de la campaña
         metadata = {
             "plantilla": request.plantilla,
             "buzon": request.buzon,
             "idioma": request.idioma,
+            "peso": request.peso,
             "created_at": datetime.utcnow().isoformat()
         }
 
@@ -250,6 +224,9 @@ async def encolar_mensaje_individual(
     3. Auto-generado si no se proporciona ninguno
 
     Esto permite agrupar múltiples mensajes en una sola campaña usando el header.
+
+    Los mensajes individuales van al carril prioritario: el worker los atiende
+    antes que las campañas masivas, con concurrencia reservada.
     """
     try:
         # Determinar campaign_id (prioridad: header > body > auto-generado)
@@ -286,11 +263,14 @@ async def encolar_mensaje_individual(
             "tipo": "mensaje_individual"
         }
 
-        # Encolar en Redis
+        # Encolar en Redis (registro de campañas prioritarias)
         total_encolados = await redis.enqueue_campaign(
             campaign_id=campaign_id,
             messages=[message_dict],
-            metadata=metadata
+            metadata=metadata,
+            priority=True,
+            # Formato completo: no cambia la plantilla de una campaña masiva en curso
+            self_contained=True
         )
 
         # Obtener posición en la cola
@@ -2,14 +2,18 @@
 Endpoints para consultar estado de campañas y sistema
 """
 from fastapi import APIRouter, HTTPException, Depends
-from typing import Optional
+from fastapi.responses import StreamingResponse
+from typing import Optional, Literal
 from datetime import datetime
 import logging
+import re
 
 from app.models import CampaignStatus, SystemStatus
 from app.services.redis_service import RedisService
 from app.services.supabase_service import SupabaseService
+from app.services.circuit_breaker import open_services
 from app.services.worker import WorkerService
+from app.utils.results_export import MEDIA_TYPES, stream_results
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -85,6 +89,7 @@ async def get_campaign_status(
             pendientes=stats["pendientes"],
             enviados=stats["enviados"],
             fallidos=stats["fallidos"],
+            reintentos=stats["reintentos"],
             estado=stats["estado"],
             progreso_porcentaje=stats["progreso_porcentaje"],
             ultimo_envio=ultimo_envio
@@ -97,6 +102,121 @@ async def get_campaign_status(
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
 
+@router.get("/estado-cola/{campaign_id}/consumidores")
+async def get_campaign_consumers(
+    campaign_id: str,
+    redis: RedisService = Depends(get_redis)
+):
+    """
+    Consulta el detalle de consumo de una campaña.
+
+    Retorna:
+    - Backend de colas (list o stream)
+    - Mensajes en cola y en vuelo (desencolados sin confirmar)
+    - Pendientes por consumidor (réplica del worker)
+    - Lag del grupo de consumidores (solo backend stream)
+    """
+    try:
+        stats = await redis.get_campaign_stats(campaign_id)
+
+        if not stats:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Campaña '{campaign_id}' no encontrada"
+            )
+
+        return await redis.get_consumers_info(campaign_id)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error al obtener consumidores de campaña '{campaign_id}': {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+
+@router.get("/estado-cola/{campaign_id}/resultados")
+async def export_campaign_results(
+    campaign_id: str,
+    formato: Literal["csv", "ndjson"] = "csv",
+    estado: Optional[Literal["enviado", "fallido", "reintento"]] = None,
+    redis: RedisService = Depends(get_redis),
+    supabase: SupabaseService = Depends(get_supabase)
+):
+    """
+    Descarga los resultados por mensaje de una campaña (RESULTS_PERSIST_ENABLED).
+
+    Query params:
+    - formato: csv (default) o ndjson
+    - estado: solo enviado, fallido o reintento (opcional)
+
+    Columnas: numero, estado, wamid, error, status_code, intento, buzon,
+    creado_en, en orden de llegada. La respuesta se transmite a medida que se
+    leen las páginas de Supabase: la memoria no depende del tamaño de la
+    campaña. Los resultados de la campaña que al empezar seguían en Redis
+    (todavía sin guardar) se agregan al final; el header
+    X-Resultados-Sin-Guardar indica cuántos eran.
+    """
+    if not settings.RESULTS_PERSIST_ENABLED:
+        raise HTTPException(
+            status_code=404,
+            detail="Resultados de envío desactivados (RESULTS_PERSIST_ENABLED=false)"
+        )
+
+    # Resultados todavía en Redis, leídos antes que Supabase: los que se
+    # guarden mientras tanto aparecen en Supabase y no se repiten
+    try:
+        unsaved = await redis.get_unsaved_results(campaign_id, estado)
+    except Exception as e:
+        logger.error(f"Error al leer resultados sin guardar de campaña '{campaign_id}': {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+    # La primera página se lee antes de responder: los errores de Supabase y
+    # las campañas inexistentes devuelven un status HTTP y no un archivo cortado
+    pages = supabase.iter_results(campaign_id, estado)
+    try:
+        first_page = await pages.__anext__()
+    except StopAsyncIteration:
+        first_page = []
+    except Exception as e:
+        logger.error(f"Error al leer resultados de campaña '{campaign_id}': {str(e) or type(e).__name__}")
+        raise HTTPException(status_code=503, detail="No se pudieron leer los resultados en Supabase")
+
+    try:
+        if not first_page and not unsaved and not await redis.get_campaign_stats(campaign_id):
+            raise HTTPException(
+                status_code=404,
+                detail=f"Campaña '{campaign_id}' no encontrada"
+            )
+    except HTTPException:
+        await pages.aclose()
+        raise
+    except Exception as e:
+        await pages.aclose()
+        logger.error(f"Error al exportar resultados de campaña '{campaign_id}': {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+    async def body():
+        try:
+            async for chunk in stream_results(first_page, pages, formato, unsaved):
+                yield chunk
+        except Exception as e:
+            logger.error(f"Exportación de resultados de '{campaign_id}' interrumpida: {str(e) or type(e).__name__}")
+            raise
+        finally:
+            await pages.aclose()
+
+    # Nombre de archivo ASCII (el ID de campaña lo define el cliente)
+    filename = re.sub(r"[^A-Za-z0-9._-]", "_", f"resultados_{campaign_id}.{formato}")
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[formato],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Resultados-Sin-Guardar": str(len(unsaved))
+        }
+    )
+
+
 @router.get("/estado-sistema", response_model=SystemStatus)
 async def get_system_status(
     redis: RedisService = Depends(get_redis),
@@ -115,22 +235,37 @@ async def get_system_status(
     - Estado de conexión a Supabase
     - Última actividad
     - Uptime en segundos
+    - Control adaptativo de concurrencia: límite actual, p95, tasa de errores
+      y decisiones recientes (si está activo y el worker está embebido: el
+      controlador de la API sin worker nunca se ajusta)
+    - Circuitos del middleware y por phone_id (si están activos)
+    - Pool HTTP de los envíos: espera por una conexión libre, apertura de
+      conexiones y tiempo de respuesta del middleware (p50/p95/máx en ms)
+    - Resultados de envío guardados en Supabase y pendientes en Redis (si
+      está activo)
     """
     try:
         # Verificar conexiones
         redis_conectado = await redis.ping()
         supabase_conectado = await supabase.health_check()
 
-        # Obtener campañas activas
-        campaigns = await redis.get_active_campaigns()
-        campanas_activas = len(campaigns)
+        # Obtener campañas activas y mensajes pendientes (una lectura por registro)
+        pending = await redis.get_all_pending_by_campaign()
+        campanas_activas = sum(1 for length in pending.values() if length > 0)
+        total_pendientes = sum(pending.values())
 
-        # Obtener total de mensajes pendientes
-        total_pendientes = await redis.get_total_pending_messages()
+        # Circuitos de cada sender (servicio abierto = sus buzones no están
+        # enviando). Sin worker embebido, los que publican los workers
+        # independientes
+        if settings.EMBEDDED_WORKER:
+            circuitos = worker.get_circuit_status()
+        else:
+            circuitos = await worker.get_published_circuit_status()
+        servicio_abierto = bool(open_services(circuitos))
 
         # Determinar estado del sistema
         estado = "healthy"
-        if not redis_conectado or not supabase_conectado:
+        if not redis_conectado or not supabase_conectado or servicio_abierto:
             estado = "degraded"
         if not redis_conectado and not supabase_conectado:
             estado = "down"
@@ -149,7 +284,11 @@ async def get_system_status(
             redis_conectado=redis_conectado,
             supabase_conectado=supabase_conectado,
             ultima_actividad=ultima_actividad,
-            uptime_segundos=uptime
+            uptime_segundos=uptime,
+            concurrencia=worker.get_concurrency_status() if settings.EMBEDDED_WORKER else None,
+            circuitos=circuitos,
+            http_pool=worker.get_http_stats() if settings.EMBEDDED_WORKER else None,
+            resultados=await worker.get_results_status()
         )
 
     except Exception as e:
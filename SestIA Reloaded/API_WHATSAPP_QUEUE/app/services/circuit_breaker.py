@@ -0,0 +1,311 @@
+"""
+Circuit breakers del envío a la API de WhatsApp (por sender y por phone_id)
+"""
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Estados del circuito
+CLOSED = "cerrado"
+OPEN = "abierto"
+HALF_OPEN = "semiabierto"
+
+# Orden de gravedad de los estados (para combinar el estado de varios workers)
+STATE_SEVERITY = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Respuestas que indican que el servicio del sender no está disponible (sin
+# respuesta HTTP o error del proxy/gateway delante del middleware o de Meta)
+SERVICE_DOWN_STATUS_CODES = {502, 503, 504}
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker clásico de tres estados.
+
+    - Cerrado: los envíos pasan. Se abre con `failure_threshold` fallos
+      consecutivos o con una tasa de fallos mayor a `error_rate_threshold`
+      en los últimos `window_size` envíos (con al menos `min_samples`)
+    - Abierto: los envíos se rechazan sin llamar a la API durante `open_seconds`
+    - Semiabierto: pasan hasta `half_open_max_calls` envíos de prueba; si
+      salen bien el circuito se cierra, si alguno falla vuelve a abrirse
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 10,
+        error_rate_threshold: float = 0.5,
+        window_size: int = 50,
+        min_samples: int = 20,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1
+    ):
+        """
+        Inicializa el circuito.
+
+        Args:
+            name: Nombre para logs y estado
+            failure_threshold: Fallos consecutivos que abren el circuito
+            error_rate_threshold: Tasa de fallos en la ventana que abre el circuito
+            window_size: Envíos recientes considerados para la tasa de fallos
+            min_samples: Envíos mínimos en la ventana para evaluar la tasa
+            open_seconds: Tiempo abierto antes de probar la recuperación
+            half_open_max_calls: Envíos de prueba simultáneos en semiabierto
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min(min_samples, window_size)
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = CLOSED
+        self._window: Deque[bool] = deque(maxlen=window_size)
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_started_at = 0.0
+
+        # Para /health y /api/estado-sistema
+        self.last_change: Optional[str] = None
+        self.last_reason: Optional[str] = None
+
+    def allow_request(self) -> bool:
+        """
+        True si el envío puede hacerse ahora (en semiabierto ocupa un
+        turno de prueba, que se libera con record_success/record_failure).
+        """
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                return False
+            self._transition(HALF_OPEN, "probando recuperación")
+        if self.state == HALF_OPEN:
+            now = time.monotonic()
+            if self._probes >= self.half_open_max_calls:
+                # Una prueba sin resultado (envío cancelado) no bloquea el circuito
+                if now - self._probe_started_at < self.open_seconds:
+                    return False
+                self._probes = 0
+            self._probes += 1
+            self._probe_started_at = now
+        return True
+
+    def cancel_request(self):
+        """Devuelve un turno de prueba tomado por allow_request que no se usó"""
+        if self.state == HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+
+    def is_open(self) -> bool:
+        """
+        True si el circuito no admite envíos ahora: abierto dentro de la
+        espera, o semiabierto con todos los turnos de prueba en curso.
+        """
+        if self.state == OPEN:
+            return self.retry_after() > 0
+        if self.state == HALF_OPEN:
+            return (
+                self._probes >= self.half_open_max_calls
+                and time.monotonic() - self._probe_started_at < self.open_seconds
+            )
+        return False
+
+    def retry_after(self) -> float:
+        """Segundos hasta que el circuito pase a semiabierto (0 si no está abierto)"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        """Registra un envío exitoso"""
+        self._window.append(True)
+        self._consecutive_failures = 0
+        if self.state == HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            self._window.clear()
+            self._transition(CLOSED, "envío de prueba exitoso")
+
+    def record_failure(self):
+        """Registra un envío fallido por indisponibilidad"""
+        self._window.append(False)
+        self._consecutive_failures += 1
+
+        if self.state == HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            self._open("falló el envío de prueba")
+        elif self.state == CLOSED:
+            if self._consecutive_failures >= self.failure_threshold:
+                self._open(f"{self._consecutive_failures} fallos consecutivos")
+            elif len(self._window) >= self.min_samples:
+                error_rate = self._window.count(False) / len(self._window)
+                if error_rate > self.error_rate_threshold:
+                    self._open(f"tasa de fallos {error_rate:.0%}")
+
+    def _open(self, reason: str):
+        """Abre el circuito y reinicia la espera"""
+        self._opened_at = time.monotonic()
+        self._transition(OPEN, reason)
+
+    def _transition(self, state: str, reason: str):
+        """Cambia de estado y lo registra"""
+        if state == self.state:
+            return
+        previous, self.state = self.state, state
+        self.last_change = datetime.utcnow().isoformat()
+        self.last_reason = reason
+        if state == HALF_OPEN:
+            self._probes = 0
+        log = logger.warning if state == OPEN else logger.info
+        log(f"Circuito '{self.name}': {previous} -> {state} ({reason})")
+
+    def get_status(self) -> Dict:
+        """Estado actual del circuito"""
+        return {
+            "estado": self.state,
+            "fallos_consecutivos": self._consecutive_failures,
+            "reintentar_en_segundos": round(self.retry_after(), 1),
+            "ultimo_cambio": self.last_change,
+            "motivo": self.last_reason
+        }
+
+
+class CircuitBreakers:
+    """
+    Circuitos de un sender: uno global para su servicio (el middleware en
+    API_WHATSAPP_URL o la Graph API) y uno por phone_id. Cada sender tiene
+    los suyos: un servicio caído no pausa los envíos por otro sender.
+
+    - Sin respuesta HTTP (timeout, error de red) o 502/503/504: fallo del
+      servicio (no dice nada del phone_id)
+    - 429 y otros 5xx: el servicio respondió, fallo del phone_id
+    - Éxitos y errores del mensaje (4xx): cuentan como éxito de ambos, el
+      servicio está disponible
+    """
+
+    def __init__(self, service: str = "middleware", **breaker_options):
+        """
+        Inicializa los circuitos.
+
+        Args:
+            service: Nombre del sender, para los logs del circuito del servicio
+            breaker_options: Parámetros de CircuitBreaker comunes a todos los circuitos
+        """
+        self.breaker_options = breaker_options
+        self.service = CircuitBreaker(service, **breaker_options)
+        self._phones: Dict[str, CircuitBreaker] = {}
+
+    def for_phone(self, phone_id: str) -> CircuitBreaker:
+        """Circuito de un phone_id (se crea al primer uso)"""
+        breaker = self._phones.get(phone_id)
+        if breaker is None:
+            breaker = CircuitBreaker(f"phone_id {phone_id}", **self.breaker_options)
+            self._phones[phone_id] = breaker
+        return breaker
+
+    def allow_request(self, phone_id: Optional[str]) -> bool:
+        """True si el servicio y el phone_id aceptan el envío"""
+        if not self.service.allow_request():
+            return False
+        if phone_id and not self.for_phone(phone_id).allow_request():
+            self.service.cancel_request()
+            return False
+        return True
+
+    def record(self, phone_id: Optional[str], result: Dict):
+        """
+        Registra el resultado de un envío en los circuitos que correspondan.
+
+        Args:
+            phone_id: Número emisor del envío
+            result: Resultado de WhatsAppService.send_message
+        """
+        status_code = result.get("status_code")
+        service_down = status_code is None or status_code in SERVICE_DOWN_STATUS_CODES
+        unavailable = not result.get("success") and result.get("retryable")
+
+        if unavailable and service_down:
+            self.service.record_failure()
+        else:
+            self.service.record_success()
+
+        if phone_id:
+            breaker = self.for_phone(phone_id)
+            if not unavailable:
+                breaker.record_success()
+            elif not service_down:
+                breaker.record_failure()
+            else:
+                breaker.cancel_request()
+
+    def is_open(self, phone_id: Optional[str] = None) -> bool:
+        """True si el circuito del servicio (o el del phone_id) está abierto"""
+        if self.service.is_open():
+            return True
+        return bool(phone_id) and phone_id in self._phones and self._phones[phone_id].is_open()
+
+    def retry_after(self, phone_id: Optional[str] = None) -> float:
+        """Segundos hasta que el servicio (y el phone_id) admitan un envío de prueba"""
+        wait = self.service.retry_after()
+        if phone_id and phone_id in self._phones:
+            wait = max(wait, self._phones[phone_id].retry_after())
+        return wait
+
+    def get_status(self) -> Dict:
+        """Estado del circuito del servicio y de cada phone_id"""
+        return {
+            "servicio": self.service.get_status(),
+            "phone_ids": {
+                phone_id: breaker.get_status()
+                for phone_id, breaker in self._phones.items()
+            }
+        }
+
+
+def merge_circuit_status(statuses: Iterable[Dict[str, Dict]]) -> Optional[Dict[str, Dict]]:
+    """
+    Combina el estado de los circuitos de varios workers (por sender, ver
+    CircuitBreakers.get_status): por circuito, el del worker en el estado
+    más grave.
+
+    Args:
+        statuses: Estado de los circuitos de cada worker, por sender
+
+    Returns:
+        Estado combinado con el mismo formato, o None si no hay ninguno
+    """
+    def worst(current: Optional[Dict], status: Dict) -> Dict:
+        if current is None or STATE_SEVERITY[status["estado"]] > STATE_SEVERITY[current["estado"]]:
+            return status
+        return current
+
+    merged = None
+    for status in statuses:
+        merged = merged or {}
+        for sender, sender_status in status.items():
+            current = merged.get(sender)
+            if current is None:
+                merged[sender] = {"servicio": sender_status["servicio"], "phone_ids": dict(sender_status["phone_ids"])}
+                continue
+            current["servicio"] = worst(current["servicio"], sender_status["servicio"])
+            for phone_id, phone_status in sender_status["phone_ids"].items():
+                current["phone_ids"][phone_id] = worst(current["phone_ids"].get(phone_id), phone_status)
+    return merged
+
+
+def open_services(status: Optional[Dict[str, Dict]]) -> List[str]:
+    """
+    Senders con el circuito del servicio no cerrado.
+
+    Args:
+        status: Estado de los circuitos por sender (None si están desactivados)
+
+    Returns:
+        Nombres de los senders abiertos o semiabiertos
+    """
+    return [
+        sender for sender, sender_status in (status or {}).items()
+        if sender_status["servicio"]["estado"] != CLOSED
+    ]
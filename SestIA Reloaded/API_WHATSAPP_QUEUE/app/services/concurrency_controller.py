@@ -0,0 +1,205 @@
+"""
+Control adaptativo (AIMD) de envíos simultáneos a la API de WhatsApp
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyController:
+    """
+    Ajusta el límite de envíos en vuelo según la latencia y los errores del
+    middleware de WhatsApp (AIMD, como el control de congestión de TCP).
+
+    Cada `interval` segundos evalúa los resultados de la ventana:
+    - Tasa de congestión (timeouts, sin respuesta, 429, 5xx) sobre el objetivo:
+      el límite se multiplica por `decrease_factor`. Esta reducción no espera
+      al cierre de la ventana: se aplica en cuanto la tasa se supera (como
+      máximo una vez cada `interval / 4`)
+    - p95 de latencia sobre el objetivo: el límite se mantiene
+    - Todo bajo los objetivos y el límite se llegó a usar: el límite sube
+      `increase_step`
+
+    Los errores 4xx (número inválido, plantilla mal configurada) son del
+    mensaje, no de capacidad, y no afectan el límite.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 5,
+        initial_limit: Optional[int] = None,
+        latency_target_ms: float = 2000,
+        error_rate_target: float = 0.05,
+        increase_step: int = 5,
+        decrease_factor: float = 0.7,
+        interval: float = 1.0,
+        min_samples: int = 10
+    ):
+        """
+        Inicializa el controlador.
+
+        Args:
+            max_limit: Límite máximo de envíos en vuelo
+            min_limit: Límite mínimo de envíos en vuelo
+            initial_limit: Límite inicial (default: un cuarto del máximo)
+            latency_target_ms: Objetivo de p95 de latencia por envío
+            error_rate_target: Tasa máxima de errores de congestión por ventana
+            increase_step: Aumento aditivo por ventana sana
+            decrease_factor: Factor de reducción ante congestión
+            interval: Duración de la ventana de evaluación en segundos
+            min_samples: Resultados mínimos en la ventana para decidir
+        """
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = max(self.min_limit, min(initial_limit or max_limit // 4, max_limit))
+        self.latency_target = latency_target_ms / 1000.0
+        self.error_rate_target = error_rate_target
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.interval = interval
+        self.min_samples = min_samples
+
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+        # Ventana actual
+        self._latencies: List[float] = []
+        self._congestion = 0
+        self._saturated = False
+        self._window_start = time.monotonic()
+
+        # Última evaluación y decisiones recientes (para /api/estado-sistema)
+        self.last_p95_ms: Optional[float] = None
+        self.last_error_rate: Optional[float] = None
+        self.decisions: Deque[Dict] = deque(maxlen=20)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Ocupa un slot de envío mientras dura el bloque"""
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self):
+        """Espera hasta que haya un slot libre bajo el límite actual"""
+        while self.in_flight >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Si ya había sido despertado, ceder el turno a otro
+                self._wake()
+                raise
+
+        self.in_flight += 1
+        if self.in_flight >= self.limit:
+            self._saturated = True
+
+    def release(self):
+        """Libera un slot de envío"""
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        """Despierta tantos waiters como slots libres haya"""
+        free = self.limit - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    @staticmethod
+    def is_congestion(result: Dict) -> bool:
+        """True si el resultado indica saturación del middleware o de Meta"""
+        status_code = result.get("status_code")
+        return status_code is None or status_code == 429 or status_code >= 500
+
+    def record(self, latency: float, result: Dict):
+        """
+        Registra el resultado de un envío y, al cerrar la ventana, ajusta el límite.
+
+        Args:
+            latency: Duración del envío en segundos
+            result: Resultado de WhatsAppService.send_message
+        """
+        self._latencies.append(latency)
+        if not result.get("success") and self.is_congestion(result):
+            self._congestion += 1
+
+        if len(self._latencies) < self.min_samples:
+            return
+
+        now = time.monotonic()
+        window_age = now - self._window_start
+        if window_age >= self.interval:
+            self._decide(now)
+        elif (
+            window_age >= self.interval / 4
+            and self._congestion / len(self._latencies) > self.error_rate_target
+        ):
+            # Congestión: reducir sin esperar al cierre de la ventana
+            self._decide(now)
+
+    def _decide(self, now: float):
+        """Evalúa la ventana cerrada y aplica AIMD"""
+        samples = len(self._latencies)
+        latencies = sorted(self._latencies)
+        p95 = latencies[int(0.95 * (samples - 1))]
+        error_rate = self._congestion / samples
+        saturated = self._saturated
+
+        self.last_p95_ms = round(p95 * 1000, 1)
+        self.last_error_rate = round(error_rate, 4)
+        self._latencies = []
+        self._congestion = 0
+        self._saturated = self.in_flight >= self.limit
+        self._window_start = now
+
+        previous = self.limit
+        if error_rate > self.error_rate_target:
+            self.limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+            action, reason = "reducir", f"errores de congestión {error_rate:.1%}"
+        elif p95 > self.latency_target:
+            action, reason = "mantener", f"p95 {self.last_p95_ms} ms sobre el objetivo"
+        elif saturated and self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + self.increase_step)
+            self._wake()
+            action, reason = "aumentar", "latencia y errores bajo el objetivo"
+        else:
+            return
+
+        # Registrar cambios de límite y el inicio de cada racha de "mantener"
+        last_action = self.decisions[-1]["accion"] if self.decisions else None
+        if self.limit != previous or (action == "mantener" and last_action != "mantener"):
+            self.decisions.append({
+                "timestamp": datetime.utcnow().isoformat(),
+                "accion": action,
+                "limite_anterior": previous,
+                "limite": self.limit,
+                "motivo": reason
+            })
+        if action == "reducir" and self.limit != previous:
+            logger.warning(f"Concurrencia reducida {previous} -> {self.limit}: {reason}")
+
+    def get_status(self) -> Dict:
+        """Estado actual del controlador"""
+        return {
+            "limite": self.limit,
+            "minimo": self.min_limit,
+            "maximo": self.max_limit,
+            "en_vuelo": self.in_flight,
+            "p95_ms": self.last_p95_ms,
+            "tasa_error": self.last_error_rate,
+            "decisiones": list(self.decisions)
+        }
@@ -0,0 +1,200 @@
+"""
+Cache de credenciales por buzon: en memoria, con TTL y carga única por buzon,
+y opcionalmente un segundo nivel cifrado en Redis compartido entre réplicas
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from app.services.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCredentialStore:
+    """
+    Credenciales por buzon en Redis, compartidas por todas las réplicas.
+
+    Se guardan cifradas (Fernet: AES-128-CBC + HMAC-SHA256) con la clave de
+    CREDENTIALS_CACHE_ENCRYPTION_KEY, así los tokens de Meta no quedan en
+    texto plano en Redis ni en sus backups. Un error de Redis o una entrada
+    que no se puede descifrar (clave rotada) se trata como ausente.
+    """
+
+    def __init__(self, redis: RedisService, encryption_key: str, ttl_seconds: int = 3600):
+        """
+        Inicializa el almacén compartido.
+
+        Args:
+            redis: Servicio de Redis
+            encryption_key: Clave Fernet (32 bytes en base64 urlsafe)
+            ttl_seconds: Vigencia de las credenciales en Redis
+        """
+        self.redis = redis
+        self.ttl_seconds = ttl_seconds
+        self._fernet = Fernet(encryption_key)
+
+    async def get(self, buzon_id: str) -> Optional[Dict]:
+        """Credenciales del buzon desde Redis (None si no están o no se pueden leer)"""
+        try:
+            encrypted = await self.redis.get_shared_credentials(buzon_id)
+            if not encrypted:
+                return None
+            return json.loads(self._fernet.decrypt(encrypted, ttl=self.ttl_seconds))
+        except InvalidToken:
+            logger.warning(f"Credenciales compartidas del buzon '{buzon_id}' ilegibles (clave distinta o vencidas)")
+            return None
+        except Exception as e:
+            logger.error(f"Error al leer credenciales compartidas del buzon '{buzon_id}': {str(e)}")
+            return None
+
+    async def set(self, buzon_id: str, credentials: Dict):
+        """Guarda las credenciales cifradas del buzon en Redis"""
+        try:
+            encrypted = self._fernet.encrypt(json.dumps(credentials).encode()).decode()
+            await self.redis.set_shared_credentials(buzon_id, encrypted, self.ttl_seconds)
+        except Exception as e:
+            logger.error(f"Error al guardar credenciales compartidas del buzon '{buzon_id}': {str(e)}")
+
+    async def invalidate(self, buzon_id: str):
+        """Borra las credenciales del buzon en Redis y avisa a todas las réplicas"""
+        try:
+            await self.redis.invalidate_shared_credentials(buzon_id)
+        except Exception as e:
+            logger.error(f"Error al invalidar credenciales compartidas del buzon '{buzon_id}': {str(e)}")
+
+    def listen_invalidated(self) -> AsyncIterator[str]:
+        """Avisos de buzones invalidados en cualquier réplica"""
+        return self.redis.listen_credentials_invalidated()
+
+
+class CredentialCache:
+    """
+    Cache de credenciales de WhatsApp por buzon.
+
+    - Cada entrada vence a los `ttl_seconds`: un token rotado en Supabase se
+      empieza a usar sin reiniciar el worker
+    - Las consultas simultáneas de un buzon que no está en cache esperan una
+      sola carga (single-flight) en vez de consultar Supabase cada una
+    - invalidate() descarta una entrada, por ejemplo tras un error de
+      autenticación con el token en cache
+    - Con `shared`, una entrada que falta en memoria se busca primero en
+      Redis (cargada por cualquier réplica) y solo después con el loader
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], Awaitable[Optional[Dict]]],
+        ttl_seconds: float = 300.0,
+        shared: Optional[SharedCredentialStore] = None
+    ):
+        """
+        Inicializa el cache.
+
+        Args:
+            loader: Función asíncrona que obtiene las credenciales de un buzon
+                (ej: SupabaseService.get_credentials)
+            ttl_seconds: Vigencia de cada entrada (0 = sin vencimiento)
+            shared: Segundo nivel en Redis compartido entre réplicas (None = solo memoria)
+        """
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self._entries: Dict[str, Tuple[Dict, float]] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+
+        # Cargas hechas con el loader (para métricas y benchmarks)
+        self.loads = 0
+
+    def get(self, buzon_id: str) -> Optional[Dict]:
+        """Credenciales vigentes del buzon en memoria, sin cargarlas (None si no hay)"""
+        entry = self._entries.get(buzon_id)
+        if entry is None:
+            return None
+        credentials, expires_at = entry
+        if expires_at and time.monotonic() >= expires_at:
+            del self._entries[buzon_id]
+            return None
+        return credentials
+
+    def set(self, buzon_id: str, credentials: Dict):
+        """Guarda las credenciales de un buzon con la vigencia del cache"""
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else 0.0
+        self._entries[buzon_id] = (credentials, expires_at)
+
+    __setitem__ = set
+
+    def __contains__(self, buzon_id: str) -> bool:
+        return self.get(buzon_id) is not None
+
+    def invalidate(self, buzon_id: str, credentials: Optional[Dict] = None) -> bool:
+        """
+        Descarta las credenciales en cache de un buzon.
+
+        Args:
+            buzon_id: ID del buzon
+            credentials: Si se indica, solo se descarta si la entrada en cache
+                sigue siendo esa (los envíos fallidos con un token viejo no
+                descartan el token nuevo ya recargado)
+
+        Returns:
+            True si se descartó una entrada
+        """
+        entry = self._entries.get(buzon_id)
+        if entry is None or (credentials is not None and entry[0] is not credentials):
+            return False
+        del self._entries[buzon_id]
+        return True
+
+    def clear(self):
+        """Descarta todas las entradas"""
+        self._entries.clear()
+
+    async def get_or_load(self, buzon_id: str) -> Optional[Dict]:
+        """
+        Credenciales del buzon desde memoria o, si no están vigentes, desde el
+        loader. Las llamadas simultáneas para el mismo buzon comparten la carga.
+
+        Raises:
+            Las excepciones del loader (a todas las llamadas que esperaban la carga)
+        """
+        credentials = self.get(buzon_id)
+        if credentials is not None:
+            return credentials
+
+        future = self._loading.get(buzon_id)
+        if future is None:
+            future = asyncio.ensure_future(self._load(buzon_id))
+            # Evita el aviso de excepción no leída si todos los que esperaban se cancelan
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._loading[buzon_id] = future
+        # Cancelar una espera no cancela la carga compartida
+        return await asyncio.shield(future)
+
+    async def _load(self, buzon_id: str) -> Optional[Dict]:
+        """
+        Carga las credenciales desde Redis (si hay segundo nivel) o con el
+        loader, y las guarda si existen.
+        """
+        try:
+            if self.shared:
+                credentials = await self.shared.get(buzon_id)
+                if credentials:
+                    self.set(buzon_id, credentials)
+                    logger.info(f"Credenciales cacheadas para buzon '{buzon_id}' (desde Redis)")
+                    return credentials
+
+            self.loads += 1
+            credentials = await self.loader(buzon_id)
+            if credentials:
+                self.set(buzon_id, credentials)
+                if self.shared:
+                    await self.shared.set(buzon_id, credentials)
+                logger.info(f"Credenciales cacheadas para buzon '{buzon_id}'")
+            return credentials
+        finally:
+            self._loading.pop(buzon_id, None)
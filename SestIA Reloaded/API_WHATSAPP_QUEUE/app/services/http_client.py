@@ -0,0 +1,261 @@
+"""
+Cliente HTTP de los envíos: pool de conexiones configurable, HTTP/2 opcional,
+conexiones precalentadas y métricas de espera en el pool
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Eventos de httpcore que delimitan la conexión nueva y el envío de la request
+CONNECT_STARTED_EVENTS = {"connection.connect_tcp.started"}
+CONNECT_COMPLETE_EVENTS = {"connection.connect_tcp.complete", "connection.start_tls.complete"}
+SEND_STARTED_EVENTS = {"http11.send_request_headers.started", "http2.send_request_headers.started"}
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Cuerpo de la respuesta que libera la conexión reservada al cerrarse"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class ShardedTransport(httpx.AsyncBaseTransport):
+    """
+    Transporte que reparte las requests entre varios pools de httpcore de
+    `connections_per_pool` conexiones cada uno.
+
+    El pool de httpcore 1.0 recorre todas sus conexiones (y por cada una,
+    otra vez todas) en cada request que entra o sale: con cientos de
+    conexiones en un solo pool el costo de CPU por envío crece de forma
+    cuadrática (benchmarks/bench_http_pool.py). Con pools chicos ese costo
+    queda acotado. Las requests esperan una conexión libre en un semáforo
+    propio (respetando el timeout de pool), no en la cola interna de httpcore.
+    """
+
+    def __init__(
+        self,
+        max_connections: int,
+        connections_per_pool: int = 10,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False
+    ):
+        # Con HTTP/2 un solo pool: los envíos se multiplexan en pocas conexiones
+        pools = 1 if http2 else max(1, math.ceil(max_connections / max(1, connections_per_pool)))
+        keepalive = max_keepalive_connections if max_keepalive_connections is not None else max_connections
+        limits = httpx.Limits(
+            max_connections=math.ceil(max_connections / pools),
+            max_keepalive_connections=math.ceil(keepalive / pools),
+            keepalive_expiry=keepalive_expiry
+        )
+        self._pools = [httpx.AsyncHTTPTransport(limits=limits, http2=http2) for _ in range(pools)]
+        self._in_flight = [0] * pools
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        pool_timeout = request.extensions.get("timeout", {}).get("pool")
+        try:
+            await asyncio.wait_for(self._slots.acquire(), pool_timeout)
+        except asyncio.TimeoutError:
+            raise httpx.PoolTimeout("Sin conexiones libres en el pool HTTP", request=request)
+
+        # El pool con menos requests en vuelo
+        index = min(range(len(self._pools)), key=self._in_flight.__getitem__)
+        self._in_flight[index] += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self._in_flight[index] -= 1
+                self._slots.release()
+
+        try:
+            response = await self._pools[index].handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        response.stream = _ReleasingStream(response.stream, release)
+        return response
+
+    async def aclose(self):
+        for pool in self._pools:
+            await pool.aclose()
+
+
+def create_http_client(
+    max_connections: int = 100,
+    max_keepalive_connections: Optional[int] = None,
+    keepalive_expiry: float = 30.0,
+    connect_timeout: float = 5.0,
+    read_timeout: float = 30.0,
+    pool_timeout: float = 30.0,
+    http2: bool = False,
+    connections_per_pool: int = 10
+) -> httpx.AsyncClient:
+    """
+    Crea el cliente HTTP asíncrono de los envíos.
+
+    Args:
+        max_connections: Conexiones simultáneas máximas (debe cubrir los envíos en vuelo)
+        max_keepalive_connections: Conexiones inactivas que se mantienen abiertas
+            (None = igual a max_connections)
+        keepalive_expiry: Segundos que una conexión inactiva sigue abierta
+        connect_timeout: Tiempo máximo para abrir una conexión (TCP + TLS)
+        read_timeout: Tiempo máximo esperando la respuesta
+        pool_timeout: Tiempo máximo esperando una conexión libre del pool
+        http2: Multiplexar los envíos en HTTP/2 (solo con https, si el servidor lo negocia)
+        connections_per_pool: Conexiones por pool interno (ver ShardedTransport)
+    """
+    transport = ShardedTransport(
+        max_connections=max_connections,
+        connections_per_pool=connections_per_pool,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+        http2=http2
+    )
+    timeout = httpx.Timeout(
+        connect=connect_timeout,
+        read=read_timeout,
+        write=read_timeout,
+        pool=pool_timeout
+    )
+    return httpx.AsyncClient(transport=transport, timeout=timeout)
+
+
+async def warm_up(client: httpx.AsyncClient, url: str, connections: int) -> int:
+    """
+    Abre conexiones con el servidor antes del primer envío (TCP + TLS), con
+    requests HEAD simultáneas al origen de `url`. Cualquier respuesta HTTP
+    deja la conexión en el pool; los errores solo se registran.
+
+    Returns:
+        Número de requests de calentamiento que obtuvieron respuesta
+    """
+    if connections <= 0:
+        return 0
+    parts = urlsplit(url)
+    origin = f"{parts.scheme}://{parts.netloc}/"
+
+    async def head() -> Optional[str]:
+        try:
+            await client.head(origin)
+            return None
+        except httpx.HTTPError as e:
+            return type(e).__name__
+
+    started = time.monotonic()
+    errors = [error for error in await asyncio.gather(*(head() for _ in range(connections))) if error]
+    opened = connections - len(errors)
+    logger.info(
+        f"Conexiones precalentadas con {origin}: {opened}/{connections} "
+        f"({(time.monotonic() - started) * 1000:.0f} ms)"
+    )
+    if errors:
+        logger.warning(f"No se pudieron precalentar {len(errors)} conexiones con {origin}: {', '.join(sorted(set(errors)))}")
+    return opened
+
+
+class RequestTrace:
+    """
+    Tiempos de una request, a partir de los eventos de trace de httpcore
+    (extensions={"trace": ...}).
+    """
+
+    __slots__ = ("started", "connect_started", "connect_completed", "sent")
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.connect_started: Optional[float] = None
+        self.connect_completed: Optional[float] = None
+        self.sent: Optional[float] = None
+
+    async def __call__(self, event_name: str, info: Dict):
+        if event_name in SEND_STARTED_EVENTS:
+            self.sent = time.monotonic()
+        elif event_name in CONNECT_STARTED_EVENTS:
+            self.connect_started = time.monotonic()
+        elif event_name in CONNECT_COMPLETE_EVENTS:
+            self.connect_completed = time.monotonic()
+
+    @property
+    def new_connection(self) -> bool:
+        return self.connect_started is not None
+
+
+class HttpPoolStats:
+    """
+    Métricas de las últimas `window` requests del cliente HTTP, para separar
+    la latencia propia (espera de una conexión libre en el pool y apertura de
+    conexiones) de la del servidor.
+
+    - espera_pool: desde que se pide la conexión hasta enviar la request,
+      sin contar la apertura de una conexión nueva
+    - conexion: apertura de conexión nueva (TCP + TLS)
+    - servidor: desde enviar la request hasta tener la respuesta
+    """
+
+    def __init__(self, window: int = 1000):
+        self._samples: Deque[Tuple[float, float, float]] = deque(maxlen=window)
+        self.requests = 0
+        self.new_connections = 0
+
+    def trace(self) -> RequestTrace:
+        """Trace para una request (se pasa en extensions={"trace": ...})"""
+        return RequestTrace()
+
+    def record(self, trace: RequestTrace):
+        """Registra los tiempos de una request ya respondida"""
+        if trace.sent is None:
+            return
+        finished = time.monotonic()
+        connect = 0.0
+        if trace.new_connection:
+            self.new_connections += 1
+            connect = (trace.connect_completed or trace.sent) - trace.connect_started
+        pool_wait = max(0.0, trace.sent - trace.started - connect)
+        self.requests += 1
+        self._samples.append((pool_wait, connect, finished - trace.sent))
+
+    @staticmethod
+    def _summary(values: List[float]) -> Dict[str, float]:
+        if not values:
+            return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+        values = sorted(values)
+        return {
+            "p50": round(values[len(values) // 2] * 1000, 2),
+            "p95": round(values[min(len(values) - 1, int(0.95 * len(values)))] * 1000, 2),
+            "max": round(values[-1] * 1000, 2)
+        }
+
+    def get_stats(self) -> Dict:
+        """Resumen en ms de las últimas requests"""
+        pool_waits, connects, server = zip(*self._samples) if self._samples else ((), (), ())
+        return {
+            "solicitudes": self.requests,
+            "conexiones_nuevas": self.new_connections,
+            "muestras": len(self._samples),
+            "espera_pool_ms": self._summary(list(pool_waits)),
+            "conexion_ms": self._summary([c for c in connects if c > 0]),
+            "servidor_ms": self._summary(list(server))
+        }
@@ -0,0 +1,156 @@
+"""
+Servicio para enviar mensajes directo a la Graph API de Meta (WhatsApp Cloud
+API), sin pasar por el middleware
+"""
+import logging
+from typing import Dict, Optional, Tuple
+
+import httpx
+import orjson
+
+from app.services.whatsapp_service import JSON_HEADERS, PAYLOAD_PREFIX_CACHE_SIZE, WhatsAppService
+
+logger = logging.getLogger(__name__)
+
+GRAPH_API_URL = "https://graph.facebook.com"
+
+# Errores de Meta que llegan como HTTP 400 pero son límites de envío
+# (throttling de la app, del número o por destinatario): se tratan como 429
+GRAPH_RATE_LIMIT_ERROR_CODES = {4, 80007, 130429, 131048, 131056}
+
+# Errores temporales de Meta: se tratan como 503
+GRAPH_TRANSIENT_ERROR_CODES = {1, 2, 131000}
+
+# Token inválido o vencido (401) y permisos insuficientes (403)
+GRAPH_AUTH_ERROR_CODES = {190: 401, 10: 403, 200: 403}
+
+
+class MetaGraphService(WhatsAppService):
+    """
+    Envía plantillas directo a POST /{version}/{phone_id}/messages de la Graph
+    API con el token del buzon, construyendo el mismo mensaje que arma el
+    middleware (variables del cuerpo y cabecera con imagen).
+
+    Mismo contrato que WhatsAppService (circuitos, pool HTTP, resultado de
+    send_message). Los códigos de error de Meta se traducen al status HTTP
+    que usan el worker y los circuitos: límites de envío → 429, errores
+    temporales → 503, token inválido → 401, sin permisos → 403.
+    """
+
+    def __init__(self, graph_url: str = GRAPH_API_URL, api_version: str = "v21.0", **options):
+        """
+        Inicializa el servicio.
+
+        Args:
+            graph_url: URL base de la Graph API
+            api_version: Versión de la Graph API (ej: v21.0)
+            **options: Circuitos y opciones del cliente HTTP (ver WhatsAppService)
+        """
+        super().__init__(api_url=graph_url, **options)
+        self.api_version = api_version
+        self._targets: Dict[Tuple[str, str], Tuple[httpx.URL, Dict[str, str]]] = {}
+
+    def _target(self, credentials: Dict[str, str]) -> Tuple[httpx.URL, Dict[str, str]]:
+        """URL de mensajes del phone_id (ya parseada) y headers con su token, armados una vez"""
+        key = (credentials["phone_id"], credentials["token"])
+        target = self._targets.get(key)
+        if target is None:
+            if len(self._targets) >= PAYLOAD_PREFIX_CACHE_SIZE:
+                self._targets.clear()
+            target = self._targets[key] = (
+                httpx.URL(f"{self.api_url}/{self.api_version}/{key[0]}/messages"),
+                {**JSON_HEADERS, "Authorization": f"Bearer {key[1]}"}
+            )
+        return target
+
+    def _compile_payload_prefix(self, token: str, phone_id: str, plantilla: str, idioma: str) -> bytes:
+        """JSON del mensaje de plantilla hasta el idioma, sin cerrar el template ni el mensaje"""
+        return orjson.dumps({
+            "messaging_product": "whatsapp",
+            "recipient_type": "individual",
+            "type": "template",
+            "template": {"name": plantilla, "language": {"code": idioma}}
+        })[:-2]
+
+    def _build_body(self, credentials: Dict[str, str], message_data: Dict) -> bytes:
+        """Mensaje de plantilla en el formato de la Cloud API: prefijo precompilado + componentes y destinatario"""
+        parts = [self._payload_prefix(credentials, message_data)]
+        components = []
+
+        url_imagen = message_data.get("url_imagen")
+        if url_imagen and str(url_imagen).strip():
+            components.append({
+                "type": "header",
+                "parameters": [{"type": "image", "image": {"link": str(url_imagen).strip()}}]
+            })
+
+        variables = self._extract_variables(message_data)
+        if variables:
+            components.append({
+                "type": "body",
+                "parameters": [{"type": "text", "text": variable} for variable in variables]
+            })
+
+        if components:
+            parts += (b',"components":', orjson.dumps(components))
+
+        parts += (b'},"to":', orjson.dumps(message_data["numero"]), b"}")
+        return b"".join(parts)
+
+    @staticmethod
+    def _status_for_error(status_code: int, error_code: Optional[int]) -> int:
+        """Status HTTP equivalente a un error de Meta (ver GRAPH_*_ERROR_CODES)"""
+        if error_code in GRAPH_RATE_LIMIT_ERROR_CODES:
+            return 429
+        if error_code in GRAPH_TRANSIENT_ERROR_CODES:
+            return 503
+        return GRAPH_AUTH_ERROR_CODES.get(error_code, status_code)
+
+    async def _request(
+        self,
+        credentials: Dict[str, str],
+        message_data: Dict
+    ) -> Dict:
+        """POST a la Graph API y clasificación de su respuesta"""
+        url, headers = self._target(credentials)
+        body = self._build_body(credentials, message_data)
+        logger.debug(f"Enviando mensaje a {message_data['numero']} con plantilla {message_data['plantilla']} (Graph API)")
+
+        trace = self.http_stats.trace()
+        response = await self.client.post(
+            url,
+            content=body,
+            headers=headers,
+            extensions={"trace": trace}
+        )
+        self.http_stats.record(trace)
+
+        if response.status_code == 200:
+            messages = orjson.loads(response.content).get("messages") or [{}]
+            wamid = messages[0].get("id", "")
+            logger.info(f"Mensaje enviado exitosamente a {message_data['numero']}: {wamid}")
+            return {
+                "success": True,
+                "wamid": wamid,
+                "error": None,
+                "status_code": response.status_code,
+                "retryable": False
+            }
+
+        try:
+            error = orjson.loads(response.content).get("error") or {}
+            error_code = error.get("code")
+            error_msg = f"Meta {error_code}: {error.get('message', f'HTTP {response.status_code}')}"
+        except ValueError:
+            error_code = None
+            error_msg = response.text[:200] or f"HTTP {response.status_code}"
+
+        status_code = self._status_for_error(response.status_code, error_code)
+        logger.warning(f"Error al enviar mensaje a {message_data['numero']}: {error_msg}")
+        return {
+            "success": False,
+            "wamid": None,
+            "error": error_msg,
+            "status_code": status_code,
+            "retryable": self.is_retryable_status(status_code)
+        }
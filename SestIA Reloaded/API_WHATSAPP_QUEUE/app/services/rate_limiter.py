@@ -0,0 +1,103 @@
+"""
+Limitador de ritmo de envío por número emisor (phone_id)
+"""
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from app.services.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Token bucket por phone_id guardado en Redis, compartido por todas las
+    réplicas. Meta limita el throughput por número emisor, así que el límite
+    se aplica por phone_id y no por campaña.
+
+    Los envíos no fallan al agotarse el bucket: cada envío reserva su token
+    y espera su turno. Los envíos prioritarios descuentan su token pero no
+    esperan detrás de las reservas de las campañas masivas.
+
+    Los overrides son por buzon, pero el bucket es por phone_id: si varios
+    buzones comparten phone_id con rates distintos, se aplica el menor de
+    los que enviaron en los últimos `rate_hold_seconds` segundos.
+    """
+
+    def __init__(
+        self,
+        redis: RedisService,
+        default_rate: float = 80.0,
+        default_burst: float = 0,
+        buzon_rates: Optional[Dict[str, float]] = None,
+        rate_hold_seconds: float = 60.0
+    ):
+        """
+        Inicializa el limitador.
+
+        Args:
+            redis: Servicio de Redis
+            default_rate: Mensajes por segundo por phone_id (0 = sin límite)
+            default_burst: Ráfaga máxima con default_rate (0 = igual a un
+                segundo de rate); los buzones con override la escalan a su rate
+            buzon_rates: Mensajes por segundo por buzon (sobrescribe default_rate)
+            rate_hold_seconds: Tiempo que un phone_id compartido sigue con el
+                menor rate después del último envío del buzon que lo pidió
+        """
+        self.redis = redis
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.buzon_rates = {str(buzon): rate for buzon, rate in (buzon_rates or {}).items()}
+        self.rate_hold_seconds = rate_hold_seconds
+
+    def get_rate(self, buzon: Optional[str] = None) -> float:
+        """Mensajes por segundo aplicables a un buzon (default si no tiene override)"""
+        if buzon is not None and str(buzon) in self.buzon_rates:
+            return self.buzon_rates[str(buzon)]
+        return self.default_rate
+
+    def get_burst(self, rate: float) -> float:
+        """
+        Ráfaga máxima para un rate: `default_burst` en proporción al rate
+        (así un buzon con override bajo no hereda la ráfaga global) o un
+        segundo de rate si no se configuró.
+        """
+        if not self.default_burst or self.default_rate <= 0:
+            return rate
+        return max(1.0, self.default_burst * rate / self.default_rate)
+
+    async def acquire(
+        self,
+        phone_id: str,
+        buzon: Optional[str] = None,
+        priority: bool = False
+    ) -> float:
+        """
+        Espera hasta que el phone_id tenga turno para enviar.
+
+        Si Redis falla se envía sin limitar (se registra el error) para no
+        frenar las campañas por un problema del limitador.
+
+        Args:
+            phone_id: Número emisor de WhatsApp
+            buzon: Buzon del mensaje (para overrides de rate)
+            priority: Envío del carril prioritario
+
+        Returns:
+            Segundos esperados
+        """
+        rate = self.get_rate(buzon)
+        if rate <= 0 or not phone_id:
+            return 0.0
+
+        burst = self.get_burst(rate)
+        try:
+            wait = await self.redis.reserve_send_token(phone_id, rate, burst, priority, self.rate_hold_seconds)
+        except Exception as e:
+            logger.error(f"Error en rate limit de phone_id '{phone_id}', se envía sin limitar: {str(e)}")
+            return 0.0
+
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
@@ -0,0 +1,450 @@
+"""
+Scripts Lua y claves compartidas del servicio de Redis.
+
+Cada script se ejecuta de forma atómica en Redis y resuelve en un solo round
+trip operaciones que de otro modo requerirían varios comandos.
+
+Todas las claves que toca un script llegan en KEYS y los canales y el grupo
+de consumidores en ARGV (ningún nombre se arma dentro de Lua). Aun así se asume un Redis de un solo
+nodo: los scripts que recorren varias campañas reciben claves de distintas
+campañas, que en Redis Cluster caerían en slots distintos.
+"""
+
+# Registro de campañas activas (sorted set: campaign_id -> timestamp de alta)
+ACTIVE_CAMPAIGNS_KEY = "campaigns:active"
+
+# Registro de campañas prioritarias (mensajes individuales/transaccionales),
+# mismo formato; el worker las atiende antes que las masivas
+PRIORITY_CAMPAIGNS_KEY = "campaigns:priority"
+
+# Quita la campaña del registro solo si su cola sigue vacía y no tiene
+# mensajes en vuelo ni reintentos programados (evita perder mensajes
+# encolados entre el último LPOP y la baja, leases que el reaper todavía debe
+# devolver o reintentos que aún no vencen) y aplica el TTL de campañas
+# completadas a stats y metadata
+# KEYS: cola, registro, stats, metadata, leases en vuelo, reintentos
+DEACTIVATE_CAMPAIGN_SCRIPT = """
+if redis.call('LLEN', KEYS[1]) > 0 or redis.call('ZCARD', KEYS[5]) > 0
+    or redis.call('ZCARD', KEYS[6]) > 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+local ttl = tonumber(ARGV[2])
+if ttl > 0 then
+    redis.call('EXPIRE', KEYS[3], ttl)
+    redis.call('EXPIRE', KEYS[4], ttl)
+end
+return 1
+"""
+
+# Canal pub/sub donde se avisa cada campaña encolada (el mensaje es la clave
+# del registro donde quedó). Los workers inactivos esperan en este canal en
+# vez de consultar Redis periódicamente. Los scripts de commit y de reintentos
+# lo reciben en ARGV.
+ENQUEUE_CHANNEL = "campaigns:enqueued"
+
+# Credenciales cifradas por buzon compartidas entre réplicas, y canal donde
+# se avisa cada buzon invalidado (el mensaje es el buzon)
+CREDENTIALS_KEY_PREFIX = "credentials:"
+CREDENTIALS_INVALIDATED_CHANNEL = "credentials:invalidated"
+
+# Estado de los circuitos publicado por cada worker (hash: consumidor -> JSON
+# con "ts" epoch y "circuitos"), para la API sin worker embebido
+CIRCUITS_STATUS_KEY = "circuits:status"
+
+# Resultado de cada envío (stream, un campo "r" con el JSON) pendiente de
+# guardarse en Supabase, y grupo de consumidores de los flushers de resultados
+RESULTS_STREAM_KEY = "results:stream"
+RESULTS_GROUP = "results-flusher"
+
+# TTL de las listas temporales de carga (una carga abortada se limpia sola)
+STAGING_TTL = 3600
+
+# Inicio común de los scripts de commit (listas y streams), antes de escribir
+# nada. Con la marca de commit ya puesta (reintento de un commit aplicado)
+# retorna el total sin volver a escribir. Si la campaña está activa (en
+# cualquier registro), sus campos de campaña (plantilla, buzon, idioma: los
+# que completan las filas compactas ya encoladas) no cambian: un encolado con
+# otros valores falla (ARGV[6] = 'reject') o, si sus mensajes traen sus
+# propios campos (formato completo, ARGV[6] = 'keep'), conserva los guardados.
+_COMMIT_PREAMBLE = """
+local total = tonumber(ARGV[2])
+local campaign_end = 8 + tonumber(ARGV[7]) * 2
+local first_message = campaign_end + 1 + tonumber(ARGV[8]) * 2
+
+if redis.call('EXISTS', KEYS[7]) == 1 then
+    return total
+end
+local keep_fields = false
+if redis.call('ZSCORE', KEYS[5], ARGV[1]) or redis.call('ZSCORE', KEYS[6], ARGV[1]) then
+    for i = 9, campaign_end, 2 do
+        local stored = redis.call('HGET', KEYS[3], ARGV[i])
+        if stored and stored ~= ARGV[i + 1] then
+            if ARGV[6] ~= 'keep' then
+                return redis.error_reply('CAMPAIGN_FIELDS_CONFLICT ' .. ARGV[i])
+            end
+            keep_fields = true
+        end
+    end
+end
+"""
+
+# Parte común de los scripts de commit (listas y streams): metadata, stats y
+# registro de activas (KEYS[5]). Una campaña que ya está en el otro registro
+# (KEYS[6]) se queda ahí: así un ID compartido no la cambia de carril.
+# Avisa en ENQUEUE_CHANNEL para despertar a los workers inactivos y deja la
+# marca de commit (KEYS[7]) para que repetir el script no cuente dos veces.
+# Espera las variables de _COMMIT_PREAMBLE.
+_COMMIT_METADATA_AND_STATS = """
+for i = 9, campaign_end, 2 do
+    redis.call(keep_fields and 'HSETNX' or 'HSET', KEYS[3], ARGV[i], ARGV[i + 1])
+end
+for i = campaign_end + 1, first_message - 1, 2 do
+    redis.call('HSET', KEYS[3], ARGV[i], ARGV[i + 1])
+end
+
+redis.call('HINCRBY', KEYS[4], 'total', total)
+redis.call('HSETNX', KEYS[4], 'enviados', 0)
+redis.call('HSETNX', KEYS[4], 'fallidos', 0)
+redis.call('HSETNX', KEYS[4], 'created_at', ARGV[4])
+redis.call('HSETNX', KEYS[4], 'ultimo_envio', '')
+
+if total > 0 then
+    local registry = KEYS[5]
+    if redis.call('ZSCORE', KEYS[6], ARGV[1]) then
+        registry = KEYS[6]
+    else
+        redis.call('ZADD', KEYS[5], 'NX', ARGV[3], ARGV[1])
+    end
+    redis.call('PERSIST', KEYS[3])
+    redis.call('PERSIST', KEYS[4])
+    redis.call('PUBLISH', ARGV[5], registry)
+end
+redis.call('SET', KEYS[7], total, 'EX', """ + str(STAGING_TTL) + """)
+return total
+"""
+
+# Publica una campaña de forma atómica: mueve los mensajes (inline o, si la
+# cola no existe, renombrando la lista temporal) a la cola y escribe metadata,
+# stats y registro de activas. Si la cola ya existe y la lista temporal
+# todavía tiene mensajes no escribe nada y retorna -1: el llamador los mueve
+# por bloques con MOVE_STAGED_SCRIPT y repite el commit (así una carga grande
+# sobre una campaña en curso no bloquea Redis copiándola entera).
+# KEYS: cola, lista temporal, metadata, stats, registro, registro del otro
+#       carril, marca de commit
+# ARGV: campaign_id, total, timestamp, fecha ISO, canal de aviso, ante campos
+#       de campaña distintos ('reject'/'keep'), n pares de campos de campaña,
+#       n pares de otra metadata, pares campo/valor (primero los de campaña),
+#       mensajes inline (opcional)
+COMMIT_CAMPAIGN_SCRIPT = _COMMIT_PREAMBLE + """
+if #ARGV >= first_message then
+    for i = first_message, #ARGV, 1000 do
+        redis.call('RPUSH', KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+    end
+elseif redis.call('EXISTS', KEYS[2]) == 1 then
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        return -1
+    end
+    redis.call('RENAME', KEYS[2], KEYS[1])
+    redis.call('PERSIST', KEYS[1])
+end
+""" + _COMMIT_METADATA_AND_STATS
+
+# Mueve un bloque de la lista temporal al final de la cola (cada bloque es
+# atómico: un corte a mitad de la carga no duplica ni pierde mensajes).
+# KEYS: lista temporal, cola
+# ARGV: tamaño del bloque
+# Retorna los mensajes que quedan en la lista temporal
+MOVE_STAGED_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('RPUSH', KEYS[2], unpack(items))
+    redis.call('LTRIM', KEYS[1], #items, -1)
+end
+return redis.call('LLEN', KEYS[1])
+"""
+
+# Extrae hasta N mensajes y los deja "en vuelo" con un lease: el mensaje se
+# guarda en el hash de leases y su vencimiento (ms, reloj de Redis) en un
+# sorted set. Si el worker muere antes del ack, el reaper lo devuelve a la cola.
+# KEYS: cola, hash de leases, sorted set de vencimientos
+# ARGV: cantidad, duración del lease (ms), prefijo del lease (consumidor)
+# Retorna [lease_id, mensaje, ...]
+LEASE_MESSAGES_SCRIPT = """
+local items = redis.call('LPOP', KEYS[1], ARGV[1])
+if not items then
+    return {}
+end
+local now = redis.call('TIME')
+local deadline = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000) + tonumber(ARGV[2])
+local result = {}
+for i, raw in ipairs(items) do
+    local lease_id = ARGV[3] .. ':' .. i
+    redis.call('HSET', KEYS[2], lease_id, raw)
+    redis.call('ZADD', KEYS[3], deadline, lease_id)
+    result[#result + 1] = lease_id
+    result[#result + 1] = raw
+end
+return result
+"""
+
+# Renueva los leases de mensajes que el worker todavía tiene (en su cola local
+# o enviándose): mueve el vencimiento a ahora + duración del lease. Un lease
+# que ya no está en vuelo (el reaper lo devolvió a la cola) se informa como
+# perdido.
+# KEYS: sorted set de vencimientos
+# ARGV: duración del lease (ms), lease_id...
+# Retorna los lease_id perdidos
+RENEW_LEASES_SCRIPT = """
+local now = redis.call('TIME')
+local deadline = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000) + tonumber(ARGV[1])
+local lost = {}
+for i = 2, #ARGV do
+    if redis.call('ZSCORE', KEYS[1], ARGV[i]) then
+        redis.call('ZADD', KEYS[1], 'XX', deadline, ARGV[i])
+    else
+        lost[#lost + 1] = ARGV[i]
+    end
+end
+return lost
+"""
+
+# Devuelve al inicio de su cola los reintentos vencidos (sorted set
+# campaign:{id}:retry, score = vencimiento en ms) de las campañas de un
+# registro y avisa en ENQUEUE_CHANNEL si devolvió alguno.
+# KEYS: por campaña, reintentos y cola
+# ARGV: máximo de reintentos a devolver por campaña, canal de aviso, registro
+# Retorna {devueltos, ms hasta el próximo reintento (-1 si no hay)}
+PROMOTE_RETRIES_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local promoted = 0
+local next_due = -1
+for k = 1, #KEYS, 2 do
+    local retry_key = KEYS[k]
+    local due = redis.call('ZRANGEBYSCORE', retry_key, '-inf', now_ms, 'LIMIT', 0, ARGV[1])
+    for i = #due, 1, -1 do
+        redis.call('LPUSH', KEYS[k + 1], due[i])
+        redis.call('ZREM', retry_key, due[i])
+    end
+    promoted = promoted + #due
+    local first = redis.call('ZRANGE', retry_key, 0, 0, 'WITHSCORES')
+    if first[2] then
+        local wait = math.max(0, tonumber(first[2]) - now_ms)
+        if next_due < 0 or wait < next_due then
+            next_due = wait
+        end
+    end
+end
+if promoted > 0 then
+    redis.call('PUBLISH', ARGV[2], ARGV[3])
+end
+return {promoted, next_due}
+"""
+
+# Devuelve al inicio de su cola los mensajes con lease vencido de las
+# campañas de un registro.
+# KEYS: por campaña, cola, hash de leases y sorted set de vencimientos
+# ARGV: máximo de leases a devolver por campaña
+# Retorna el total de mensajes devueltos
+REQUEUE_EXPIRED_LEASES_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local requeued = 0
+for k = 1, #KEYS, 3 do
+    local queue_key, leases_key, inflight_key = KEYS[k], KEYS[k + 1], KEYS[k + 2]
+    local expired = redis.call('ZRANGEBYSCORE', inflight_key, '-inf', now_ms, 'LIMIT', 0, ARGV[1])
+    for i = #expired, 1, -1 do
+        local raw = redis.call('HGET', leases_key, expired[i])
+        if raw then
+            redis.call('LPUSH', queue_key, raw)
+            requeued = requeued + 1
+        end
+        redis.call('HDEL', leases_key, expired[i])
+        redis.call('ZREM', inflight_key, expired[i])
+    end
+end
+return requeued
+"""
+
+# Token bucket compartido por todas las réplicas (una clave por phone_id).
+# Reserva siempre un token: si el bucket está vacío queda en negativo y el
+# llamador debe esperar su turno, así los envíos se ordenan sin reintentos.
+# Un envío prioritario también descuenta su token (las reservas siguientes se
+# corren) pero no espera detrás de las reservas ya hechas por envíos masivos.
+# Varios buzones pueden compartir phone_id con rates distintos: el bucket usa
+# el menor rate (con su ráfaga) de los buzones que enviaron en los últimos
+# ARGV[4] ms, así el límite no depende de qué buzon envió último.
+# KEYS: bucket (hash tokens/ts/rate/burst/hold)
+# ARGV: tokens por segundo, capacidad (ráfaga), prioritario (1/0), vigencia del
+#       menor rate (ms)
+# Retorna los ms que el llamador debe esperar antes de enviar (0 = ya)
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate', 'burst', 'hold')
+local held_rate = tonumber(state[3])
+if held_rate and held_rate < rate and tonumber(state[5]) > now_ms then
+    rate = held_rate
+    burst = tonumber(state[4])
+else
+    redis.call('HSET', KEYS[1], 'rate', ARGV[1], 'burst', ARGV[2], 'hold', now_ms + tonumber(ARGV[4]))
+end
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now_ms
+tokens = math.min(burst, tokens + (now_ms - ts) * rate / 1000) - 1
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now_ms)
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) * 1000 / rate) + 1000)
+if tokens >= 0 or ARGV[3] == '1' then
+    return 0
+end
+return math.ceil(-tokens * 1000 / rate)
+"""
+
+# ---------------------------------------------------------------------------
+# Backend de Redis Streams (RedisStreamService)
+# Cola: stream campaign:{id}:stream con el grupo de consumidores STREAM_GROUP.
+# Cada entrada tiene un único campo "m" con el mensaje serializado.
+# ---------------------------------------------------------------------------
+
+STREAM_GROUP = "workers"
+
+# Baja de la campaña si el stream quedó vacío (las entradas se borran al ack)
+# y no tiene reintentos programados. Se borra el stream para liberar el grupo
+# y sus consumidores.
+# KEYS: stream, registro, stats, metadata, (sin uso), reintentos
+STREAM_DEACTIVATE_CAMPAIGN_SCRIPT = """
+if redis.call('XLEN', KEYS[1]) > 0 or redis.call('ZCARD', KEYS[6]) > 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('DEL', KEYS[1])
+local ttl = tonumber(ARGV[2])
+if ttl > 0 then
+    redis.call('EXPIRE', KEYS[3], ttl)
+    redis.call('EXPIRE', KEYS[4], ttl)
+end
+return 1
+"""
+
+# Mismo contrato que COMMIT_CAMPAIGN_SCRIPT, con XADD sobre el stream.
+# El grupo de consumidores debe existir (en el stream destino para mensajes
+# inline, o en el stream temporal, que se renombra con su grupo).
+STREAM_COMMIT_CAMPAIGN_SCRIPT = _COMMIT_PREAMBLE + """
+if #ARGV >= first_message then
+    for i = first_message, #ARGV do
+        redis.call('XADD', KEYS[1], '*', 'm', ARGV[i])
+    end
+elseif redis.call('XLEN', KEYS[2]) > 0 then
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        return -1
+    end
+    redis.call('RENAME', KEYS[2], KEYS[1])
+    redis.call('PERSIST', KEYS[1])
+end
+""" + _COMMIT_METADATA_AND_STATS
+
+# Igual que MOVE_STAGED_SCRIPT, con XADD al final del stream destino
+STREAM_MOVE_STAGED_SCRIPT = """
+local entries = redis.call('XRANGE', KEYS[1], '-', '+', 'COUNT', ARGV[1])
+for _, entry in ipairs(entries) do
+    redis.call('XADD', KEYS[2], '*', 'm', entry[2][2])
+    redis.call('XDEL', KEYS[1], entry[1])
+end
+return redis.call('XLEN', KEYS[1])
+"""
+
+# Lectura de un lote para un consumidor: primero reclama (XAUTOCLAIM) entradas
+# de otros consumidores cuyo lease venció (inactivas más de ARGV[2] ms), luego
+# completa con entradas nuevas (XREADGROUP COUNT).
+# KEYS: stream
+# ARGV: cantidad, duración del lease (ms), consumidor, grupo (STREAM_GROUP)
+# Retorna [entry_id, mensaje, ...]
+STREAM_LEASE_MESSAGES_SCRIPT = """
+local count = tonumber(ARGV[1])
+local result = {}
+local claimed = redis.call('XAUTOCLAIM', KEYS[1], ARGV[4], ARGV[3], ARGV[2], '0-0', 'COUNT', count)
+for _, entry in ipairs(claimed[2]) do
+    if entry and entry[2] then
+        result[#result + 1] = entry[1]
+        result[#result + 1] = entry[2][2]
+    end
+end
+local missing = count - #result / 2
+if missing > 0 then
+    local read = redis.call('XREADGROUP', 'GROUP', ARGV[4], ARGV[3], 'COUNT', missing, 'STREAMS', KEYS[1], '>')
+    if read and read[1] then
+        for _, entry in ipairs(read[1][2]) do
+            result[#result + 1] = entry[1]
+            result[#result + 1] = entry[2][2]
+        end
+    end
+end
+return result
+"""
+
+# Renueva entradas pendientes del consumidor: XCLAIM JUSTID (sin contar otra
+# entrega) reinicia su tiempo inactivo, así XAUTOCLAIM no las reclama. Una
+# entrada que ya es de otro consumidor (o ya no está pendiente) se informa
+# como perdida.
+# KEYS: stream
+# ARGV: grupo (STREAM_GROUP), consumidor, entry_id...
+# Retorna los entry_id perdidos
+STREAM_RENEW_LEASES_SCRIPT = """
+local lost = {}
+for i = 3, #ARGV do
+    local pending = redis.call('XPENDING', KEYS[1], ARGV[1], ARGV[i], ARGV[i], 1)
+    if pending[1] and pending[1][2] == ARGV[2] then
+        redis.call('XCLAIM', KEYS[1], ARGV[1], ARGV[2], 0, ARGV[i], 'JUSTID')
+    else
+        lost[#lost + 1] = ARGV[i]
+    end
+end
+return lost
+"""
+
+# Conteos de un stream para el reparto: largo (en cola + en vuelo), entradas
+# en vuelo (pendientes del grupo) y cuántas de ellas tienen el lease vencido
+# (inactivas más de ARGV[2] ms, hasta ARGV[3]): esas se vuelven a leer con
+# XAUTOCLAIM en el próximo lease, así que cuentan como desencolables.
+# KEYS: stream
+# ARGV: grupo (STREAM_GROUP), duración del lease (ms), máximo de vencidas a contar
+# Retorna {largo, en vuelo, vencidas}
+STREAM_QUEUE_COUNTS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {0, 0, 0}
+end
+local in_flight = redis.call('XPENDING', KEYS[1], ARGV[1])[1]
+local expired = redis.call('XPENDING', KEYS[1], ARGV[1], 'IDLE', ARGV[2], '-', '+', ARGV[3])
+return {redis.call('XLEN', KEYS[1]), in_flight, #expired}
+"""
+
+# Igual que PROMOTE_RETRIES_SCRIPT, con XADD al final del stream
+STREAM_PROMOTE_RETRIES_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local promoted = 0
+local next_due = -1
+for k = 1, #KEYS, 2 do
+    local retry_key = KEYS[k]
+    local due = redis.call('ZRANGEBYSCORE', retry_key, '-inf', now_ms, 'LIMIT', 0, ARGV[1])
+    for i = 1, #due do
+        redis.call('XADD', KEYS[k + 1], '*', 'm', due[i])
+        redis.call('ZREM', retry_key, due[i])
+    end
+    promoted = promoted + #due
+    local first = redis.call('ZRANGE', retry_key, 0, 0, 'WITHSCORES')
+    if first[2] then
+        local wait = math.max(0, tonumber(first[2]) - now_ms)
+        if next_due < 0 or wait < next_due then
+            next_due = wait
+        end
+    end
+end
+if promoted > 0 then
+    redis.call('PUBLISH', ARGV[2], ARGV[3])
+end
+return {promoted, next_due}
+"""
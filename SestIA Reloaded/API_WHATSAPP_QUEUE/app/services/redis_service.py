@@ -1,30 +1,80 @@
 """
 Servicio para gestionar las colas en Redis
 """
+import asyncio
 import redis.asyncio as redis
+from redis.exceptions import ResponseError
+import itertools
 import json
 import logging
-from typing import List, Dict, Optional
+import uuid
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple, Union, AsyncIterator
 from datetime import datetime
 import fakeredis.aioredis
 
+from app.services.redis_scripts import (
+    ACTIVE_CAMPAIGNS_KEY,
+    PRIORITY_CAMPAIGNS_KEY,
+    ENQUEUE_CHANNEL,
+    CREDENTIALS_KEY_PREFIX,
+    CREDENTIALS_INVALIDATED_CHANNEL,
+    CIRCUITS_STATUS_KEY,
+    RESULTS_STREAM_KEY,
+    RESULTS_GROUP,
+    STAGING_TTL,
+    DEACTIVATE_CAMPAIGN_SCRIPT,
+    COMMIT_CAMPAIGN_SCRIPT,
+    MOVE_STAGED_SCRIPT,
+    LEASE_MESSAGES_SCRIPT,
+    RENEW_LEASES_SCRIPT,
+    REQUEUE_EXPIRED_LEASES_SCRIPT,
+    PROMOTE_RETRIES_SCRIPT,
+    TOKEN_BUCKET_SCRIPT
+)
+
 logger = logging.getLogger(__name__)
 
 
 class RedisService:
-    """Servicio para gestionar colas de campañas en Redis"""
+    """Servicio para gestionar colas de campañas en Redis (backend de listas)"""
+
+    # Tipo de dato Redis de las colas (para la reconstrucción del registro)
+    QUEUE_KEY_TYPE = "list"
 
-    def __init__(self, redis_url: str, campaign_ttl: int = 604800):
+    def __init__(
+        self,
+        redis_url: str,
+        campaign_ttl: int = 604800,
+        enqueue_chunk_size: int = 1000,
+        lease_timeout: float = 120.0,
+        results_max_length: int = 1000000
+    ):
         """
         Inicializa el servicio de Redis.
 
         Args:
             redis_url: URL de conexión a Redis
             campaign_ttl: TTL para campañas completadas (default: 7 días)
+            enqueue_chunk_size: Mensajes por bloque al encolar campañas grandes
+            lease_timeout: Segundos que un mensaje desencolado puede estar en
+                vuelo sin ack antes de volver a la cola
+            results_max_length: Resultados de envío máximos en el stream sin
+                guardar en Supabase (se descartan los más viejos; 0 = sin límite)
         """
         self.redis_url = redis_url
         self.campaign_ttl = campaign_ttl
+        self.enqueue_chunk_size = enqueue_chunk_size
+        self.lease_timeout = lease_timeout
+        self.results_max_length = results_max_length
         self.redis_client: Optional[redis.Redis] = None
+        self._deactivate_campaign_script = None
+        self._commit_campaign_script = None
+        self._move_staged_script = None
+        self._lease_messages_script = None
+        self._renew_leases_script = None
+        self._requeue_expired_leases_script = None
+        self._promote_retries_script = None
+        self._token_bucket_script = None
 
     async def connect(self):
         """Establece conexión con Redis o FakeRedis para pruebas"""
@@ -45,10 +95,43 @@ class RedisService:
                 self.redis_client = fakeredis.aioredis.FakeRedis(decode_responses=True)
                 logger.info("FakeRedis iniciado exitosamente")
 
+        # Registrar scripts Lua (también si el cliente fue inyectado externamente)
+        if self._commit_campaign_script is None:
+            self._register_scripts()
+            await self.rebuild_active_registry()
+
+    def _register_scripts(self):
+        """Registra los scripts Lua del backend de colas"""
+        self._deactivate_campaign_script = self.redis_client.register_script(DEACTIVATE_CAMPAIGN_SCRIPT)
+        self._commit_campaign_script = self.redis_client.register_script(COMMIT_CAMPAIGN_SCRIPT)
+        self._move_staged_script = self.redis_client.register_script(MOVE_STAGED_SCRIPT)
+        self._lease_messages_script = self.redis_client.register_script(LEASE_MESSAGES_SCRIPT)
+        self._renew_leases_script = self.redis_client.register_script(RENEW_LEASES_SCRIPT)
+        self._requeue_expired_leases_script = self.redis_client.register_script(REQUEUE_EXPIRED_LEASES_SCRIPT)
+        self._promote_retries_script = self.redis_client.register_script(PROMOTE_RETRIES_SCRIPT)
+        self._token_bucket_script = self.redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    @staticmethod
+    def _registry_key(priority: bool) -> str:
+        """Clave del registro de campañas (prioritarias o masivas)"""
+        return PRIORITY_CAMPAIGNS_KEY if priority else ACTIVE_CAMPAIGNS_KEY
+
+    def _queue_key(self, campaign_id: str) -> str:
+        """Clave de la cola de mensajes de una campaña"""
+        return f"campaign:{campaign_id}"
+
+    def _retry_key(self, campaign_id: str) -> str:
+        """Clave de los reintentos programados de una campaña (sorted set por vencimiento)"""
+        return f"campaign:{campaign_id}:retry"
+
+    async def _queue_length(self, queue_key: str) -> int:
+        """Longitud de una cola"""
+        return await self.redis_client.llen(queue_key)
+
     async def disconnect(self):
         """Cierra la conexión con Redis"""
         if self.redis_client:
-            await self.redis_client.close()
+            await self.redis_client.aclose()
             logger.info("Desconectado de Redis")
 
     async def ping(self) -> bool:
@@ -63,83 +146,389 @@ class RedisService:
     async def enqueue_campaign(
         self,
         campaign_id: str,
-        messages: List[Dict],
-        metadata: Dict
+        messages: Iterable[Union[Dict, List]],
+        metadata: Dict,
+        priority: bool = False,
+        self_contained: bool = False
     ) -> int:
         """
         Encola mensajes de una campaña en Redis.
 
+        Los mensajes se serializan y envían en bloques de `enqueue_chunk_size`
+        (acepta generadores, sin materializar la campaña completa). Si la
+        campaña cabe en un bloque se escribe todo en un solo script; si no,
+        los bloques se acumulan en una lista temporal mediante pipeline y se
+        publican al final junto con metadata, stats y registro en un script
+        atómico. Si la cola de la campaña ya existe, la lista temporal se
+        mueve antes por bloques (un script por bloque) en vez de copiarse
+        entera dentro del commit. Un fallo a mitad de carga nunca deja stats
+        apuntando a una cola incompleta.
+
+        Mientras la campaña está activa, plantilla, buzon e idioma no cambian
+        (las filas compactas ya encoladas se completan con ellos): un encolado
+        con otros valores se rechaza, salvo que sus mensajes traigan sus
+        propios campos (`self_contained`), en cuyo caso se conservan los
+        guardados.
+
         Args:
             campaign_id: ID único de la campaña
-            messages: Lista de mensajes a encolar
-            metadata: Metadata de la campaña (plantilla, buzon, idioma, etc.)
+            messages: Mensajes a encolar (lista o iterable): filas compactas
+                (ver app.utils.message_codec) o mensajes completos
+            metadata: Metadata de la campaña (plantilla, buzon, idioma, peso opcional)
+            priority: Registrar la campaña como prioritaria (carril de baja latencia)
+            self_contained: Los mensajes están en formato completo y no
+                dependen de los campos de campaña de la metadata
 
         Returns:
             Número de mensajes encolados
+
+        Raises:
+            ValueError: Si la campaña está activa con otra plantilla, buzon o
+                idioma (y los mensajes no son `self_contained`)
         """
+        staging_key = f"staging:{campaign_id}:{uuid.uuid4().hex}"
         try:
-            # Crear claves Redis
-            queue_key = f"campaign:{campaign_id}"
-            stats_key = f"campaign:{campaign_id}:stats"
-            metadata_key = f"campaign:{campaign_id}:metadata"
+            chunks = self._serialize_chunks(messages)
+            first_chunk = next(chunks, [])
+            second_chunk = next(chunks, None)
 
-            # Encolar mensajes (usar RPUSH para agregar al final)
-            if messages:
-                # Serializar mensajes a JSON
-                serialized_messages = [json.dumps(msg) for msg in messages]
-                await self.redis_client.rpush(queue_key, *serialized_messages)
-
-            # Guardar metadata
-            await self.redis_client.hset(
-                metadata_key,
-                mapping={
-                    "plantilla": metadata.get("plantilla", ""),
-                    "buzon": metadata.get("buzon", ""),
-                    "idioma": metadata.get("idioma", "es"),
-                    "created_at": datetime.utcnow().isoformat()
-                }
-            )
+            if second_chunk is None:
+                # Campaña pequeña: mensajes inline en el script de commit
+                total = len(first_chunk)
+                inline_messages = first_chunk
+            else:
+                # Campaña grande: cargar bloques en la lista temporal
+                total = 0
+                inline_messages = []
+                for chunk in itertools.chain([first_chunk, second_chunk], chunks):
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    self._stage_chunk(pipe, staging_key, chunk)
+                    pipe.expire(staging_key, STAGING_TTL)
+                    await pipe.execute()
+                    total += len(chunk)
 
-            # Inicializar stats
-            await self.redis_client.hset(
-                stats_key,
-                mapping={
-                    "total": len(messages),
-                    "enviados": 0,
-                    "fallidos": 0,
-                    "created_at": datetime.utcnow().isoformat(),
-                    "ultimo_envio": ""
-                }
-            )
+            staged = not inline_messages and total > 0
+            if total > 0:
+                await self._before_commit(campaign_id, staging_key, staged=staged)
+            if staged and await self._queue_length(staging_key) != total:
+                raise ResponseError(f"Carga incompleta de la campaña {campaign_id}")
+
+            campaign_fields = {
+                "plantilla": metadata.get("plantilla", ""),
+                "buzon": metadata.get("buzon") or "",
+                "idioma": metadata.get("idioma", "es")
+            }
+            metadata_fields = {"created_at": datetime.utcnow().isoformat()}
+            if metadata.get("peso") is not None:
+                metadata_fields["peso"] = metadata["peso"]
+            metadata_args = [
+                item
+                for pair in itertools.chain(campaign_fields.items(), metadata_fields.items())
+                for item in pair
+            ]
+
+            commit_keys = [
+                self._queue_key(campaign_id),
+                staging_key,
+                f"campaign:{campaign_id}:metadata",
+                f"campaign:{campaign_id}:stats",
+                self._registry_key(priority),
+                self._registry_key(not priority),
+                f"{staging_key}:commit"
+            ]
+            commit_args = [
+                campaign_id,
+                total,
+                datetime.utcnow().timestamp(),
+                datetime.utcnow().isoformat(),
+                ENQUEUE_CHANNEL,
+                "keep" if self_contained else "reject",
+                len(campaign_fields),
+                len(metadata_fields),
+                *metadata_args,
+                *inline_messages
+            ]
+            while await self._commit_campaign_script(keys=commit_keys, args=commit_args) < 0:
+                # La cola ya existe: mover la carga por bloques acotados y
+                # repetir el commit (que ya no tiene nada que mover)
+                while await self._move_staged_script(
+                    keys=[staging_key, self._queue_key(campaign_id)],
+                    args=[self.enqueue_chunk_size]
+                ):
+                    pass
+            if staged:
+                await self.redis_client.delete(staging_key)
 
-            logger.info(f"Campaña '{campaign_id}' encolada: {len(messages)} mensajes")
-            return len(messages)
+            logger.info(f"Campaña '{campaign_id}' encolada: {total} mensajes")
+            return total
 
         except Exception as e:
             logger.error(f"Error al encolar campaña '{campaign_id}': {str(e)}")
+            try:
+                await self.redis_client.delete(staging_key)
+            except Exception:
+                pass
+            if isinstance(e, ResponseError) and str(e).startswith("CAMPAIGN_FIELDS_CONFLICT"):
+                raise ValueError(
+                    f"La campaña '{campaign_id}' tiene mensajes pendientes con otra "
+                    f"plantilla, buzon o idioma; use otro titulo_campana"
+                ) from e
             raise
 
-    async def dequeue_message(self, campaign_id: str) -> Optional[Dict]:
+    def _stage_chunk(self, pipe, staging_key: str, chunk: List[str]):
+        """Agrega al pipeline la escritura de un bloque en la cola temporal"""
+        pipe.rpush(staging_key, *chunk)
+
+    async def _before_commit(self, campaign_id: str, staging_key: str, staged: bool):
+        """Preparación previa al script de commit (sin uso en el backend de listas)"""
+
+    def _serialize_chunks(self, messages: Iterable[Union[Dict, List]]) -> Iterator[List[str]]:
+        """Serializa los mensajes a JSON (sin espacios) en bloques de `enqueue_chunk_size`"""
+        chunk = []
+        for msg in messages:
+            chunk.append(json.dumps(msg, separators=(",", ":")))
+            if len(chunk) >= self.enqueue_chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    async def lease_messages(
+        self,
+        campaign_id: str,
+        count: int,
+        consumer: str
+    ) -> List[Tuple[str, Dict]]:
         """
-        Extrae un mensaje de la cola (LPOP).
+        Extrae hasta `count` mensajes con lease, en un solo round trip.
+
+        Los mensajes no se pierden si el worker muere: quedan en vuelo hasta
+        `ack_messages` y, si el lease vence sin ack, `requeue_expired_leases`
+        los devuelve a la cola.
 
         Args:
             campaign_id: ID de la campaña
+            count: Máximo de mensajes a extraer
+            consumer: Nombre del consumidor (se incluye en el lease_id)
 
         Returns:
-            Diccionario con el mensaje o None si la cola está vacía
+            Lista de tuplas (lease_id, mensaje)
         """
         try:
-            queue_key = f"campaign:{campaign_id}"
-            message_json = await self.redis_client.lpop(queue_key)
+            result = await self._lease_messages_script(
+                keys=[
+                    self._queue_key(campaign_id),
+                    f"campaign:{campaign_id}:leases",
+                    f"campaign:{campaign_id}:inflight"
+                ],
+                args=[count, int(self.lease_timeout * 1000), f"{consumer}:{uuid.uuid4().hex[:12]}"]
+            )
 
-            if message_json:
-                return json.loads(message_json)
-            return None
+            return await self._parse_leased(campaign_id, zip(result[::2], result[1::2]))
 
         except Exception as e:
-            logger.error(f"Error al desencolar mensaje de '{campaign_id}': {str(e)}")
-            return None
+            logger.error(f"Error al desencolar lote con lease de '{campaign_id}': {str(e)}")
+            return []
+
+    async def _parse_leased(self, campaign_id: str, pairs: Iterable[Tuple[str, str]]) -> List[Tuple[str, Dict]]:
+        """
+        Decodifica pares (lease_id, JSON) recién tomados; los que no son JSON
+        válido se descartan y se confirman.
+        """
+        leased = []
+        invalid = []
+        for lease_id, message_json in pairs:
+            try:
+                leased.append((lease_id, json.loads(message_json)))
+            except ValueError:
+                logger.error(f"Mensaje con JSON inválido descartado en '{campaign_id}': {message_json[:200]}")
+                invalid.append(lease_id)
+
+        if invalid:
+            await self.ack_messages(campaign_id, invalid)
+        return leased
+
+    async def wait_for_messages(
+        self,
+        campaign_ids: List[str],
+        count: int,
+        consumer: str,
+        block_ms: int
+    ) -> Dict[str, List[Tuple[str, Dict]]]:
+        """
+        Espera mensajes nuevos en las colas de campañas activas que no
+        tenían nada para tomar (todo en vuelo o reprogramado).
+
+        Las listas no tienen una lectura bloqueante que deje el lease en el
+        mismo comando: solo espera `block_ms` y el worker vuelve a desencolar
+        con `lease_messages`. El backend de streams sí bloquea en Redis.
+
+        Args:
+            campaign_ids: Campañas a esperar
+            count: Máximo de mensajes por campaña
+            consumer: Nombre del consumidor
+            block_ms: Espera máxima en milisegundos
+
+        Returns:
+            Diccionario campaign_id -> [(lease_id, mensaje)] (vacío en listas)
+        """
+        await asyncio.sleep(block_ms / 1000.0)
+        return {}
+
+    async def ack_messages(self, campaign_id: str, lease_ids: List[str]):
+        """
+        Confirma mensajes en vuelo (ya procesados) y libera sus leases.
+
+        Args:
+            campaign_id: ID de la campaña
+            lease_ids: Leases a confirmar
+        """
+        if not lease_ids:
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=True)
+            self._ack_commands(pipe, campaign_id, lease_ids)
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error al confirmar mensajes de '{campaign_id}': {str(e)}")
+
+    def _ack_commands(self, pipe, campaign_id: str, lease_ids: List[str]):
+        """Agrega al pipeline los comandos que liberan leases"""
+        pipe.hdel(f"campaign:{campaign_id}:leases", *lease_ids)
+        pipe.zrem(f"campaign:{campaign_id}:inflight", *lease_ids)
+
+    async def renew_leases(self, campaign_id: str, lease_ids: List[str], consumer: str) -> List[str]:
+        """
+        Extiende `lease_timeout` los leases de mensajes que el worker todavía
+        no terminó de procesar (esperando turno del rate limiter o un slot de
+        envío), así el reaper no los devuelve a la cola mientras siguen
+        retenidos.
+
+        Args:
+            campaign_id: ID de la campaña
+            lease_ids: Leases a renovar
+            consumer: Nombre del consumidor que los tomó
+
+        Returns:
+            Leases perdidos (ya devueltos a la cola): el worker no debe enviarlos
+        """
+        if not lease_ids:
+            return []
+        try:
+            return await self._renew_leases_script(
+                keys=[f"campaign:{campaign_id}:inflight"],
+                args=[int(self.lease_timeout * 1000), *lease_ids]
+            )
+        except Exception as e:
+            logger.error(f"Error al renovar leases de '{campaign_id}': {str(e)}")
+            return []
+
+    async def requeue_expired_leases(self, limit: int = 1000) -> int:
+        """
+        Devuelve a su cola los mensajes cuyo lease venció sin ack
+        (worker caído o redeploy a mitad de un lote).
+
+        Args:
+            limit: Máximo de leases a devolver por campaña en esta pasada
+
+        Returns:
+            Número de mensajes devueltos a las colas
+        """
+        try:
+            requeued = 0
+            for registry_key in (PRIORITY_CAMPAIGNS_KEY, ACTIVE_CAMPAIGNS_KEY):
+                campaign_ids = await self.redis_client.zrange(registry_key, 0, -1)
+                if not campaign_ids:
+                    continue
+                requeued += await self._requeue_expired_leases_script(
+                    keys=[
+                        key
+                        for campaign_id in campaign_ids
+                        for key in (
+                            self._queue_key(campaign_id),
+                            f"campaign:{campaign_id}:leases",
+                            f"campaign:{campaign_id}:inflight"
+                        )
+                    ],
+                    args=[limit]
+                )
+            if requeued:
+                logger.warning(f"{requeued} mensajes con lease vencido devueltos a sus colas")
+            return int(requeued)
+
+        except Exception as e:
+            logger.error(f"Error al recuperar leases vencidos: {str(e)}")
+            return 0
+
+    async def promote_due_retries(self, limit: int = 1000) -> Tuple[int, Optional[float]]:
+        """
+        Devuelve a su cola los reintentos cuyo backoff ya venció (de cualquier
+        réplica) y avisa a los workers.
+
+        Args:
+            limit: Máximo de reintentos a devolver por campaña en esta pasada
+
+        Returns:
+            Tupla (reintentos devueltos, segundos hasta el próximo reintento
+            programado o None si no hay)
+
+        Raises:
+            redis.RedisError: Si falla la lectura de los registros
+        """
+        promoted, next_due = 0, None
+        for registry_key in (PRIORITY_CAMPAIGNS_KEY, ACTIVE_CAMPAIGNS_KEY):
+            campaign_ids = await self.redis_client.zrange(registry_key, 0, -1)
+            if not campaign_ids:
+                continue
+            count, wait_ms = await self._promote_retries_script(
+                keys=[
+                    key
+                    for campaign_id in campaign_ids
+                    for key in (self._retry_key(campaign_id), self._queue_key(campaign_id))
+                ],
+                args=[limit, ENQUEUE_CHANNEL, registry_key]
+            )
+            promoted += int(count)
+            if int(wait_ms) >= 0:
+                wait = int(wait_ms) / 1000.0
+                next_due = wait if next_due is None else min(next_due, wait)
+        if promoted:
+            logger.info(f"{promoted} reintentos devueltos a sus colas")
+        return promoted, next_due
+
+    async def reserve_send_token(
+        self,
+        phone_id: str,
+        rate: float,
+        burst: float,
+        priority: bool = False,
+        rate_hold_seconds: float = 60.0
+    ) -> float:
+        """
+        Reserva un token del bucket de envío de un phone_id (compartido entre
+        réplicas) en un solo round trip.
+
+        Si otro buzon del mismo phone_id pidió un rate menor en los últimos
+        `rate_hold_seconds`, el bucket sigue usando ese rate (y su ráfaga).
+
+        Args:
+            phone_id: Número emisor de WhatsApp
+            rate: Tokens por segundo
+            burst: Capacidad máxima del bucket
+            priority: Envío prioritario (descuenta el token sin esperar turno)
+            rate_hold_seconds: Vigencia del menor rate pedido para el phone_id
+
+        Returns:
+            Segundos a esperar antes de enviar (0 si hay token disponible)
+
+        Raises:
+            redis.RedisError: Si falla la reserva
+        """
+        wait_ms = await self._token_bucket_script(
+            keys=[f"ratelimit:{phone_id}"],
+            args=[rate, burst, int(priority), int(rate_hold_seconds * 1000)]
+        )
+        return int(wait_ms) / 1000.0
 
     async def get_campaign_stats(self, campaign_id: str) -> Dict:
         """
@@ -152,7 +541,6 @@ class RedisService:
             Diccionario con las estadísticas
         """
         try:
-            queue_key = f"campaign:{campaign_id}"
             stats_key = f"campaign:{campaign_id}:stats"
 
             # Obtener stats de Redis
@@ -161,13 +549,14 @@ class RedisService:
             if not stats:
                 return None
 
-            # Obtener mensajes pendientes
-            pendientes = await self.redis_client.llen(queue_key)
+            # Obtener mensajes pendientes (en cola + en vuelo sin ack + reintentos)
+            pendientes = await self._count_pending(campaign_id)
 
             # Calcular progreso
             total = int(stats.get("total", 0))
             enviados = int(stats.get("enviados", 0))
             fallidos = int(stats.get("fallidos", 0))
+            reintentos = int(stats.get("reintentos", 0))
 
             progreso_porcentaje = 0
             if total > 0:
@@ -186,6 +575,7 @@ class RedisService:
                 "pendientes": pendientes,
                 "enviados": enviados,
                 "fallidos": fallidos,
+                "reintentos": reintentos,
                 "estado": estado,
                 "progreso_porcentaje": round(progreso_porcentaje, 2),
                 "ultimo_envio": stats.get("ultimo_envio") or None
@@ -195,54 +585,473 @@ class RedisService:
             logger.error(f"Error al obtener stats de '{campaign_id}': {str(e)}")
             return None
 
-    async def increment_sent(self, campaign_id: str):
-        """Incrementa el contador de mensajes enviados"""
-        try:
+    async def _count_pending(self, campaign_id: str) -> int:
+        """Mensajes pendientes de una campaña: en cola + en vuelo sin ack + reintentos programados"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        await self._pending_commands(pipe, campaign_id)
+        return self._split_counts(await pipe.execute())[1]
+
+    async def _pending_commands(self, pipe, campaign_id: str):
+        """Agrega al pipeline los conteos de pendientes (en cola, en vuelo, reintentos)"""
+        pipe.llen(self._queue_key(campaign_id))
+        pipe.zcard(f"campaign:{campaign_id}:inflight")
+        pipe.zcard(self._retry_key(campaign_id))
+
+    @staticmethod
+    def _split_counts(counts: List) -> Tuple[int, int]:
+        """
+        (desencolables, pendientes) a partir de los conteos de `_pending_commands`:
+        los mensajes en vuelo y los reintentos programados están pendientes
+        pero todavía no se pueden desencolar.
+        """
+        return counts[0], sum(counts)
+
+    async def get_consumers_info(self, campaign_id: str) -> Dict:
+        """
+        Obtiene el detalle de consumo de una campaña: mensajes en cola,
+        en vuelo y cuántos tiene cada consumidor (réplica).
+
+        Args:
+            campaign_id: ID de la campaña
+
+        Returns:
+            Diccionario con en_cola, en_vuelo y consumidores [{nombre, pendientes}]
+        """
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.llen(self._queue_key(campaign_id))
+        pipe.zrange(f"campaign:{campaign_id}:inflight", 0, -1)
+        en_cola, leases = await pipe.execute()
+
+        # lease_id = "{consumidor}:{lote}:{n}"
+        por_consumidor: Dict[str, int] = {}
+        for lease_id in leases:
+            consumer = lease_id.rsplit(":", 2)[0]
+            por_consumidor[consumer] = por_consumidor.get(consumer, 0) + 1
+
+        return {
+            "campaign_id": campaign_id,
+            "backend": "list",
+            "en_cola": en_cola,
+            "en_vuelo": len(leases),
+            "consumidores": [
+                {"nombre": nombre, "pendientes": pendientes}
+                for nombre, pendientes in sorted(por_consumidor.items())
+            ]
+        }
+
+    async def apply_results(self, results: Dict[str, Dict]):
+        """
+        Aplica en una sola transacción (MULTI/EXEC) los resultados acumulados
+        por el worker: incrementos de enviados/fallidos/reintentos, último
+        envío, reintentos programados, resultados por mensaje (stream
+        RESULTS_STREAM_KEY) y ack de los leases correspondientes.
+        Contadores, reintentos y acks se escriben juntos, así un mensaje nunca
+        queda confirmado sin estar contado o reprogramado (ni al revés).
+
+        Args:
+            results: campaign_id -> {"enviados": int, "fallidos": int,
+                "reintentos": int (reintentos contados; los reprogramados
+                sin intento, ej: circuito abierto, no suman),
+                "ultimo_envio": str o None,
+                "retries": [(mensaje, vencimiento epoch ms), ...],
+                "outcomes": [resultado por mensaje, ...] (opcional),
+                "leases": [lease_id, ...]}
+
+        Raises:
+            Exception: Si falla la escritura (el llamador conserva los resultados)
+        """
+        if not results:
+            return
+        pipe = self.redis_client.pipeline(transaction=True)
+        for campaign_id, result in results.items():
             stats_key = f"campaign:{campaign_id}:stats"
-            await self.redis_client.hincrby(stats_key, "enviados", 1)
-            await self.redis_client.hset(
-                stats_key,
-                "ultimo_envio",
-                datetime.utcnow().isoformat()
+            if result["enviados"]:
+                pipe.hincrby(stats_key, "enviados", result["enviados"])
+            if result["fallidos"]:
+                pipe.hincrby(stats_key, "fallidos", result["fallidos"])
+            if result["ultimo_envio"]:
+                pipe.hset(stats_key, "ultimo_envio", result["ultimo_envio"])
+            if result["reintentos"]:
+                pipe.hincrby(stats_key, "reintentos", result["reintentos"])
+            if result["retries"]:
+                pipe.zadd(self._retry_key(campaign_id), {
+                    # ID propio: dos reintentos con el mismo contenido no se pisan
+                    json.dumps(dict(message, reintento_id=uuid.uuid4().hex), separators=(",", ":")): due_ms
+                    for message, due_ms in result["retries"]
+                })
+            for outcome in result.get("outcomes", ()):
+                pipe.xadd(
+                    RESULTS_STREAM_KEY,
+                    {"r": json.dumps(outcome, separators=(",", ":"))},
+                    maxlen=self.results_max_length or None,
+                    approximate=True
+                )
+            if result["leases"]:
+                self._ack_commands(pipe, campaign_id, result["leases"])
+        await pipe.execute()
+
+    async def ensure_results_group(self):
+        """Crea el stream de resultados y su grupo de consumidores si no existen"""
+        try:
+            await self.redis_client.xgroup_create(RESULTS_STREAM_KEY, RESULTS_GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def read_results(
+        self,
+        consumer: str,
+        count: int,
+        own_pending: bool = False,
+        claim_idle_ms: int = 0
+    ) -> List[Tuple[str, Dict]]:
+        """
+        Lee resultados de envío del stream para guardarlos (sin confirmar).
+
+        Args:
+            consumer: Nombre del consumidor
+            count: Máximo de resultados
+            own_pending: Releer los ya entregados a este consumidor y sin
+                confirmar (ej: tras un reinicio) en vez de leer nuevos
+            claim_idle_ms: Si > 0, tomar primero los entregados a cualquier
+                consumidor hace más de este tiempo sin confirmar (réplica caída)
+
+        Returns:
+            Lista de (ID del stream, resultado)
+        """
+        entries = []
+        if own_pending:
+            pending = await self.redis_client.xpending_range(
+                RESULTS_STREAM_KEY, RESULTS_GROUP, "-", "+", count, consumername=consumer
             )
-        except Exception as e:
-            logger.error(f"Error al incrementar enviados de '{campaign_id}': {str(e)}")
+            if not pending:
+                return []
+            entries = await self.redis_client.xclaim(
+                RESULTS_STREAM_KEY, RESULTS_GROUP, consumer, 0, [entry["message_id"] for entry in pending]
+            )
+        elif claim_idle_ms > 0:
+            claimed = await self.redis_client.xautoclaim(
+                RESULTS_STREAM_KEY, RESULTS_GROUP, consumer,
+                min_idle_time=claim_idle_ms, start_id="0-0", count=count
+            )
+            entries = claimed[1]
+        if not entries and not own_pending:
+            response = await self.redis_client.xreadgroup(
+                RESULTS_GROUP, consumer, {RESULTS_STREAM_KEY: ">"}, count=count
+            )
+            entries = response[0][1] if response else []
+        # Entradas ya borradas del stream (pendientes sin datos) se ignoran
+        return [(entry_id, json.loads(fields["r"])) for entry_id, fields in entries if fields]
+
+    async def ack_results(self, entry_ids: List[str]):
+        """
+        Confirma y borra del stream resultados ya guardados.
+
+        Args:
+            entry_ids: IDs del stream
+        """
+        if not entry_ids:
+            return
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.xack(RESULTS_STREAM_KEY, RESULTS_GROUP, *entry_ids)
+            pipe.xdel(RESULTS_STREAM_KEY, *entry_ids)
+            await pipe.execute()
+
+    async def get_results_backlog(self) -> int:
+        """Resultados de envío en el stream que todavía no se guardaron"""
+        return await self.redis_client.xlen(RESULTS_STREAM_KEY)
+
+    async def get_unsaved_results(
+        self,
+        campaign_id: str,
+        estado: Optional[str] = None,
+        page_size: int = 1000
+    ) -> Dict[str, Dict]:
+        """
+        Resultados de envío de una campaña que siguen en el stream (sin
+        guardar en Supabase o guardados y todavía sin confirmar).
+
+        Recorre el stream completo por páginas (XRANGE): el costo depende del
+        atraso de todas las campañas, acotado por results_max_length.
+
+        Args:
+            campaign_id: ID de la campaña
+            estado: Solo resultados con este estado (enviado, fallido, reintento)
+            page_size: Entradas por lectura
+
+        Returns:
+            Diccionario ID del stream -> resultado, en orden de llegada
+        """
+        unsaved: Dict[str, Dict] = {}
+        start = "-"
+        while True:
+            entries = await self.redis_client.xrange(RESULTS_STREAM_KEY, start, "+", count=page_size)
+            for entry_id, fields in entries:
+                result = json.loads(fields["r"])
+                if result.get("campaign_id") == campaign_id and (not estado or result.get("estado") == estado):
+                    unsaved[entry_id] = result
+            if len(entries) < page_size:
+                return unsaved
+            start = "(" + entries[-1][0]
+
+    async def listen_enqueued(self) -> AsyncIterator[Optional[bool]]:
+        """
+        Espera avisos de campañas encoladas (en cualquier réplica).
 
-    async def increment_failed(self, campaign_id: str):
-        """Incrementa el contador de mensajes fallidos"""
+        Usa una conexión pub/sub dedicada: mientras no hay avisos no genera
+        carga en Redis. Los avisos no se guardan, así que al quedar suscrito
+        se entrega None para que quien escucha revise ambos registros (lo
+        encolado antes de la suscripción no tuvo aviso).
+
+        Yields:
+            None al suscribirse; después, por aviso, True si la campaña quedó
+            en el registro de prioritarias
+        """
+        pubsub = self.redis_client.pubsub()
+        await pubsub.subscribe(ENQUEUE_CHANNEL)
         try:
-            stats_key = f"campaign:{campaign_id}:stats"
-            await self.redis_client.hincrby(stats_key, "fallidos", 1)
+            yield None
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield message["data"] == PRIORITY_CAMPAIGNS_KEY
+        finally:
+            await pubsub.unsubscribe(ENQUEUE_CHANNEL)
+            await pubsub.aclose()
+
+    async def get_queue_counts_by_campaign(self, priority: bool = False) -> Dict[str, Tuple[int, int]]:
+        """
+        Obtiene los mensajes desencolables y pendientes de cada campaña
+        registrada como activa.
+
+        Lee el registro de campañas activas y sus conteos en dos round trips
+        (los mismos que `get_campaign_stats`: en cola, en vuelo y reintentos),
+        por lo que el costo depende solo del número de campañas activas y no
+        de cuántas claves antiguas haya en Redis.
+
+        Args:
+            priority: Leer el registro de campañas prioritarias en vez del de masivas
+
+        Returns:
+            Diccionario campaign_id -> (desencolables, pendientes). Desencolables
+            es lo que se puede repartir ahora; pendientes incluye además lo en
+            vuelo y los reintentos programados (0 = la campaña se puede dar de
+            baja). Incluye campañas registradas cuya cola ya se vació.
+        """
+        try:
+            campaign_ids = await self.redis_client.zrange(self._registry_key(priority), 0, -1)
+            if not campaign_ids:
+                return {}
+            pipe = self.redis_client.pipeline(transaction=False)
+            for campaign_id in campaign_ids:
+                await self._pending_commands(pipe, campaign_id)
+            counts = await pipe.execute()
+            # Cada campaña agrega la misma cantidad de conteos al pipeline
+            width = len(counts) // len(campaign_ids)
+            return {
+                campaign_id: self._split_counts(counts[i * width:(i + 1) * width])
+                for i, campaign_id in enumerate(campaign_ids)
+            }
+
         except Exception as e:
-            logger.error(f"Error al incrementar fallidos de '{campaign_id}': {str(e)}")
+            logger.error(f"Error al leer registro de campañas activas: {str(e)}")
+            return {}
+
+    async def get_pending_by_campaign(self, priority: bool = False) -> Dict[str, int]:
+        """
+        Obtiene los mensajes pendientes (en cola, en vuelo y reintentos) de
+        cada campaña registrada como activa.
+
+        Args:
+            priority: Leer el registro de campañas prioritarias en vez del de masivas
+
+        Returns:
+            Diccionario campaign_id -> mensajes pendientes (incluye campañas
+            registradas cuya cola ya se vació)
+        """
+        counts = await self.get_queue_counts_by_campaign(priority)
+        return {campaign_id: pending for campaign_id, (_, pending) in counts.items()}
+
+    async def get_all_pending_by_campaign(self) -> Dict[str, int]:
+        """
+        Mensajes pendientes por campaña de ambos registros (prioritarias primero).
+
+        Returns:
+            Diccionario campaign_id -> mensajes pendientes
+        """
+        pending = await self.get_pending_by_campaign(priority=True)
+        pending.update(await self.get_pending_by_campaign())
+        return pending
 
     async def get_active_campaigns(self) -> List[str]:
         """
-        Obtiene la lista de campañas activas (con mensajes pendientes).
+        Obtiene la lista de campañas activas (con mensajes pendientes),
+        prioritarias y masivas.
+
+        Returns:
+            Lista de IDs de campañas activas, prioritarias primero y en orden de alta
+        """
+        pending = await self.get_all_pending_by_campaign()
+        return [campaign_id for campaign_id, length in pending.items() if length > 0]
+
+    async def deactivate_campaign(self, campaign_id: str, priority: bool = False) -> bool:
+        """
+        Quita una campaña del registro de activas si su cola está vacía
+        y no tiene mensajes en vuelo ni reintentos programados.
+
+        La comprobación y la baja son atómicas: si entre tanto se encolaron
+        mensajes nuevos, la campaña sigue registrada.
+
+        Args:
+            campaign_id: ID de la campaña
+            priority: La campaña está en el registro de prioritarias
 
         Returns:
-            Lista de IDs de campañas activas
+            True si la campaña fue dada de baja
         """
         try:
-            # Buscar todas las claves de campañas
-            pattern = "campaign:*"
-            keys = []
-
-            async for key in self.redis_client.scan_iter(match=pattern):
-                # Filtrar solo las colas (sin :stats ni :metadata)
-                if ":stats" not in key and ":metadata" not in key:
-                    # Verificar que tenga mensajes pendientes
-                    length = await self.redis_client.llen(key)
-                    if length > 0:
-                        # Extraer campaign_id
-                        campaign_id = key.replace("campaign:", "")
-                        keys.append(campaign_id)
-
-            return keys
+            removed = await self._deactivate_campaign_script(
+                keys=[
+                    self._queue_key(campaign_id),
+                    self._registry_key(priority),
+                    f"campaign:{campaign_id}:stats",
+                    f"campaign:{campaign_id}:metadata",
+                    f"campaign:{campaign_id}:inflight",
+                    self._retry_key(campaign_id)
+                ],
+                args=[campaign_id, self.campaign_ttl]
+            )
+            if removed:
+                logger.info(f"Campaña '{campaign_id}' completada, retirada del registro de activas")
+            return bool(removed)
 
         except Exception as e:
-            logger.error(f"Error al obtener campañas activas: {str(e)}")
-            return []
+            logger.error(f"Error al dar de baja campaña '{campaign_id}': {str(e)}")
+            return False
+
+    async def rebuild_active_registry(self) -> int:
+        """
+        Registra las colas con mensajes pendientes que no estén en el registro.
+
+        Se ejecuta una vez al conectar para incorporar campañas encoladas por
+        versiones anteriores (que no escribían el registro). Es el único punto
+        que recorre el keyspace con SCAN.
+
+        Returns:
+            Número de campañas agregadas al registro
+        """
+        try:
+            added = 0
+            async for key in self.redis_client.scan_iter(match=self._queue_key("*"), _type=self.QUEUE_KEY_TYPE):
+                if await self._queue_length(key) > 0:
+                    prefix, suffix = self._queue_key("*").split("*")
+                    campaign_id = key[len(prefix):len(key) - len(suffix)]
+                    if await self.redis_client.zscore(PRIORITY_CAMPAIGNS_KEY, campaign_id) is not None:
+                        continue
+                    added += await self.redis_client.zadd(
+                        ACTIVE_CAMPAIGNS_KEY,
+                        {campaign_id: datetime.utcnow().timestamp()},
+                        nx=True
+                    )
+
+            if added:
+                logger.info(f"Registro de campañas activas reconstruido: {added} campañas agregadas")
+            return added
+
+        except Exception as e:
+            logger.error(f"Error al reconstruir registro de campañas activas: {str(e)}")
+            return 0
+
+    async def get_shared_credentials(self, buzon_id: str) -> Optional[str]:
+        """
+        Obtiene las credenciales cifradas de un buzon compartidas entre réplicas.
+
+        Args:
+            buzon_id: ID del buzon
+
+        Returns:
+            Credenciales cifradas o None si no están (o vencieron)
+        """
+        return await self.redis_client.get(f"{CREDENTIALS_KEY_PREFIX}{buzon_id}")
+
+    async def set_shared_credentials(self, buzon_id: str, encrypted: str, ttl: int):
+        """
+        Guarda las credenciales cifradas de un buzon para todas las réplicas.
+
+        Args:
+            buzon_id: ID del buzon
+            encrypted: Credenciales cifradas
+            ttl: Segundos de vigencia
+        """
+        await self.redis_client.set(f"{CREDENTIALS_KEY_PREFIX}{buzon_id}", encrypted, ex=ttl)
+
+    async def invalidate_shared_credentials(self, buzon_id: str):
+        """
+        Borra las credenciales compartidas de un buzon y avisa a todas las
+        réplicas (pub/sub) para que descarten su copia en memoria, en una
+        sola transacción.
+
+        Args:
+            buzon_id: ID del buzon
+        """
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(f"{CREDENTIALS_KEY_PREFIX}{buzon_id}")
+            pipe.publish(CREDENTIALS_INVALIDATED_CHANNEL, buzon_id)
+            await pipe.execute()
+
+    async def listen_credentials_invalidated(self) -> AsyncIterator[str]:
+        """
+        Espera avisos de credenciales invalidadas (en cualquier réplica).
+
+        Yields:
+            ID del buzon invalidado
+        """
+        pubsub = self.redis_client.pubsub()
+        await pubsub.subscribe(CREDENTIALS_INVALIDATED_CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield message["data"]
+        finally:
+            await pubsub.unsubscribe(CREDENTIALS_INVALIDATED_CHANNEL)
+            await pubsub.aclose()
+
+    async def publish_circuit_status(self, consumer: str, status: Optional[Dict]):
+        """
+        Publica el estado de los circuitos de un worker (None lo retira).
+
+        Args:
+            consumer: Nombre del consumidor (worker)
+            status: Estado de CircuitBreakers.get_status()
+        """
+        if status is None:
+            await self.redis_client.hdel(CIRCUITS_STATUS_KEY, consumer)
+            return
+        value = {"ts": datetime.utcnow().timestamp(), "circuitos": status}
+        await self.redis_client.hset(CIRCUITS_STATUS_KEY, consumer, json.dumps(value, separators=(",", ":")))
+
+    async def get_published_circuit_status(self, max_age: float) -> Dict[str, Dict]:
+        """
+        Estado de los circuitos publicado por los workers. Las entradas más
+        viejas que `max_age` (worker caído) se descartan y se borran.
+
+        Args:
+            max_age: Segundos de vigencia de cada publicación
+
+        Returns:
+            Diccionario consumidor -> estado de sus circuitos
+        """
+        entries = await self.redis_client.hgetall(CIRCUITS_STATUS_KEY)
+        now = datetime.utcnow().timestamp()
+        statuses, stale = {}, []
+        for consumer, raw in entries.items():
+            value = json.loads(raw)
+            if now - value["ts"] > max_age:
+                stale.append(consumer)
+            else:
+                statuses[consumer] = value["circuitos"]
+        if stale:
+            await self.redis_client.hdel(CIRCUITS_STATUS_KEY, *stale)
+        return statuses
 
     async def get_campaign_metadata(self, campaign_id: str) -> Optional[Dict]:
         """
@@ -269,17 +1078,5 @@ class RedisService:
         Returns:
             Total de mensajes pendientes
         """
-        try:
-            total = 0
-            pattern = "campaign:*"
-
-            async for key in self.redis_client.scan_iter(match=pattern):
-                if ":stats" not in key and ":metadata" not in key:
-                    length = await self.redis_client.llen(key)
-                    total += length
-
-            return total
-
-        except Exception as e:
-            logger.error(f"Error al obtener total de mensajes pendientes: {str(e)}")
-            return 0
+        pending = await self.get_all_pending_by_campaign()
+        return sum(pending.values())
@@ -0,0 +1,271 @@
+"""
+Servicio de colas sobre Redis Streams (alternativa al backend de listas)
+"""
+import asyncio
+import logging
+import time
+from typing import List, Dict, Tuple
+
+from redis.exceptions import ResponseError
+
+from app.services.redis_service import RedisService
+from app.services.redis_scripts import (
+    STREAM_GROUP,
+    STREAM_DEACTIVATE_CAMPAIGN_SCRIPT,
+    STREAM_COMMIT_CAMPAIGN_SCRIPT,
+    STREAM_MOVE_STAGED_SCRIPT,
+    STREAM_LEASE_MESSAGES_SCRIPT,
+    STREAM_RENEW_LEASES_SCRIPT,
+    STREAM_PROMOTE_RETRIES_SCRIPT,
+    STREAM_QUEUE_COUNTS_SCRIPT
+)
+
+logger = logging.getLogger(__name__)
+
+# Entradas con lease vencido que se cuentan como desencolables por campaña
+# (XPENDING IDLE recorre las pendientes del grupo)
+EXPIRED_COUNT_LIMIT = 1000
+
+
+class RedisStreamService(RedisService):
+    """
+    Colas de campañas sobre Redis Streams con grupo de consumidores.
+
+    Misma API que RedisService, con estas diferencias:
+    - Encolar: XADD sobre campaign:{id}:stream
+    - Desencolar: XREADGROUP COUNT por consumidor (cada réplica es un consumidor)
+    - Ack: XACK + XDEL, así XLEN siempre es lo pendiente (en cola + en vuelo)
+    - Recuperación: las entradas sin ack se reclaman con XAUTOCLAIM al leer,
+      no hace falta reaper aparte
+    - Visibilidad: pendientes y lag por consumidor con XINFO
+    """
+
+    QUEUE_KEY_TYPE = "stream"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._queue_counts_script = None
+
+    def _register_scripts(self):
+        """Registra los scripts Lua del backend de streams"""
+        super()._register_scripts()
+        self._deactivate_campaign_script = self.redis_client.register_script(STREAM_DEACTIVATE_CAMPAIGN_SCRIPT)
+        self._commit_campaign_script = self.redis_client.register_script(STREAM_COMMIT_CAMPAIGN_SCRIPT)
+        self._move_staged_script = self.redis_client.register_script(STREAM_MOVE_STAGED_SCRIPT)
+        self._lease_messages_script = self.redis_client.register_script(STREAM_LEASE_MESSAGES_SCRIPT)
+        self._renew_leases_script = self.redis_client.register_script(STREAM_RENEW_LEASES_SCRIPT)
+        self._promote_retries_script = self.redis_client.register_script(STREAM_PROMOTE_RETRIES_SCRIPT)
+        self._queue_counts_script = self.redis_client.register_script(STREAM_QUEUE_COUNTS_SCRIPT)
+
+    def _queue_key(self, campaign_id: str) -> str:
+        """Clave del stream de mensajes de una campaña"""
+        return f"campaign:{campaign_id}:stream"
+
+    async def _queue_length(self, queue_key: str) -> int:
+        """Longitud de un stream (O(1))"""
+        return await self.redis_client.xlen(queue_key)
+
+    def _stage_chunk(self, pipe, staging_key: str, chunk: List[str]):
+        """Agrega al pipeline un XADD por mensaje del bloque"""
+        for message_json in chunk:
+            pipe.xadd(staging_key, {"m": message_json})
+
+    async def _before_commit(self, campaign_id: str, staging_key: str, staged: bool):
+        """
+        Crea el grupo de consumidores antes del commit: en el stream temporal
+        (se renombra junto con su grupo) o en el stream de la campaña. No se
+        llama para un encolado sin mensajes (el commit no registra la campaña
+        y el stream quedaría huérfano, sin TTL).
+        """
+        await self._ensure_group(staging_key if staged else self._queue_key(campaign_id))
+
+    async def _ensure_group(self, stream_key: str):
+        """Crea el grupo de consumidores (y el stream) si no existe"""
+        try:
+            await self.redis_client.xgroup_create(stream_key, STREAM_GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def lease_messages(
+        self,
+        campaign_id: str,
+        count: int,
+        consumer: str
+    ) -> List[Tuple[str, Dict]]:
+        """
+        Lee hasta `count` mensajes para un consumidor del grupo, en un solo
+        round trip. Primero reclama entradas de consumidores caídos (sin ack
+        durante más de `lease_timeout`), luego lee entradas nuevas.
+
+        Args:
+            campaign_id: ID de la campaña
+            count: Máximo de mensajes a leer
+            consumer: Nombre del consumidor en el grupo
+
+        Returns:
+            Lista de tuplas (entry_id, mensaje)
+        """
+        try:
+            result = await self._lease_messages_script(
+                keys=[self._queue_key(campaign_id)],
+                args=[count, int(self.lease_timeout * 1000), consumer, STREAM_GROUP]
+            )
+
+            return await self._parse_leased(campaign_id, zip(result[::2], result[1::2]))
+
+        except ResponseError as e:
+            # Stream o grupo inexistente: campaña vacía
+            if "NOGROUP" in str(e):
+                return []
+            logger.error(f"Error al leer lote del stream de '{campaign_id}': {str(e)}")
+            return []
+        except Exception as e:
+            logger.error(f"Error al leer lote del stream de '{campaign_id}': {str(e)}")
+            return []
+
+    async def wait_for_messages(
+        self,
+        campaign_ids: List[str],
+        count: int,
+        consumer: str,
+        block_ms: int
+    ) -> Dict[str, List[Tuple[str, Dict]]]:
+        """
+        Espera entradas nuevas con XREADGROUP ... BLOCK sobre los streams de
+        las campañas: la primera que llegue (encolado o reintento promovido)
+        se entrega a este consumidor sin esperar al próximo ciclo.
+
+        Las entradas de consumidores caídos no despiertan esta espera; se
+        reclaman con XAUTOCLAIM en el siguiente `lease_messages`.
+
+        Args:
+            campaign_ids: Campañas a esperar
+            count: Máximo de entradas por stream
+            consumer: Nombre del consumidor en el grupo
+            block_ms: Espera máxima en milisegundos
+
+        Returns:
+            Diccionario campaign_id -> [(entry_id, mensaje)]
+        """
+        if not campaign_ids:
+            return {}
+        campaign_by_key = {self._queue_key(cid): cid for cid in campaign_ids}
+        started = time.monotonic()
+        try:
+            response = await self.redis_client.xreadgroup(
+                STREAM_GROUP, consumer, {key: ">" for key in campaign_by_key}, count=count, block=block_ms
+            )
+        except Exception as e:
+            # NOGROUP: algún stream ya se borró; el próximo ciclo lo da de baja
+            logger.debug(f"Espera bloqueante de streams interrumpida: {str(e)}")
+            response = None
+
+        leased = {}
+        for stream_key, entries in response or []:
+            campaign_id = campaign_by_key[stream_key]
+            pairs = [(entry_id, fields.get("m")) for entry_id, fields in entries if fields]
+            leased[campaign_id] = await self._parse_leased(campaign_id, pairs)
+
+        # Sin entradas antes del plazo (o servidor que no bloquea, ej: FakeRedis
+        # o error): completar la espera para no consultar Redis sin pausa
+        if not leased:
+            remaining = block_ms / 1000.0 - (time.monotonic() - started)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+        return leased
+
+    def _ack_commands(self, pipe, campaign_id: str, lease_ids: List[str]):
+        """Agrega al pipeline XACK + XDEL de las entradas procesadas"""
+        stream_key = self._queue_key(campaign_id)
+        pipe.xack(stream_key, STREAM_GROUP, *lease_ids)
+        pipe.xdel(stream_key, *lease_ids)
+
+    async def renew_leases(self, campaign_id: str, lease_ids: List[str], consumer: str) -> List[str]:
+        """
+        Reinicia el tiempo inactivo de las entradas pendientes del consumidor
+        (XCLAIM JUSTID), así XAUTOCLAIM no las reclama mientras el worker las
+        tiene retenidas.
+
+        Args:
+            campaign_id: ID de la campaña
+            lease_ids: Entradas a renovar
+            consumer: Nombre del consumidor en el grupo
+
+        Returns:
+            Entradas perdidas (reclamadas por otro consumidor): el worker no
+            debe enviarlas
+        """
+        if not lease_ids:
+            return []
+        try:
+            return await self._renew_leases_script(
+                keys=[self._queue_key(campaign_id)],
+                args=[STREAM_GROUP, consumer, *lease_ids]
+            )
+        except Exception as e:
+            logger.error(f"Error al renovar entradas pendientes de '{campaign_id}': {str(e)}")
+            return []
+
+    async def requeue_expired_leases(self, limit: int = 1000) -> int:
+        """
+        Sin efecto en streams: las entradas con lease vencido se reclaman
+        con XAUTOCLAIM en `lease_messages`.
+        """
+        return 0
+
+    async def _pending_commands(self, pipe, campaign_id: str):
+        """Agrega al pipeline los conteos de pendientes: stream (largo, en vuelo, vencidas) y reintentos"""
+        await self._queue_counts_script(
+            keys=[self._queue_key(campaign_id)],
+            args=[STREAM_GROUP, int(self.lease_timeout * 1000), EXPIRED_COUNT_LIMIT],
+            client=pipe
+        )
+        pipe.zcard(self._retry_key(campaign_id))
+
+    @staticmethod
+    def _split_counts(counts: List) -> Tuple[int, int]:
+        """
+        (desencolables, pendientes): XLEN ya incluye lo en vuelo (se borra al
+        ack); de lo en vuelo solo se puede desencolar lo que tiene el lease vencido.
+        """
+        (length, in_flight, expired), retries = counts
+        return length - in_flight + expired, length + retries
+
+    async def get_consumers_info(self, campaign_id: str) -> Dict:
+        """
+        Obtiene el detalle de consumo del grupo: pendientes sin ack, lag
+        (entradas aún no entregadas) y estado de cada consumidor.
+
+        Args:
+            campaign_id: ID de la campaña
+
+        Returns:
+            Diccionario con en_cola, en_vuelo y consumidores [{nombre, pendientes, inactivo_ms}]
+        """
+        stream_key = self._queue_key(campaign_id)
+        try:
+            groups = await self.redis_client.xinfo_groups(stream_key)
+            consumers = await self.redis_client.xinfo_consumers(stream_key, STREAM_GROUP)
+        except ResponseError:
+            groups, consumers = [], []
+
+        group = next((g for g in groups if g.get("name") == STREAM_GROUP), {})
+        en_vuelo = sum(int(c.get("pending", 0)) for c in consumers)
+        total = await self.redis_client.xlen(stream_key)
+
+        return {
+            "campaign_id": campaign_id,
+            "backend": "stream",
+            "en_cola": total - en_vuelo,
+            "en_vuelo": en_vuelo,
+            "lag": group.get("lag"),
+            "consumidores": [
+                {
+                    "nombre": c.get("name"),
+                    "pendientes": int(c.get("pending", 0)),
+                    "inactivo_ms": int(c.get("idle", 0))
+                }
+                for c in consumers
+            ]
+        }
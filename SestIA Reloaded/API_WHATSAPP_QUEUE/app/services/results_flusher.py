@@ -0,0 +1,185 @@
+"""
+Escritura en Supabase de los resultados de envío acumulados en Redis
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from app.services.redis_service import RedisService
+from app.services.supabase_service import SupabaseService
+
+logger = logging.getLogger(__name__)
+
+# Resultados leídos y sin confirmar que otra réplica toma pasado este tiempo
+# (la réplica que los leyó se cayó antes de guardarlos)
+CLAIM_IDLE_MS = 300000
+
+# Tiempo máximo para guardar lo pendiente al detenerse (el resto queda en
+# Redis para la próxima réplica que lo lea)
+STOP_TIMEOUT_SECONDS = 10.0
+
+
+class ResultsFlusher:
+    """
+    Guarda en Supabase los resultados de envío por mensaje que el worker
+    deja en el stream de Redis (RESULTS_STREAM_KEY), escritos en la misma
+    transacción que los contadores y acks del agregador de stats.
+
+    El envío nunca espera a Supabase: solo suma el resultado al agregador.
+    El flusher lee lotes de hasta `batch_size` resultados con un grupo de
+    consumidores (compartido entre réplicas), inserta cada lote en una sola
+    request y recién entonces lo confirma y borra del stream. Guarda un lote
+    por vez (backpressure): con atraso lee el siguiente apenas termina el
+    anterior; sin resultados espera `flush_interval_ms`. Si Supabase falla
+    reintenta el mismo lote con backoff exponencial (hasta
+    `max_backoff_seconds`) mientras los resultados nuevos se acumulan en
+    Redis. Reintentar un lote ya insertado no duplica filas (stream_id único).
+    """
+
+    def __init__(
+        self,
+        redis: RedisService,
+        supabase: SupabaseService,
+        batch_size: int = 500,
+        flush_interval_ms: int = 1000,
+        max_backoff_seconds: float = 60.0,
+        claim_idle_ms: int = CLAIM_IDLE_MS
+    ):
+        """
+        Inicializa el flusher.
+
+        Args:
+            redis: Servicio de Redis
+            supabase: Servicio de Supabase
+            batch_size: Resultados por inserción
+            flush_interval_ms: Espera entre lecturas cuando no hay atraso
+            max_backoff_seconds: Espera máxima entre reintentos si Supabase falla
+            claim_idle_ms: Tiempo tras el cual se toman resultados leídos y sin
+                confirmar por otra réplica
+        """
+        self.redis = redis
+        self.supabase = supabase
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_backoff = max_backoff_seconds
+        self.claim_idle_ms = claim_idle_ms
+        self.consumer_name = "worker"
+
+        # Lote leído del stream y todavía sin guardar (se reintenta tal cual)
+        self._batch: List[Tuple[str, Dict]] = []
+        self._own_pending_checked = False
+        self._task: Optional[asyncio.Task] = None
+
+        # Métricas
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    async def _read_batch(self) -> List[Tuple[str, Dict]]:
+        """
+        Siguiente lote del stream: primero lo que este consumidor leyó antes
+        de un reinicio sin confirmar, después lo abandonado por otras réplicas
+        y por último resultados nuevos.
+        """
+        if not self._own_pending_checked:
+            entries = await self.redis.read_results(self.consumer_name, self.batch_size, own_pending=True)
+            if entries:
+                return entries
+            self._own_pending_checked = True
+        return await self.redis.read_results(self.consumer_name, self.batch_size, claim_idle_ms=self.claim_idle_ms)
+
+    async def flush(self) -> int:
+        """
+        Guarda un lote: el de un intento fallido o uno nuevo del stream.
+
+        Returns:
+            Resultados guardados (0 si no había)
+
+        Raises:
+            Exception: Si falla la lectura o la escritura (el lote se conserva
+                para el próximo intento)
+        """
+        if not self._batch:
+            self._batch = await self._read_batch()
+        if not self._batch:
+            return 0
+
+        await self.supabase.insert_results([dict(result, stream_id=entry_id) for entry_id, result in self._batch])
+        await self.redis.ack_results([entry_id for entry_id, _ in self._batch])
+
+        written = len(self._batch)
+        self._batch = []
+        self.written += written
+        self.batches += 1
+        return written
+
+    async def _run(self):
+        """Loop de escritura: lotes seguidos con atraso, backoff si Supabase falla"""
+        backoff = 0.0
+        while True:
+            try:
+                written = await self.flush()
+                backoff = 0.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e) or type(e).__name__
+                backoff = min(self.max_backoff, max(self.flush_interval, backoff * 2))
+                logger.error(
+                    f"Error al guardar {len(self._batch)} resultados de envío, "
+                    f"reintento en {backoff:.0f}s: {self.last_error}"
+                )
+                # Stream o grupo borrados (ej: Redis reiniciado sin persistencia)
+                if "NOGROUP" in self.last_error:
+                    await asyncio.gather(self.redis.ensure_results_group(), return_exceptions=True)
+                await asyncio.sleep(backoff)
+                continue
+
+            if written < self.batch_size:
+                await asyncio.sleep(self.flush_interval)
+
+    def start(self, consumer_name: str):
+        """
+        Inicia la escritura en background.
+
+        Args:
+            consumer_name: Nombre del consumidor en el grupo (el del worker)
+        """
+        self.consumer_name = consumer_name
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._start())
+
+    async def _start(self):
+        await self.redis.ensure_results_group()
+        await self._run()
+
+    async def stop(self):
+        """
+        Detiene la escritura en background y guarda lo pendiente durante
+        STOP_TIMEOUT_SECONDS como máximo.
+        """
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        async def drain():
+            while await self.flush() > 0:
+                pass
+
+        try:
+            await asyncio.wait_for(drain(), timeout=STOP_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.warning(f"Resultados de envío sin guardar al detenerse (quedan en Redis): {str(e) or type(e).__name__}")
+
+    async def get_status(self) -> Dict:
+        """Resultados guardados, errores y resultados en Redis sin guardar"""
+        return {
+            "guardados": self.written,
+            "lotes": self.batches,
+            "errores": self.errors,
+            "ultimo_error": self.last_error,
+            "pendientes": await self.redis.get_results_backlog()
+        }
@@ -0,0 +1,100 @@
+"""
+Planificador justo de desencolado entre campañas activas
+"""
+import math
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+# Peso por defecto (campañas sin "peso" en su metadata) y rango aceptado
+DEFAULT_WEIGHT = 1.0
+MIN_WEIGHT = 0.01
+MAX_WEIGHT = 1000.0
+
+
+class CampaignScheduler:
+    """
+    Deficit round-robin (DRR) entre todas las campañas activas.
+
+    En cada ciclo el worker tiene `budget` slots libres para desencolar. Cada
+    campaña recibe, por ronda, un quantum proporcional a su peso; lo que no
+    alcanza a usar (por falta de budget) queda como déficit para el ciclo
+    siguiente. El orden de la ronda se mantiene entre ciclos, así ninguna
+    campaña espera detrás de otra más grande sin importar cuántas haya.
+    """
+
+    def __init__(self, max_quantum: int = 100):
+        """
+        Inicializa el planificador.
+
+        Args:
+            max_quantum: Máximo de mensajes por campaña y ronda (peso 1)
+        """
+        self.max_quantum = max_quantum
+        self._ring: Deque[str] = deque()
+        self._deficit: Dict[str, float] = {}
+
+    @staticmethod
+    def clamp_weight(weight: float) -> float:
+        """Peso dentro de [MIN_WEIGHT, MAX_WEIGHT] (DEFAULT_WEIGHT si no es finito)"""
+        if not math.isfinite(weight):
+            return DEFAULT_WEIGHT
+        return min(MAX_WEIGHT, max(MIN_WEIGHT, weight))
+
+    def plan(
+        self,
+        pending: Dict[str, int],
+        weights: Dict[str, float],
+        budget: int
+    ) -> List[Tuple[str, int]]:
+        """
+        Reparte `budget` mensajes entre las campañas con pendientes.
+
+        Args:
+            pending: Mensajes en cola por campaña
+            weights: Peso por campaña (default 1.0)
+            budget: Mensajes a desencolar en este ciclo
+
+        Returns:
+            Lista de tuplas (campaign_id, cantidad), en orden de servicio
+        """
+        remaining = {cid: count for cid, count in pending.items() if count > 0}
+        self._sync_ring(remaining)
+        if not remaining or budget <= 0:
+            return []
+
+        weights = {cid: self.clamp_weight(weights.get(cid, DEFAULT_WEIGHT)) for cid in remaining}
+        # Quantum pequeño con muchas campañas: todas entran en el mismo ciclo
+        quantum = min(self.max_quantum, max(1.0, budget / sum(weights.values())))
+
+        assigned: Dict[str, int] = {}
+        while budget > 0 and remaining:
+            campaign_id = self._ring[0]
+            self._ring.rotate(-1)
+            if campaign_id not in remaining:
+                continue
+
+            self._deficit[campaign_id] += quantum * weights[campaign_id]
+            take = min(int(self._deficit[campaign_id]), remaining[campaign_id], budget)
+            if take > 0:
+                assigned[campaign_id] = assigned.get(campaign_id, 0) + take
+                self._deficit[campaign_id] -= take
+                remaining[campaign_id] -= take
+                budget -= take
+
+            if remaining[campaign_id] == 0:
+                # Cola vaciada: DRR no acumula déficit para colas vacías
+                self._deficit[campaign_id] = 0.0
+                del remaining[campaign_id]
+
+        return list(assigned.items())
+
+    def _sync_ring(self, active: Dict[str, int]):
+        """Agrega campañas nuevas al final de la ronda y quita las inactivas"""
+        for campaign_id in list(self._ring):
+            if campaign_id not in active:
+                self._ring.remove(campaign_id)
+                self._deficit.pop(campaign_id, None)
+        for campaign_id in active:
+            if campaign_id not in self._deficit:
+                self._ring.append(campaign_id)
+                self._deficit[campaign_id] = 0.0
@@ -0,0 +1,77 @@
+"""
+Selección del sender de cada envío según el buzon: middleware de WhatsApp o
+directo a la Graph API de Meta
+"""
+import logging
+from typing import Dict, Optional
+
+from app.services.circuit_breaker import CircuitBreakers
+from app.services.whatsapp_service import WhatsAppService
+
+logger = logging.getLogger(__name__)
+
+
+class SenderRouter:
+    """
+    Reparte los envíos entre senders con el contrato de WhatsAppService
+    (ej: {"middleware": WhatsAppService, "graph": MetaGraphService}).
+
+    Cada buzon usa el sender de `buzon_senders` o, si no figura, el default.
+    Los mensajes con credenciales directas (sin buzon) usan el default. Cada
+    sender tiene sus propios circuitos: una caída de la Graph API no pausa
+    los buzones que envían por el middleware, ni al revés.
+    """
+
+    def __init__(
+        self,
+        senders: Dict[str, WhatsAppService],
+        default: str = "middleware",
+        buzon_senders: Optional[Dict[str, str]] = None
+    ):
+        """
+        Inicializa el router.
+
+        Args:
+            senders: Senders disponibles por nombre
+            default: Sender de los buzones sin override
+            buzon_senders: Sender por buzon, ej: {"14": "graph"}
+        """
+        buzon_senders = buzon_senders or {}
+        unknown = {default, *buzon_senders.values()} - set(senders)
+        if unknown:
+            raise ValueError(f"Senders no configurados: {', '.join(sorted(unknown))}")
+
+        self.senders = senders
+        self.default = senders[default]
+        self.buzon_senders = {buzon: senders[name] for buzon, name in buzon_senders.items()}
+
+    def sender_for(self, message_data: Dict) -> WhatsAppService:
+        """Sender del buzon del mensaje"""
+        return self.buzon_senders.get(str(message_data.get("buzon")), self.default)
+
+    async def send_message(self, credentials: Dict[str, str], message_data: Dict) -> Dict:
+        """Envía el mensaje con el sender de su buzon (ver WhatsAppService.send_message)"""
+        return await self.sender_for(message_data).send_message(credentials, message_data)
+
+    async def connect(self):
+        """Crea los clientes HTTP de todos los senders"""
+        for sender in self.senders.values():
+            await sender.connect()
+
+    async def disconnect(self):
+        """Cierra los clientes HTTP de todos los senders"""
+        for sender in self.senders.values():
+            await sender.disconnect()
+
+    def circuit_breakers_for(self, message_data: Dict) -> Optional[CircuitBreakers]:
+        """Circuitos del sender del buzon del mensaje (None si están desactivados)"""
+        return self.sender_for(message_data).circuit_breakers_for(message_data)
+
+    def get_circuit_status(self) -> Optional[Dict]:
+        """Estado de los circuitos de cada sender (None si están desactivados)"""
+        statuses = {name: sender.get_circuit_status() for name, sender in self.senders.items()}
+        return {name: status for name, status in statuses.items() if status is not None} or None
+
+    def get_http_stats(self) -> Dict:
+        """Métricas del pool HTTP de cada sender"""
+        return {name: sender.get_http_stats() for name, sender in self.senders.items()}
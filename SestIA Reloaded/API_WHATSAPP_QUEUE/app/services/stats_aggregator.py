@@ -0,0 +1,164 @@
+"""
+Agregador en memoria de resultados de envío (stats, resultados por mensaje + acks)
+"""
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+from datetime import datetime
+
+from app.services.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
+
+
+class StatsAggregator:
+    """
+    Acumula por campaña los enviados/fallidos, los reintentos a programar,
+    los resultados por mensaje a persistir y los leases a confirmar, y los
+    escribe en Redis en una sola transacción
+    cada `flush_interval_ms` o cada `flush_max_pending` mensajes (lo que
+    ocurra primero).
+
+    Reemplaza los HINCRBY/HSET/ack por mensaje del camino de envío. Si una
+    escritura falla, los resultados se conservan y se reintentan en el
+    siguiente flush, así los contadores se mantienen exactos.
+    """
+
+    def __init__(
+        self,
+        redis: RedisService,
+        flush_interval_ms: int = 250,
+        flush_max_pending: int = 500
+    ):
+        """
+        Inicializa el agregador.
+
+        Args:
+            redis: Servicio de Redis
+            flush_interval_ms: Intervalo máximo entre escrituras (retraso máximo de /api/estado-cola)
+            flush_max_pending: Mensajes acumulados que fuerzan una escritura anticipada
+        """
+        self.redis = redis
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.flush_max_pending = flush_max_pending
+
+        self._results: Dict[str, Dict] = {}
+        self._pending = 0
+        self._flush_needed = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(
+        self,
+        campaign_id: str,
+        success: bool,
+        lease_id: Optional[str] = None,
+        retry: Optional[Tuple[Dict, int]] = None,
+        outcome: Optional[Dict] = None,
+        count_retry: bool = True
+    ):
+        """
+        Registra el resultado de un mensaje (sin I/O).
+
+        Args:
+            campaign_id: ID de la campaña
+            success: True si se envió, False si falló
+            lease_id: Lease a confirmar junto con el contador (opcional)
+            retry: (mensaje, vencimiento epoch ms) si el fallo se reintenta:
+                se programa el reintento en vez de contarlo como fallido
+            outcome: Resultado del envío a persistir (ver ResultsFlusher)
+            count_retry: Sumar el reintento al contador "reintentos" (False
+                para un mensaje reprogramado sin intentar el envío)
+        """
+        result = self._results.get(campaign_id)
+        if result is None:
+            result = {
+                "enviados": 0, "fallidos": 0, "reintentos": 0, "ultimo_envio": None,
+                "retries": [], "outcomes": [], "leases": []
+            }
+            self._results[campaign_id] = result
+
+        if retry is not None:
+            result["retries"].append(retry)
+            if count_retry:
+                result["reintentos"] += 1
+        elif success:
+            result["enviados"] += 1
+            result["ultimo_envio"] = datetime.utcnow().isoformat()
+        else:
+            result["fallidos"] += 1
+        if outcome is not None:
+            result["outcomes"].append(outcome)
+        if lease_id:
+            result["leases"].append(lease_id)
+
+        self._pending += 1
+        if self._pending >= self.flush_max_pending:
+            self._flush_needed.set()
+
+    async def flush(self) -> int:
+        """
+        Escribe en Redis los resultados acumulados.
+
+        Returns:
+            Número de mensajes escritos (0 si no había nada o si falló)
+        """
+        async with self._flush_lock:
+            if not self._results:
+                return 0
+
+            results, pending = self._results, self._pending
+            self._results, self._pending = {}, 0
+            self._flush_needed.clear()
+
+            try:
+                await self.redis.apply_results(results)
+                return pending
+            except asyncio.CancelledError:
+                self._merge_back(results, pending)
+                raise
+            except Exception as e:
+                logger.error(f"Error al escribir stats acumuladas ({pending} mensajes), se reintentará: {str(e)}")
+                self._merge_back(results, pending)
+                return 0
+
+    def _merge_back(self, results: Dict[str, Dict], pending: int):
+        """Devuelve al buffer resultados que no se pudieron escribir"""
+        for campaign_id, old in results.items():
+            current = self._results.get(campaign_id)
+            if current is None:
+                self._results[campaign_id] = old
+                continue
+            current["enviados"] += old["enviados"]
+            current["fallidos"] += old["fallidos"]
+            current["reintentos"] += old["reintentos"]
+            current["ultimo_envio"] = current["ultimo_envio"] or old["ultimo_envio"]
+            current["retries"] = old["retries"] + current["retries"]
+            current["outcomes"] = old["outcomes"] + current["outcomes"]
+            current["leases"] = old["leases"] + current["leases"]
+        self._pending += pending
+
+    async def _run(self):
+        """Loop de escritura periódica"""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def start(self):
+        """Inicia la escritura periódica en background"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Detiene la escritura periódica y escribe lo pendiente"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
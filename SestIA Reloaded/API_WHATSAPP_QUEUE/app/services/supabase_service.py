@@ -1,50 +1,311 @@
 """
-Servicio para consultar credenciales de WhatsApp en Supabase
+Servicio para consultar credenciales de WhatsApp en Supabase y guardar los
+resultados de envío
 """
-from supabase import create_client, Client
+from supabase import acreate_client, AsyncClient, AsyncClientOptions
+from postgrest import ReturnMethod
+import asyncio
 import logging
-from typing import Optional, Dict
+import time
+from typing import Optional, Dict, List, AsyncIterator
 
 logger = logging.getLogger(__name__)
 
+# Esquema de la tabla instancias_inputs
+CREDENTIALS_SCHEMA = "instancia_sofia"
+
+# id para paginar (canal se repite: todos los buzones de WhatsApp son canal 14)
+CREDENTIALS_COLUMNS = "id, key, nameid, custom_name, canal"
+
+# Columnas de la tabla de resultados que se exportan (id para paginar,
+# stream_id para no repetir los que todavía siguen en Redis)
+RESULTS_COLUMNS = "id, stream_id, numero, estado, wamid, error, status_code, intento, buzon, creado_en"
+
 
 class SupabaseService:
-    """Servicio para consultar credenciales de WhatsApp desde Supabase"""
+    """
+    Servicio para consultar credenciales de WhatsApp desde Supabase.
+
+    Usa el cliente asíncrono de Supabase: una consulta lenta no bloquea el
+    event loop (envíos en vuelo y requests HTTP siguen avanzando) y cada
+    consulta tiene un timeout.
 
-    def __init__(self, supabase_url: str, supabase_key: str):
+    Las credenciales de todos los buzones se cargan en memoria con una
+    consulta paginada (start_credentials_refresh) y se refrescan en segundo
+    plano; get_credentials responde desde memoria y solo consulta Supabase
+    para buzones que no estaban en la última carga.
+    """
+
+    def __init__(
+        self,
+        supabase_url: str,
+        supabase_key: str,
+        timeout_seconds: float = 10.0,
+        refresh_interval_seconds: float = 300.0,
+        page_size: int = 1000,
+        results_table: str = "envios_resultados"
+    ):
         """
         Inicializa el servicio de Supabase.
 
         Args:
             supabase_url: URL de Supabase
             supabase_key: API Key de Supabase
+            timeout_seconds: Tiempo máximo por consulta
+            refresh_interval_seconds: Intervalo de recarga de las credenciales
+                de todos los buzones (0 = sin precarga, una consulta por buzon)
+            page_size: Filas por página en la carga de credenciales
+            results_table: Tabla de resultados de envío (esquema de credenciales)
         """
         self.supabase_url = supabase_url
         self.supabase_key = supabase_key
-        self.client: Optional[Client] = None
+        self.timeout_seconds = timeout_seconds
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.page_size = page_size
+        self.results_table = results_table
+        self.client: Optional[AsyncClient] = None
+
+        # Credenciales precargadas (custom_name -> credenciales)
+        self._credentials: Dict[str, Dict[str, str]] = {}
+        self._credentials_loaded_at: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+        # Consultas hechas a Supabase (para métricas y benchmarks)
+        self.queries = 0
 
     async def connect(self):
         """Establece conexión con Supabase"""
         if not self.client:
-            self.client = create_client(self.supabase_url, self.supabase_key)
+            self.client = await acreate_client(
+                self.supabase_url,
+                self.supabase_key,
+                options=AsyncClientOptions(
+                    # Un solo cliente PostgREST para el esquema de credenciales
+                    # (client.schema() crea un cliente HTTP nuevo en cada llamada)
+                    schema=CREDENTIALS_SCHEMA,
+                    postgrest_client_timeout=self.timeout_seconds,
+                    # Solo se usa la service key: sin sesiones de usuario que refrescar
+                    auto_refresh_token=False,
+                    persist_session=False
+                )
+            )
             logger.info("Conectado a Supabase exitosamente")
 
+    async def disconnect(self):
+        """Detiene el refresco de credenciales y cierra el cliente HTTP de Supabase"""
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
+        if self.client:
+            await self.client.postgrest.aclose()
+            self.client = None
+            logger.info("Desconectado de Supabase")
+
+    async def _execute(self, query):
+        """
+        Ejecuta una consulta PostgREST con timeout.
+
+        Raises:
+            asyncio.TimeoutError: Si la consulta supera timeout_seconds
+        """
+        self.queries += 1
+        return await asyncio.wait_for(query.execute(), timeout=self.timeout_seconds)
+
     async def health_check(self) -> bool:
         """Verifica la conexión a Supabase"""
         try:
             # Hacer una consulta simple para verificar conexión
-            result = self.client.schema("instancia_sofia").table("instancias_inputs").select("canal").limit(1).execute()
+            await self._execute(
+                self.client.table("instancias_inputs").select("canal").limit(1)
+            )
             return True
+        except asyncio.TimeoutError:
+            logger.error(f"Timeout al verificar conexión con Supabase ({self.timeout_seconds}s)")
+            return False
         except Exception as e:
             logger.error(f"Error al verificar conexión con Supabase: {str(e)}")
             return False
 
+    async def start_credentials_refresh(self):
+        """
+        Carga las credenciales de todos los buzones e inicia su refresco en
+        segundo plano cada refresh_interval_seconds.
+
+        Si la carga inicial falla se registra el error y get_credentials
+        consulta Supabase por buzon hasta que un refresco funcione.
+        """
+        if self.refresh_interval_seconds <= 0 or self._refresh_task:
+            return
+        try:
+            await self.load_all_credentials()
+        except Exception as e:
+            logger.error(f"Error al precargar credenciales: {str(e) or type(e).__name__}")
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        """Recarga las credenciales periódicamente (un error conserva la carga anterior)"""
+        while True:
+            await asyncio.sleep(self.refresh_interval_seconds)
+            try:
+                await self.load_all_credentials()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error al refrescar credenciales, se mantiene la carga anterior: {str(e) or type(e).__name__}")
+
+    async def load_all_credentials(self) -> int:
+        """
+        Carga las credenciales de todos los buzones en una consulta paginada
+        y reemplaza las credenciales en memoria.
+
+        Pagina por id (único): con un orden que no es único, como canal, las
+        páginas por offset pueden repetir u omitir filas.
+
+        Returns:
+            Buzones cargados
+        """
+        credentials: Dict[str, Dict[str, str]] = {}
+        last_id = 0
+        while True:
+            result = await self._execute(
+                self.client.table("instancias_inputs")
+                .select(CREDENTIALS_COLUMNS)
+                .gt("id", last_id)
+                .order("id")
+                .limit(self.page_size)
+            )
+            rows = result.data or []
+            for record in rows:
+                buzon_id = record.get("custom_name")
+                if not buzon_id:
+                    continue
+                try:
+                    credentials[buzon_id] = self._parse_credentials(buzon_id, record)
+                except ValueError:
+                    # Buzon mal configurado: get_credentials lo consulta y
+                    # devuelve el error al usarse
+                    continue
+            if len(rows) < self.page_size:
+                break
+            last_id = rows[-1]["id"]
+
+        self._credentials = credentials
+        self._credentials_loaded_at = time.monotonic()
+        logger.info(f"Credenciales cargadas en memoria: {len(credentials)} buzones")
+        return len(credentials)
+
+    def invalidate_credentials(self, buzon_id: str):
+        """
+        Descarta las credenciales en memoria de un buzon (ej: token rechazado):
+        la próxima consulta va a Supabase sin esperar el refresco.
+        """
+        self._credentials.pop(buzon_id, None)
+
+    async def insert_results(self, rows: List[Dict]):
+        """
+        Guarda un lote de resultados de envío en una sola request.
+
+        Idempotente: las filas cuyo stream_id ya existe se ignoran, así un
+        lote reintentado (o tomado por otra réplica) no duplica resultados.
+        No pide las filas de vuelta.
+
+        Args:
+            rows: Resultados (columnas de la tabla results_table)
+
+        Raises:
+            Exception: Si falla la escritura o supera timeout_seconds (el
+                llamador conserva el lote)
+        """
+        if not rows:
+            return
+        await self._execute(
+            self.client.table(self.results_table).upsert(
+                rows,
+                on_conflict="stream_id",
+                ignore_duplicates=True,
+                returning=ReturnMethod.minimal
+            )
+        )
+
+    async def iter_results(
+        self,
+        campaign_id: str,
+        estado: Optional[str] = None
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Resultados de envío de una campaña en orden de llegada, por páginas de
+        page_size filas.
+
+        Pagina por id (índice (campaign_id, id)): cada página cuesta lo mismo
+        sin importar cuántas filas se leyeron antes. La página siguiente se
+        pide mientras quien consume procesa la actual, así en memoria hay a lo
+        sumo dos páginas.
+
+        Args:
+            campaign_id: ID de la campaña
+            estado: Solo resultados con este estado (enviado, fallido, reintento)
+
+        Yields:
+            Lista de filas (columnas RESULTS_COLUMNS)
+        """
+        def page_after(last_id: int):
+            query = self.client.table(self.results_table).select(RESULTS_COLUMNS).eq("campaign_id", campaign_id)
+            if estado:
+                query = query.eq("estado", estado)
+            return asyncio.ensure_future(
+                self._execute(query.gt("id", last_id).order("id").limit(self.page_size))
+            )
+
+        next_page = page_after(0)
+        try:
+            while next_page:
+                rows = (await next_page).data or []
+                next_page = page_after(rows[-1]["id"]) if len(rows) == self.page_size else None
+                if rows:
+                    yield rows
+        finally:
+            if next_page:
+                next_page.cancel()
+                await asyncio.gather(next_page, return_exceptions=True)
+
+    def _parse_credentials(self, buzon_id: str, record: Dict) -> Dict[str, str]:
+        """
+        Parsea el campo 'key' ("TOKEN,PHONE_ID,WABA_ID") de una fila de
+        instancias_inputs.
+
+        Raises:
+            ValueError: Si el buzon no tiene credenciales o el formato es inválido
+        """
+        key_field = record.get("key", "")
+
+        if not key_field:
+            logger.error(f"El buzon '{buzon_id}' no tiene configurado el campo 'key'")
+            raise ValueError(f"El buzon '{buzon_id}' no tiene credenciales configuradas")
+
+        # Parsear el campo 'key': "TOKEN,PHONE_ID,WABA_ID"
+        parts = key_field.split(",")
+
+        if len(parts) < 2:
+            logger.error(f"Formato inválido del campo 'key' para buzon '{buzon_id}': {key_field}")
+            raise ValueError(f"Formato inválido de credenciales para buzon '{buzon_id}'")
+
+        return {
+            "token": parts[0].strip(),
+            "phone_id": parts[1].strip(),
+            "waba_id": parts[2].strip() if len(parts) > 2 else None,
+            "nameid": record.get("nameid", ""),
+            "custom_name": record.get("custom_name", "")
+        }
+
     async def get_credentials(self, buzon_id: str) -> Optional[Dict[str, str]]:
         """
-        Obtiene las credenciales de WhatsApp desde Supabase.
+        Obtiene las credenciales de WhatsApp de un buzon.
 
-        Consulta la tabla instancia_sofia.instancias_inputs y parsea el campo 'key'
-        que tiene el formato: "TOKEN,PHONE_ID,WABA_ID"
+        Responde desde las credenciales precargadas; si el buzon no estaba en
+        la última carga (ej: creado después) consulta la tabla
+        instancia_sofia.instancias_inputs y parsea el campo 'key' que tiene
+        el formato: "TOKEN,PHONE_ID,WABA_ID"
 
         Args:
             buzon_id: ID del canal (buzon) en Supabase
@@ -55,45 +316,37 @@ class SupabaseService:
         Raises:
             ValueError: Si el buzon_id no existe o el formato es inválido
         """
+        credentials = self._credentials.get(buzon_id)
+        if credentials is not None:
+            return credentials
+
         try:
             # Consultar tabla instancias_inputs en esquema instancia_sofia
             # Buscar por custom_name ya que buzon_id viene como nombre, no como ID numérico
-            result = self.client.schema("instancia_sofia").table("instancias_inputs") \
-                .select("key, nameid, custom_name, canal") \
-                .eq("custom_name", buzon_id) \
-                .limit(1) \
-                .execute()
+            result = await self._execute(
+                self.client.table("instancias_inputs")
+                .select(CREDENTIALS_COLUMNS)
+                .eq("custom_name", buzon_id)
+                .limit(1)
+            )
 
             if not result.data or len(result.data) == 0:
                 logger.error(f"No se encontró el buzon '{buzon_id}' en Supabase")
                 raise ValueError(f"No se encontró el buzon '{buzon_id}' en la base de datos")
 
             # Obtener el registro
-            record = result.data[0]
-            key_field = record.get("key", "")
-
-            if not key_field:
-                logger.error(f"El buzon '{buzon_id}' no tiene configurado el campo 'key'")
-                raise ValueError(f"El buzon '{buzon_id}' no tiene credenciales configuradas")
-
-            # Parsear el campo 'key': "TOKEN,PHONE_ID,WABA_ID"
-            parts = key_field.split(",")
-
-            if len(parts) < 2:
-                logger.error(f"Formato inválido del campo 'key' para buzon '{buzon_id}': {key_field}")
-                raise ValueError(f"Formato inválido de credenciales para buzon '{buzon_id}'")
+            credentials = self._parse_credentials(buzon_id, result.data[0])
 
-            credentials = {
-                "token": parts[0].strip(),
-                "phone_id": parts[1].strip(),
-                "waba_id": parts[2].strip() if len(parts) > 2 else None,
-                "nameid": record.get("nameid", ""),
-                "custom_name": record.get("custom_name", "")
-            }
+            # Disponible en memoria hasta el próximo refresco
+            if self._credentials_loaded_at is not None:
+                self._credentials[buzon_id] = credentials
 
             logger.info(f"Credenciales obtenidas para buzon '{buzon_id}': {credentials['custom_name']}")
             return credentials
 
+        except asyncio.TimeoutError:
+            logger.error(f"Timeout al obtener credenciales para buzon '{buzon_id}' ({self.timeout_seconds}s)")
+            raise ValueError(f"Timeout al consultar credenciales del buzon '{buzon_id}'")
         except Exception as e:
             if isinstance(e, ValueError):
                 raise
@@ -3,30 +3,92 @@ Servicio para enviar mensajes a la API de WhatsApp
 """
 import httpx
 import logging
-from typing import Dict, Optional, List
+import orjson
+from typing import Dict, Optional, List, Tuple
+
+from app.services.circuit_breaker import CircuitBreakers
+from app.services.http_client import HttpPoolStats, create_http_client, warm_up
 
 logger = logging.getLogger(__name__)
 
+# Respuestas HTTP que indican un problema transitorio del middleware o de Meta
+RETRYABLE_STATUS_CODES = {408, 425, 429}
+
+# Respuestas HTTP por token inválido, vencido o sin permisos
+AUTH_ERROR_STATUS_CODES = {401, 403}
+
+# Campos de variables del mensaje, en orden (variable1 a variable10)
+VARIABLE_KEYS = tuple(f"variable{i}" for i in range(1, 11))
+
+# Prefijos de payload (token + phone_id + plantilla + idioma) y destinos precompilados que se guardan
+PAYLOAD_PREFIX_CACHE_SIZE = 1024
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
 
 class WhatsAppService:
     """Servicio para enviar mensajes a la API de WhatsApp"""
 
-    def __init__(self, api_url: str):
+    def __init__(
+        self,
+        api_url: str,
+        circuit_breakers: Optional[CircuitBreakers] = None,
+        max_connections: int = 100,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        pool_timeout: float = 30.0,
+        http2: bool = False,
+        connections_per_pool: int = 10,
+        warmup_connections: int = 0
+    ):
         """
         Inicializa el servicio de WhatsApp.
 
         Args:
             api_url: URL completa del endpoint (ej: https://tu-api.railway.app/enviar-mensaje)
+            circuit_breakers: Circuitos propios del servicio y por phone_id (None = sin circuitos)
+            max_connections: Conexiones simultáneas con el middleware (debe cubrir los envíos en vuelo)
+            max_keepalive_connections: Conexiones inactivas abiertas (None = max_connections)
+            keepalive_expiry: Segundos que una conexión inactiva sigue abierta
+            connect_timeout: Tiempo máximo para abrir una conexión
+            read_timeout: Tiempo máximo esperando la respuesta del middleware
+            pool_timeout: Tiempo máximo esperando una conexión libre del pool
+            http2: Multiplexar los envíos en HTTP/2 (https)
+            connections_per_pool: Conexiones por pool interno de httpcore
+            warmup_connections: Conexiones que se abren al iniciar (0 = ninguna)
         """
         self.api_url = api_url.rstrip("/")
         self.endpoint = self.api_url  # URL ya incluye el endpoint completo
+        self._endpoint_url = httpx.URL(self.endpoint)  # Parseada una vez (httpx parsea cada URL str por request)
         self.client: Optional[httpx.AsyncClient] = None
+        self.circuit_breakers = circuit_breakers
+        self.http_options = {
+            "max_connections": max_connections,
+            "max_keepalive_connections": max_keepalive_connections,
+            "keepalive_expiry": keepalive_expiry,
+            "connect_timeout": connect_timeout,
+            "read_timeout": read_timeout,
+            "pool_timeout": pool_timeout,
+            "http2": http2,
+            "connections_per_pool": connections_per_pool
+        }
+        self.warmup_connections = warmup_connections
+        self.http_stats = HttpPoolStats()
+        self._payload_prefixes: Dict[Tuple[str, str, str, str], bytes] = {}
 
     async def connect(self):
-        """Crea el cliente HTTP asíncrono"""
+        """Crea el cliente HTTP asíncrono y precalienta conexiones con el middleware"""
         if not self.client:
-            self.client = httpx.AsyncClient(timeout=30.0)
-            logger.info(f"Cliente HTTP inicializado para API WhatsApp: {self.api_url}")
+            self.client = create_http_client(**self.http_options)
+            logger.info(
+                f"Cliente HTTP inicializado para API WhatsApp: {self.api_url} "
+                f"(conexiones: {self.http_options['max_connections']}, HTTP/2: {self.http_options['http2']})"
+            )
+            # Con HTTP/2 todos los envíos comparten una conexión
+            connections = min(1, self.warmup_connections) if self.http_options["http2"] else self.warmup_connections
+            await warm_up(self.client, self.api_url, min(connections, self.http_options["max_connections"]))
 
     async def disconnect(self):
         """Cierra el cliente HTTP"""
@@ -34,6 +96,16 @@ class WhatsAppService:
             await self.client.aclose()
             logger.info("Cliente HTTP cerrado")
 
+    @staticmethod
+    def is_retryable_status(status_code: int) -> bool:
+        """True si el código HTTP indica un fallo transitorio (reintentable)"""
+        return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+
+    @staticmethod
+    def is_auth_error_status(status_code: Optional[int]) -> bool:
+        """True si el código HTTP indica credenciales rechazadas"""
+        return status_code in AUTH_ERROR_STATUS_CODES
+
     def _extract_variables(self, message_data: Dict) -> List[str]:
         """
         Extrae las variables dinámicamente del mensaje.
@@ -50,20 +122,71 @@ class WhatsAppService:
         variables = []
 
         # Extraer hasta 10 variables (variable1 a variable10)
-        for i in range(1, 11):
-            var_key = f"variable{i}"
+        for var_key in VARIABLE_KEYS:
             var_value = message_data.get(var_key)
+            if var_value is None:
+                break
+            if var_value.__class__ is not str:
+                var_value = str(var_value)
+            var_value = var_value.strip()
 
-            # Solo agregar si tiene valor
-            if var_value is not None and str(var_value).strip():
-                variables.append(str(var_value).strip())
-            else:
-                # Si encontramos una variable vacía, dejamos de buscar
-                # (asumimos que las variables son secuenciales)
+            # Si encontramos una variable vacía, dejamos de buscar
+            # (asumimos que las variables son secuenciales)
+            if not var_value:
                 break
+            variables.append(var_value)
 
         return variables
 
+    def _payload_prefix(self, credentials: Dict[str, str], message_data: Dict) -> bytes:
+        """
+        Parte fija del payload (igual para todos los mensajes de una campaña),
+        compilada una vez por token, phone_id, plantilla e idioma.
+        """
+        key = (
+            credentials["token"],
+            credentials["phone_id"],
+            message_data["plantilla"],
+            message_data.get("idioma", "es")
+        )
+        prefix = self._payload_prefixes.get(key)
+        if prefix is None:
+            if len(self._payload_prefixes) >= PAYLOAD_PREFIX_CACHE_SIZE:
+                self._payload_prefixes.clear()
+            prefix = self._payload_prefixes[key] = self._compile_payload_prefix(*key)
+        return prefix
+
+    def _compile_payload_prefix(self, token: str, phone_id: str, plantilla: str, idioma: str) -> bytes:
+        """JSON de los campos fijos del middleware, sin la llave de cierre"""
+        return orjson.dumps({
+            "token": token,
+            "phone_id": phone_id,
+            "template_name": plantilla,
+            "idioma": idioma
+        })[:-1]
+
+    def _build_body(self, credentials: Dict[str, str], message_data: Dict) -> bytes:
+        """
+        Payload JSON del envío según la documentación de la API WhatsApp:
+        prefijo precompilado de la campaña + campos del mensaje.
+        """
+        parts = [self._payload_prefix(credentials, message_data), b',"numero":', orjson.dumps(message_data["numero"])]
+
+        # Agregar variables solo si existen
+        variables = self._extract_variables(message_data)
+        if variables:
+            parts += (b',"variables":', orjson.dumps(variables))
+
+        # Agregar URL de imagen solo si existe
+        url_imagen = message_data.get("url_imagen")
+        if url_imagen:
+            url_imagen = str(url_imagen).strip()
+            if url_imagen:
+                parts += (b',"url_imagen":', orjson.dumps(url_imagen))
+
+        parts.append(b"}")
+        return b"".join(parts)
+
     async def send_message(
         self,
         credentials: Dict[str, str],
@@ -72,80 +195,78 @@ class WhatsAppService:
         """
         Envía un mensaje a través de la API de WhatsApp.
 
+        Si el circuito del servicio o del phone_id está abierto, el mensaje
+        no se envía: el resultado es un fallo reintentable con
+        "circuit_open": True y "retry_after" (segundos hasta la próxima prueba).
+
         Args:
             credentials: Diccionario con token, phone_id
             message_data: Diccionario con los datos del mensaje (numero, plantilla, variables, etc.)
 
         Returns:
-            Diccionario con el resultado: {"success": bool, "wamid": str, "error": str}
+            Diccionario con el resultado: {"success": bool, "wamid": str, "error": str,
+            "status_code": int, "retryable": bool} (status_code None si no hubo
+            respuesta HTTP; retryable True para timeouts, errores de red, 429 y
+            5xx, False para errores del mensaje como número o plantilla inválidos)
         """
-        try:
-            # Extraer variables dinámicamente
-            variables = self._extract_variables(message_data)
-
-            # Construir payload según documentación de la API WhatsApp
-            payload = {
-                "token": credentials["token"],
-                "phone_id": credentials["phone_id"],
-                "numero": message_data["numero"],
-                "template_name": message_data["plantilla"],
-                "idioma": message_data.get("idioma", "es")
+        phone_id = credentials.get("phone_id")
+        if self.circuit_breakers and not self.circuit_breakers.allow_request(phone_id):
+            return {
+                "success": False,
+                "wamid": None,
+                "error": "Circuito abierto: envío pausado",
+                "status_code": None,
+                "retryable": True,
+                "circuit_open": True,
+                "retry_after": self.circuit_breakers.retry_after(phone_id)
             }
 
-            # Agregar variables solo si existen
-            if variables:
-                payload["variables"] = variables
+        result = await self._post_message(credentials, message_data)
+        if self.circuit_breakers:
+            self.circuit_breakers.record(phone_id, result)
+        return result
 
-            # Agregar URL de imagen solo si existe
-            url_imagen = message_data.get("url_imagen")
-            if url_imagen and str(url_imagen).strip():
-                payload["url_imagen"] = str(url_imagen).strip()
+    def circuit_breakers_for(self, message_data: Dict) -> Optional[CircuitBreakers]:
+        """Circuitos que aplican al envío del mensaje (None si están desactivados)"""
+        return self.circuit_breakers
 
-            # Enviar request a la API
-            logger.debug(f"Enviando mensaje a {message_data['numero']} con plantilla {message_data['plantilla']}")
-
-            response = await self.client.post(
-                self.endpoint,
-                json=payload,
-                headers={"Content-Type": "application/json"}
-            )
+    def get_circuit_status(self) -> Optional[Dict]:
+        """Estado de los circuitos (None si están desactivados)"""
+        if not self.circuit_breakers:
+            return None
+        return self.circuit_breakers.get_status()
 
-            # Procesar respuesta
-            if response.status_code == 200:
-                response_data = response.json()
-                wamid = response_data.get("id", response_data.get("wamid", ""))
-
-                logger.info(f"Mensaje enviado exitosamente a {message_data['numero']}: {wamid}")
-
-                return {
-                    "success": True,
-                    "wamid": wamid,
-                    "error": None
-                }
-            else:
-                # Error en el envío
-                error_msg = f"HTTP {response.status_code}"
-                try:
-                    error_data = response.json()
-                    error_msg = error_data.get("error", error_data.get("meta_error", error_msg))
-                except:
-                    error_msg = response.text[:200]
-
-                logger.warning(f"Error al enviar mensaje a {message_data['numero']}: {error_msg}")
-
-                return {
-                    "success": False,
-                    "wamid": None,
-                    "error": error_msg
-                }
+    def get_http_stats(self) -> Dict:
+        """Espera en el pool, apertura de conexiones y tiempo del middleware (ms)"""
+        return self.http_stats.get_stats()
 
+    async def _post_message(
+        self,
+        credentials: Dict[str, str],
+        message_data: Dict
+    ) -> Dict:
+        """Hace el envío y clasifica los errores de red (ver send_message)"""
+        try:
+            return await self._request(credentials, message_data)
+        except httpx.PoolTimeout:
+            error_msg = "Timeout esperando una conexión libre del pool HTTP"
+            logger.error(f"{error_msg} - {message_data['numero']}")
+            return {
+                "success": False,
+                "wamid": None,
+                "error": error_msg,
+                "status_code": None,
+                "retryable": True
+            }
         except httpx.TimeoutException:
             error_msg = "Timeout al conectar con la API de WhatsApp"
             logger.error(f"{error_msg} - {message_data['numero']}")
             return {
                 "success": False,
                 "wamid": None,
-                "error": error_msg
+                "error": error_msg,
+                "status_code": None,
+                "retryable": True
             }
         except httpx.ConnectError:
             error_msg = "No se pudo conectar con la API de WhatsApp"
@@ -153,7 +274,19 @@ class WhatsAppService:
             return {
                 "success": False,
                 "wamid": None,
-                "error": error_msg
+                "error": error_msg,
+                "status_code": None,
+                "retryable": True
+            }
+        except httpx.TransportError as e:
+            error_msg = f"Error de red con la API de WhatsApp: {type(e).__name__}"
+            logger.error(f"{error_msg} - {message_data['numero']}")
+            return {
+                "success": False,
+                "wamid": None,
+                "error": error_msg,
+                "status_code": None,
+                "retryable": True
             }
         except Exception as e:
             error_msg = f"Error inesperado: {str(e)}"
@@ -161,5 +294,60 @@ class WhatsAppService:
             return {
                 "success": False,
                 "wamid": None,
-                "error": error_msg
+                "error": error_msg,
+                "status_code": None,
+                "retryable": False
+            }
+
+    async def _request(
+        self,
+        credentials: Dict[str, str],
+        message_data: Dict
+    ) -> Dict:
+        """POST al middleware y clasificación de su respuesta"""
+        body = self._build_body(credentials, message_data)
+
+        # Enviar request a la API
+        logger.debug(f"Enviando mensaje a {message_data['numero']} con plantilla {message_data['plantilla']}")
+
+        trace = self.http_stats.trace()
+        response = await self.client.post(
+            self._endpoint_url,
+            content=body,
+            headers=JSON_HEADERS,
+            extensions={"trace": trace}
+        )
+        self.http_stats.record(trace)
+
+        # Procesar respuesta
+        if response.status_code == 200:
+            response_data = orjson.loads(response.content)
+            wamid = response_data.get("id", response_data.get("wamid", ""))
+
+            logger.info(f"Mensaje enviado exitosamente a {message_data['numero']}: {wamid}")
+
+            return {
+                "success": True,
+                "wamid": wamid,
+                "error": None,
+                "status_code": response.status_code,
+                "retryable": False
+            }
+        else:
+            # Error en el envío
+            error_msg = f"HTTP {response.status_code}"
+            try:
+                error_data = orjson.loads(response.content)
+                error_msg = error_data.get("error", error_data.get("meta_error", error_msg))
+            except:
+                error_msg = response.text[:200]
+
+            logger.warning(f"Error al enviar mensaje a {message_data['numero']}: {error_msg}")
+
+            return {
+                "success": False,
+                "wamid": None,
+                "error": error_msg,
+                "status_code": response.status_code,
+                "retryable": self.is_retryable_status(response.status_code)
             }
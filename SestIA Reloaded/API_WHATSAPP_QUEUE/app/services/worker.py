@@ -2,16 +2,39 @@
 Background worker para procesar las colas de mensajes
 """
 import asyncio
+import heapq
 import logging
-from typing import Dict, Optional
-from datetime import datetime
+import random
+import time
+from typing import Dict, List, Optional, Set
+from datetime import datetime, timezone
 
 from app.services.redis_service import RedisService
 from app.services.supabase_service import SupabaseService
 from app.services.whatsapp_service import WhatsAppService
+from app.services.stats_aggregator import StatsAggregator
+from app.services.rate_limiter import RateLimiter
+from app.services.concurrency_controller import ConcurrencyController
+from app.services.circuit_breaker import CircuitBreakers, CLOSED, merge_circuit_status
+from app.services.credential_cache import CredentialCache, SharedCredentialStore
+from app.services.scheduler import CampaignScheduler, DEFAULT_WEIGHT
+from app.services.results_flusher import ResultsFlusher
+from app.utils.message_codec import decode_message
 
 logger = logging.getLogger(__name__)
 
+# Espera máxima cuando las campañas activas no tienen mensajes para tomar
+IDLE_WAIT_MS = 500
+
+# Con control adaptativo, mensajes masivos retenidos (cola local + envíos en
+# curso) por cada envío en vuelo que admite el límite
+PREFETCH_PER_SLOT = 2
+
+# Cada cuánto publica el worker el estado de sus circuitos en Redis (para la
+# API sin worker embebido); una publicación vale por CIRCUIT_STATUS_MAX_AGE
+CIRCUIT_STATUS_INTERVAL = 5.0
+CIRCUIT_STATUS_MAX_AGE = 3 * CIRCUIT_STATUS_INTERVAL
+
 
 class WorkerService:
     """Worker background para procesar colas de mensajes de WhatsApp"""
@@ -23,7 +46,21 @@ class WorkerService:
         whatsapp: WhatsAppService,
         delay_ms: int,
         batch_size: int = 100,
-        max_concurrent_batches: int = 5
+        max_concurrent_batches: int = 5,
+        consumer_name: str = "worker",
+        lease_reap_interval: float = 15.0,
+        stats_flush_interval_ms: int = 250,
+        stats_flush_max_pending: int = 500,
+        concurrency: Optional[int] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        concurrency_controller: Optional[ConcurrencyController] = None,
+        priority_concurrency: int = 20,
+        retry_max_attempts: int = 5,
+        retry_base_delay_ms: int = 2000,
+        retry_max_delay_ms: int = 300000,
+        credentials_ttl_seconds: float = 300.0,
+        shared_credentials: Optional[SharedCredentialStore] = None,
+        results_flusher: Optional[ResultsFlusher] = None
     ):
         """
         Inicializa el worker.
@@ -34,7 +71,27 @@ class WorkerService:
             whatsapp: Servicio de WhatsApp
             delay_ms: Delay en milisegundos entre lotes
             batch_size: Cantidad de mensajes por lote
-            max_concurrent_batches: Número máximo de lotes en paralelo
+            max_concurrent_batches: Número de lotes en paralelo (define la concurrencia por defecto)
+            consumer_name: Nombre del consumidor en los leases (ID de instancia)
+            lease_reap_interval: Segundos entre pasadas del reaper de leases vencidos
+            stats_flush_interval_ms: Intervalo máximo entre escrituras de stats acumuladas
+            stats_flush_max_pending: Mensajes acumulados que fuerzan escribir stats
+            concurrency: Envíos simultáneos (default: batch_size * max_concurrent_batches)
+            rate_limiter: Límite de envíos por phone_id (None = sin límite)
+            concurrency_controller: Límite adaptativo de envíos en vuelo
+                (None = siempre `concurrency`)
+            priority_concurrency: Envíos simultáneos reservados para campañas
+                prioritarias (mensajes individuales)
+            retry_max_attempts: Reintentos máximos por mensaje ante fallos
+                transitorios (0 = sin reintentos)
+            retry_base_delay_ms: Espera antes del primer reintento (se duplica en cada intento)
+            retry_max_delay_ms: Espera máxima entre reintentos
+            credentials_ttl_seconds: Vigencia de las credenciales en cache por
+                buzon (0 = sin vencimiento)
+            shared_credentials: Cache de credenciales cifrado en Redis,
+                compartido entre réplicas (None = solo memoria)
+            results_flusher: Guarda en Supabase el resultado de cada envío
+                (None = los resultados solo quedan en el log)
         """
         self.redis = redis
         self.supabase = supabase
@@ -42,9 +99,63 @@ class WorkerService:
         self.delay_ms = delay_ms
         self.batch_size = batch_size
         self.max_concurrent_batches = max_concurrent_batches
+        self.concurrency = concurrency or batch_size * max_concurrent_batches
+        self.rate_limiter = rate_limiter
+        self.concurrency_controller = concurrency_controller
+        self.priority_concurrency = priority_concurrency
+        self.retry_max_attempts = retry_max_attempts
+        self.retry_base_delay = retry_base_delay_ms / 1000.0
+        self.retry_max_delay = retry_max_delay_ms / 1000.0
+        self.results_flusher = results_flusher
+        self.consumer_name = consumer_name
+        self.lease_reap_interval = lease_reap_interval
+        self._last_reap = 0.0
+
+        # Reparto justo del desencolado entre campañas activas
+        self.scheduler = CampaignScheduler(max_quantum=batch_size)
+
+        # Stats y acks acumulados en memoria, escritos por lotes
+        self.stats = StatsAggregator(
+            redis=redis,
+            flush_interval_ms=stats_flush_interval_ms,
+            flush_max_pending=stats_flush_max_pending
+        )
+
+        # Cache de credenciales en memoria (buzon_id -> credentials), con TTL
+        # y una sola consulta a Supabase por buzon aunque falten a la vez
+        self._credentials_cache = CredentialCache(
+            loader=lambda buzon_id: self.supabase.get_credentials(buzon_id),
+            ttl_seconds=credentials_ttl_seconds,
+            shared=shared_credentials
+        )
+
+        # Cache de metadata de campañas activas (campaign_id -> metadata)
+        self._metadata_cache: Dict[str, Dict] = {}
+
+        # Avisos de campañas encoladas (pub/sub), por registro
+        self._enqueued = asyncio.Event()
+        self._priority_enqueued = asyncio.Event()
+
+        # Avisos de las tareas de envío al tomar o terminar un mensaje (hay
+        # lugar para desencolar más), por carril
+        self._slot_freed = asyncio.Event()
+        self._priority_slot_freed = asyncio.Event()
+
+        # Tareas de envío masivo con un mensaje tomado (esperando turno, slot
+        # o respuesta)
+        self._busy_senders = 0
+
+        # Vencimientos de reintentos (time.monotonic): el próximo según Redis y
+        # los programados por esta réplica (heap)
+        self._next_retry_check: Optional[float] = None
+        self._retry_dues: List[float] = []
+        self._retry_scheduled = asyncio.Event()
 
-        # Cache de credenciales en memoria (buzon_id -> credentials)
-        self._credentials_cache: Dict[str, Dict] = {}
+        # Mensajes tomados y todavía sin terminar (lease_id -> campaign_id),
+        # cuyos leases se renuevan, y los que se perdieron igual (otra réplica
+        # ya los tomó: no se envían)
+        self._held: Dict[str, str] = {}
+        self._lost_leases: Set[str] = set()
 
         # Estado del worker
         self.is_running = False
@@ -54,31 +165,42 @@ class WorkerService:
         """
         Obtiene credenciales con cache en memoria.
 
+        Si no están en cache (o vencieron) se consultan en Supabase; los
+        mensajes simultáneos del mismo buzon esperan esa única consulta.
+
         Args:
             buzon_id: ID del buzon
 
         Returns:
             Diccionario con credenciales o None si hay error
         """
-        # Verificar si ya está en cache
-        if buzon_id in self._credentials_cache:
-            logger.debug(f"Credenciales obtenidas de cache para buzon '{buzon_id}'")
-            return self._credentials_cache[buzon_id]
-
-        # Si no está en cache, consultar Supabase
         try:
-            credentials = await self.supabase.get_credentials(buzon_id)
-            if credentials:
-                # Guardar en cache
-                self._credentials_cache[buzon_id] = credentials
-                logger.info(f"Credenciales cacheadas para buzon '{buzon_id}'")
-                return credentials
-            return None
+            return await self._credentials_cache.get_or_load(buzon_id)
         except Exception as e:
             logger.error(f"Error al obtener credenciales para buzon '{buzon_id}': {str(e)}")
             return None
 
-    async def process_message(self, campaign_id: str, message: Dict) -> bool:
+    async def invalidate_credentials(self, buzon_id: str):
+        """
+        Descarta las credenciales de un buzon en esta réplica (cache y
+        precarga de Supabase) y, con cache compartido, en Redis y en las
+        demás réplicas (aviso por pub/sub).
+
+        Args:
+            buzon_id: ID del buzon
+        """
+        self._credentials_cache.invalidate(buzon_id)
+        self.supabase.invalidate_credentials(buzon_id)
+        if self._credentials_cache.shared:
+            await self._credentials_cache.shared.invalidate(buzon_id)
+
+    async def process_message(
+        self,
+        campaign_id: str,
+        message: Dict,
+        lease_id: Optional[str] = None,
+        priority: bool = False
+    ) -> bool:
         """
         Procesa un mensaje individual.
 
@@ -86,13 +208,105 @@ class WorkerService:
         1. Credenciales directas: Si el mensaje incluye 'token' y 'phone_id', los usa directamente
         2. Credenciales desde Supabase: Si el mensaje incluye 'buzon', consulta Supabase
 
+        El resultado se acumula en el agregador de stats y, si el mensaje llegó
+        con lease, el ack se escribe en la misma transacción que el contador.
+        Si el proceso muere o la tarea se cancela antes, no hay ack: el lease
+        vence y el mensaje vuelve a la cola.
+
+        Los fallos transitorios (timeout, error de red, 429, 5xx) no se cuentan
+        como fallidos mientras queden intentos: el mensaje se programa en la
+        cola de reintentos de la campaña con backoff exponencial. Un mensaje
+        no enviado por circuito abierto se reprograma para cuando el circuito
+        admita pruebas, sin gastar un intento.
+
+        Con results_flusher, el resultado de cada intento (enviado, fallido o
+        reintento) viaja con el contador y se guarda después en Supabase.
+
         Args:
             campaign_id: ID de la campaña
             message: Datos del mensaje
+            lease_id: Lease del mensaje en vuelo (None si se desencoló sin lease)
+            priority: Mensaje del carril prioritario (usa la concurrencia reservada)
 
         Returns:
             True si fue exitoso, False si falló
         """
+        result = await self._send(campaign_id, message, priority)
+        success = result["success"]
+
+        attempt = int(message.get("intentos") or 0) + 1
+        if result.get("circuit_open"):
+            delay = max(result.get("retry_after") or 0.0, self.retry_base_delay) * random.uniform(1.0, 1.5)
+            retry = (message, int((time.time() + delay) * 1000))
+            # Sin intento de envío: no suma al contador de reintentos
+            self.stats.record(campaign_id, False, lease_id, retry=retry, count_retry=False)
+            self._schedule_retry_check(delay)
+        elif not success and result.get("retryable") and attempt <= self.retry_max_attempts:
+            delay = self.retry_delay(attempt)
+            retry = (dict(message, intentos=attempt), int((time.time() + delay) * 1000))
+            outcome = self._outcome(campaign_id, message, result, attempt, "reintento")
+            self.stats.record(campaign_id, False, lease_id, retry=retry, outcome=outcome)
+            self._schedule_retry_check(delay)
+            logger.info(
+                f"[{campaign_id}] Reintento {attempt}/{self.retry_max_attempts} de "
+                f"{message.get('numero')} en {delay:.1f}s"
+            )
+        else:
+            outcome = self._outcome(campaign_id, message, result, attempt, "enviado" if success else "fallido")
+            self.stats.record(campaign_id, success, lease_id, outcome=outcome)
+        return success
+
+    def _outcome(self, campaign_id: str, message: Dict, result: Dict, attempt: int, estado: str) -> Optional[Dict]:
+        """
+        Resultado de un intento de envío para guardar en Supabase (None si no
+        se guardan resultados).
+
+        Args:
+            campaign_id: ID de la campaña
+            message: Datos del mensaje
+            result: Resultado de WhatsAppService.send_message
+            attempt: Número de intento (1 = primer envío)
+            estado: enviado, fallido (definitivo) o reintento
+        """
+        if not self.results_flusher:
+            return None
+        error = result.get("error")
+        return {
+            "campaign_id": campaign_id,
+            "numero": message.get("numero"),
+            "estado": estado,
+            "wamid": result.get("wamid"),
+            "error": str(error)[:500] if error is not None else None,
+            "status_code": result.get("status_code"),
+            "intento": attempt,
+            "buzon": message.get("buzon"),
+            "creado_en": datetime.now(timezone.utc).isoformat()
+        }
+
+    def retry_delay(self, attempt: int) -> float:
+        """
+        Espera antes del reintento número `attempt`: backoff exponencial con
+        jitter (entre la mitad y el total del backoff), así los mensajes que
+        fallaron juntos no se reintentan todos en el mismo instante.
+
+        Args:
+            attempt: Número de reintento (1 = primero)
+
+        Returns:
+            Segundos de espera
+        """
+        backoff = min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempt - 1))
+        return backoff * random.uniform(0.5, 1.0)
+
+    async def _send(self, campaign_id: str, message: Dict, priority: bool = False) -> Dict:
+        """
+        Obtiene credenciales y envía el mensaje.
+
+        Returns:
+            Resultado de WhatsAppService.send_message (o un fallo no
+            reintentable si el mensaje no tiene credenciales)
+        """
+        failed = {"success": False, "wamid": None, "error": None, "status_code": None, "retryable": False}
         try:
             credentials = None
 
@@ -111,7 +325,7 @@ class WorkerService:
                 credentials = await self.get_cached_credentials(buzon_id)
                 if not credentials:
                     logger.error(f"No se pudieron obtener credenciales para buzon '{buzon_id}'")
-                    return False
+                    return dict(failed, error=f"Sin credenciales para el buzon '{buzon_id}'")
                 logger.debug(f"[{campaign_id}] Usando credenciales de Supabase (buzon: {buzon_id})")
 
             # Error: Sin credenciales
@@ -120,32 +334,66 @@ class WorkerService:
                     f"Mensaje sin credenciales en campaña '{campaign_id}': "
                     f"No tiene 'buzon' ni ('token' + 'phone_id')"
                 )
-                return False
+                return dict(failed, error="Mensaje sin 'buzon' ni 'token' + 'phone_id'")
+
+            # Circuito abierto (del sender del buzon o del phone_id): no gastar
+            # turno de envío ni llamar a la API
+            phone_id = credentials.get("phone_id")
+            circuit_breakers = self.circuit_breakers_for(message)
+            if circuit_breakers and circuit_breakers.is_open(phone_id):
+                return dict(
+                    failed,
+                    error="Circuito abierto: envío pausado",
+                    retryable=True,
+                    circuit_open=True,
+                    retry_after=circuit_breakers.retry_after(phone_id)
+                )
 
-            # Enviar mensaje
-            result = await self.whatsapp.send_message(credentials, message)
+            # Esperar turno del número emisor (límite de Meta por phone_id)
+            if self.rate_limiter:
+                await self.rate_limiter.acquire(credentials.get("phone_id"), message.get("buzon"), priority)
+
+            # Enviar mensaje (las masivas dentro del límite adaptativo de envíos
+            # en vuelo; las prioritarias ya tienen su concurrencia reservada)
+            if self.concurrency_controller and not priority:
+                async with self.concurrency_controller.slot():
+                    started = time.monotonic()
+                    result = await self.whatsapp.send_message(credentials, message)
+                    if not result.get("circuit_open"):
+                        self.concurrency_controller.record(time.monotonic() - started, result)
+            else:
+                result = await self.whatsapp.send_message(credentials, message)
+
+            # Token rechazado: descartar las credenciales en cache del buzon
+            # (en todas las réplicas) para que los próximos envíos las vuelvan
+            # a consultar
+            if (
+                message.get("buzon")
+                and not message.get("token")
+                and WhatsAppService.is_auth_error_status(result.get("status_code"))
+                and self._credentials_cache.invalidate(message["buzon"], credentials)
+            ):
+                logger.warning(
+                    f"[{campaign_id}] Error de autenticación ({result['status_code']}) con las "
+                    f"credenciales del buzon '{message['buzon']}': se descartan del cache"
+                )
+                await self.invalidate_credentials(message["buzon"])
 
             if result["success"]:
-                # Incrementar contador de exitosos
-                await self.redis.increment_sent(campaign_id)
                 logger.info(
                     f"[{campaign_id}] Mensaje enviado: {message['numero']} - "
                     f"WAMID: {result['wamid']}"
                 )
-                return True
             else:
-                # Incrementar contador de fallidos
-                await self.redis.increment_failed(campaign_id)
                 logger.warning(
                     f"[{campaign_id}] Mensaje fallido: {message['numero']} - "
                     f"Error: {result['error']}"
                 )
-                return False
+            return result
 
         except Exception as e:
             logger.error(f"Error al procesar mensaje en campaña '{campaign_id}': {str(e)}")
-            await self.redis.increment_failed(campaign_id)
-            return False
+            return dict(failed, error=f"Error al procesar mensaje: {str(e)}")
 
     async def process_batch(self, campaign_id: str, messages: list) -> dict:
         """
@@ -153,7 +401,7 @@ class WorkerService:
 
         Args:
             campaign_id: ID de la campaña
-            messages: Lista de mensajes a procesar
+            messages: Lista de tuplas (lease_id, mensaje) a procesar
 
         Returns:
             Dict con estadísticas: {"success": int, "failed": int}
@@ -164,7 +412,7 @@ class WorkerService:
         logger.info(f"[{campaign_id}] Procesando lote de {len(messages)} mensajes en paralelo")
 
         # Crear tareas para todos los mensajes del lote
-        tasks = [self.process_message(campaign_id, msg) for msg in messages]
+        tasks = [self.process_message(campaign_id, msg, lease_id) for lease_id, msg in messages]
 
         # Ejecutar todas las tareas en paralelo
         results = await asyncio.gather(*tasks, return_exceptions=True)
@@ -181,98 +429,611 @@ class WorkerService:
 
     async def dequeue_batch(self, campaign_id: str, size: int) -> list:
         """
-        Desencola un lote de mensajes de una campaña.
+        Desencola un lote de mensajes de una campaña en un solo round trip.
+
+        Los mensajes quedan en vuelo con lease hasta que se procesan. Las
+        filas en formato compacto se reconstruyen con la metadata de la
+        campaña (plantilla, buzon, idioma); las que no se pueden decodificar
+        se cuentan como fallidas y se confirman.
 
         Args:
             campaign_id: ID de la campaña
             size: Tamaño del lote
 
         Returns:
-            Lista de mensajes (puede ser menor a size si no hay suficientes)
+            Lista de tuplas (lease_id, mensaje) (puede ser menor a size si no hay suficientes)
+        """
+        leased = await self.redis.lease_messages(campaign_id, size, self.consumer_name)
+        return await self._decode_batch(campaign_id, leased)
+
+    async def _decode_batch(self, campaign_id: str, leased: list) -> list:
+        """
+        Reconstruye los mensajes recién tomados con la metadata de la campaña;
+        los que no se pueden decodificar se cuentan como fallidos y se
+        confirman.
         """
+        if not leased:
+            return leased
+
+        metadata = None
+        if any(not isinstance(item, dict) for _, item in leased):
+            metadata = await self.get_cached_metadata(campaign_id)
+
         batch = []
-        for _ in range(size):
-            message = await self.redis.dequeue_message(campaign_id)
-            if message:
-                batch.append(message)
-            else:
-                break
+        for lease_id, item in leased:
+            try:
+                batch.append((lease_id, decode_message(item, metadata)))
+            except ValueError as e:
+                logger.error(f"[{campaign_id}] Mensaje descartado: {str(e)}")
+                self.stats.record(campaign_id, False, lease_id)
         return batch
 
+    async def get_campaign_weight(self, campaign_id: str) -> float:
+        """
+        Peso de la campaña en el reparto entre campañas ("peso" en su
+        metadata, default 1.0).
+
+        Args:
+            campaign_id: ID de la campaña
+
+        Returns:
+            Peso de la campaña
+        """
+        metadata = await self.get_cached_metadata(campaign_id) or {}
+        try:
+            return float(metadata.get("peso") or DEFAULT_WEIGHT)
+        except ValueError:
+            return DEFAULT_WEIGHT
+
+    async def get_campaign_phone_id(self, campaign_id: str) -> Optional[str]:
+        """
+        phone_id de una campaña según las credenciales en cache de su buzon.
+
+        Args:
+            campaign_id: ID de la campaña
+
+        Returns:
+            phone_id o None si la campaña no tiene buzon o sus credenciales no
+            están en cache (mensajes con credenciales directas)
+        """
+        metadata = await self.get_cached_metadata(campaign_id) or {}
+        credentials = self._credentials_cache.get(metadata.get("buzon") or "")
+        return credentials.get("phone_id") if credentials else None
+
+    def circuit_breakers_for(self, message: Dict) -> Optional[CircuitBreakers]:
+        """
+        Circuitos del sender que envía el mensaje (cada sender tiene los
+        suyos; ver SenderRouter).
+
+        Returns:
+            Circuitos del sender o None si el cliente no tiene circuitos
+        """
+        circuit_breakers_for = getattr(self.whatsapp, "circuit_breakers_for", None)
+        return circuit_breakers_for(message) if circuit_breakers_for else None
+
+    async def is_campaign_paused(self, campaign_id: str) -> bool:
+        """
+        True si la campaña no puede enviar ahora: el circuito del sender de
+        su buzon o el de su phone_id está abierto. Las campañas de otros
+        senders siguen enviando.
+
+        Args:
+            campaign_id: ID de la campaña
+        """
+        circuit_breakers = self.circuit_breakers_for(await self.get_cached_metadata(campaign_id) or {})
+        if not circuit_breakers:
+            return False
+        return circuit_breakers.is_open(await self.get_campaign_phone_id(campaign_id))
+
+    async def get_cached_metadata(self, campaign_id: str) -> Optional[Dict]:
+        """
+        Obtiene la metadata de una campaña con cache en memoria.
+
+        La entrada se descarta cuando la campaña se vacía, así una campaña
+        nueva con el mismo ID vuelve a leer su metadata.
+
+        Args:
+            campaign_id: ID de la campaña
+
+        Returns:
+            Diccionario con la metadata o None si no existe
+        """
+        if campaign_id in self._metadata_cache:
+            return self._metadata_cache[campaign_id]
+
+        metadata = await self.redis.get_campaign_metadata(campaign_id)
+        if metadata:
+            self._metadata_cache[campaign_id] = metadata
+        else:
+            logger.error(f"Campaña '{campaign_id}' sin metadata: no se pueden reconstruir sus mensajes")
+        return metadata
+
+    async def reap_expired_leases(self, force: bool = False) -> int:
+        """
+        Devuelve a la cola los mensajes con lease vencido (de cualquier réplica).
+
+        Se ejecuta como máximo una vez cada `lease_reap_interval` segundos.
+
+        Args:
+            force: Ejecutar aunque no haya pasado el intervalo
+
+        Returns:
+            Número de mensajes devueltos a las colas
+        """
+        now = time.monotonic()
+        if not force and now - self._last_reap < self.lease_reap_interval:
+            return 0
+        self._last_reap = now
+        return await self.redis.requeue_expired_leases()
+
     async def start_worker(self):
         """
-        Inicia el worker background con procesamiento paralelo en lotes.
+        Inicia el worker background con un pipeline continuo de envío.
 
-        Loop infinito que:
-        1. Obtiene campañas activas
-        2. Desencola lotes de mensajes
-        3. Procesa lotes en paralelo (asyncio.gather)
-        4. Procesa múltiples campañas simultáneamente
-        5. Aplica delay configurable entre ciclos (opcional)
+        - Un desencolador precarga lotes (con lease) de todas las campañas
+          activas en una cola local acotada, repartiendo el espacio con
+          deficit round-robin según el peso de cada campaña
+        - Un pool fijo de `concurrency` tareas de envío toma el siguiente
+          mensaje apenas se libera un slot, así un envío lento (timeout)
+          ocupa un solo slot en vez de frenar el ciclo completo
+        - La cola local se llena como máximo hasta `concurrency` mensajes
+          (backpressure: no se desencola más de lo que se puede enviar); con
+          control adaptativo, lo retenido se limita a PREFETCH_PER_SLOT veces
+          su límite actual
+        - Las campañas prioritarias (mensajes individuales) tienen su propio
+          desencolador y `priority_concurrency` tareas de envío reservadas, así
+          nunca esperan detrás de una campaña masiva
+        - Los leases de los mensajes retenidos (cola local, rate limiter, slot
+          de envío) se renuevan hasta terminar, así una espera local más larga
+          que el lease no devuelve el mensaje a la cola
+        - Sin campañas, los desencoladores esperan el aviso de encolado
+          (pub/sub) en vez de consultar Redis: el primer envío sale apenas se
+          encola en cualquier réplica
         """
         self.is_running = True
         logger.info(
             f"Worker iniciado - Batch: {self.batch_size}, Concurrent: {self.max_concurrent_batches}, "
-            f"Delay: {self.delay_ms}ms - Instancia: {self.start_time.isoformat()}"
+            f"Envíos simultáneos: {self.concurrency} (+{self.priority_concurrency} prioritarios), "
+            f"Delay: {self.delay_ms}ms - "
+            f"Instancia: {self.start_time.isoformat()}"
         )
 
-        consecutive_empty_cycles = 0
-        max_empty_cycles = 10
+        self.stats.start()
+        if self.results_flusher:
+            self.results_flusher.start(self.consumer_name)
+        send_queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+        priority_queue: asyncio.Queue = asyncio.Queue(maxsize=self.priority_concurrency)
+        senders = [
+            asyncio.create_task(self._sender_loop(send_queue))
+            for _ in range(self.concurrency)
+        ] + [
+            asyncio.create_task(self._sender_loop(priority_queue, priority=True))
+            for _ in range(self.priority_concurrency)
+        ]
+        priority_dequeuer = asyncio.create_task(self._priority_dequeue_loop(priority_queue))
+        listener = asyncio.create_task(self._enqueue_listener_loop())
+        retry_promoter = asyncio.create_task(self._retry_loop())
+        lease_renewer = asyncio.create_task(self._lease_renewal_loop())
+        background = [priority_dequeuer, listener, retry_promoter, lease_renewer]
+        if self._credentials_cache.shared:
+            background.append(asyncio.create_task(self._credentials_invalidation_loop()))
+        if self.get_circuit_status() is not None:
+            background.append(asyncio.create_task(self._circuit_status_loop()))
 
         try:
-            while self.is_running:
-                # Obtener campañas activas (con mensajes pendientes)
-                campaigns = await self.redis.get_active_campaigns()
+            await self._dequeue_loop(send_queue)
+
+        except asyncio.CancelledError:
+            logger.info("Worker detenido por cancelación")
+            self.is_running = False
+        except Exception as e:
+            logger.error(f"Error crítico en worker: {str(e)}", exc_info=True)
+            self.is_running = False
+            raise
+        finally:
+            # Los mensajes en la cola local o en envío quedan sin ack: su lease
+            # vence y vuelven a la cola de Redis
+            for task in (*background, *senders):
+                task.cancel()
+            await asyncio.gather(*background, *senders, return_exceptions=True)
+            self._held.clear()
+            self._lost_leases.clear()
+
+            # Escribir stats y acks acumulados antes de salir (y después
+            # guardar los resultados que quedaron en Redis)
+            await self.stats.stop()
+            if self.results_flusher:
+                await self.results_flusher.stop()
+
+    async def _dequeue_loop(self, send_queue: asyncio.Queue):
+        """
+        Desencola lotes de las campañas activas y los entrega al pool de envío.
+
+        Args:
+            send_queue: Cola local que consumen las tareas de envío
+        """
+        while self.is_running:
+            try:
+                # Desencolar solo cuando haya espacio para al menos un lote
+                await self._wait_for_prefetch_room(send_queue)
+
+                # Recuperar mensajes de workers caídos (lease vencido sin ack)
+                await self.reap_expired_leases()
+
+                # Obtener campañas activas (con mensajes pendientes) desde el registro.
+                # Los avisos que lleguen desde aquí vuelven a despertar el ciclo.
+                self._enqueued.clear()
+                counts = await self.redis.get_queue_counts_by_campaign()
+                campaigns = [cid for cid, (queued, _) in counts.items() if queued > 0]
+
+                # Dar de baja campañas registradas sin pendientes (las que solo
+                # tienen mensajes en vuelo o reintentos siguen registradas pero no
+                # entran en el reparto)
+                for campaign_id, (_, pending) in counts.items():
+                    if pending == 0:
+                        await self.redis.deactivate_campaign(campaign_id)
+                        self._metadata_cache.pop(campaign_id, None)
 
                 if not campaigns:
-                    consecutive_empty_cycles += 1
-
-                    # Si no hay campañas, hacer un sleep más largo
-                    if consecutive_empty_cycles >= max_empty_cycles:
-                        logger.debug("No hay campañas activas. Esperando...")
-                        await asyncio.sleep(5)  # 5 segundos si no hay nada que hacer
-                        consecutive_empty_cycles = 0
-                    else:
-                        await asyncio.sleep(1)
+                    logger.debug("No hay campañas activas. Esperando aviso de encolado...")
+                    await self._wait_for_enqueue(self._enqueued)
                     continue
 
-                # Reset contador si hay campañas
-                consecutive_empty_cycles = 0
-
-                logger.debug(f"Procesando {len(campaigns)} campañas activas: {campaigns}")
-
-                # Procesar múltiples campañas en paralelo
-                campaign_tasks = []
-                
-                for campaign_id in campaigns[:self.max_concurrent_batches]:
-                    # Desencolar un lote de mensajes
-                    batch = await self.dequeue_batch(campaign_id, self.batch_size)
-                    
-                    if batch:
-                        # Crear tarea para procesar el lote
-                        task = self.process_batch(campaign_id, batch)
-                        campaign_tasks.append(task)
-                    else:
-                        logger.debug(f"Campaña '{campaign_id}' sin mensajes pendientes")
-
-                # Ejecutar todos los lotes en paralelo
-                if campaign_tasks:
-                    await asyncio.gather(*campaign_tasks, return_exceptions=True)
-                    
+                logger.debug(f"Desencolando de {len(campaigns)} campañas activas: {campaigns}")
+
+                # Campañas cuyo sender o phone_id tiene el circuito abierto
+                # quedan en pausa; las de un sender que prueba su recuperación
+                # (semiabierto) comparten solo los envíos de prueba
+                schedulable = {}
+                probes = {}
+                for campaign_id in campaigns:
+                    if await self.is_campaign_paused(campaign_id):
+                        continue
+                    queued = counts[campaign_id][0]
+                    circuit_breakers = self.circuit_breakers_for(await self.get_cached_metadata(campaign_id) or {})
+                    if circuit_breakers and circuit_breakers.service.state != CLOSED:
+                        left = probes.setdefault(circuit_breakers, circuit_breakers.service.half_open_max_calls)
+                        queued = min(queued, left)
+                        probes[circuit_breakers] = left - queued
+                    if queued > 0:
+                        schedulable[campaign_id] = queued
+
+                # Repartir el espacio libre entre todas las campañas (DRR con pesos)
+                weights = {cid: await self.get_campaign_weight(cid) for cid in schedulable}
+                budget = self._prefetch_room(send_queue)
+                plan = self.scheduler.plan(schedulable, weights, budget)
+
+                dequeued = 0
+                for campaign_id, count in plan:
+                    # Desencolar la parte asignada a la campaña
+                    batch = await self.dequeue_batch(campaign_id, count)
+
+                    # Entregar al pool
+                    await self._hand_off(send_queue, campaign_id, batch)
+                    dequeued += len(batch)
+
+                    # Lote incompleto: la cola se vació, retirar del registro
+                    if len(batch) < count:
+                        await self.redis.deactivate_campaign(campaign_id)
+                        self._metadata_cache.pop(campaign_id, None)
+
+                if dequeued:
                     # Aplicar delay configurable entre ciclos (si está configurado)
                     if self.delay_ms > 0:
                         await asyncio.sleep(self.delay_ms / 1000.0)
+                elif schedulable:
+                    # Todo en vuelo o reprogramado: esperar en Redis la próxima
+                    # entrada (XREADGROUP BLOCK en streams; pausa en listas)
+                    waited = await self.redis.wait_for_messages(
+                        list(schedulable),
+                        max(1, budget // len(schedulable)),
+                        self.consumer_name,
+                        IDLE_WAIT_MS
+                    )
+                    for campaign_id, leased in waited.items():
+                        await self._hand_off(send_queue, campaign_id, await self._decode_batch(campaign_id, leased))
                 else:
-                    # Pequeño delay si no hay mensajes para procesar
-                    await asyncio.sleep(0.5)
+                    # Campañas en pausa por circuito abierto
+                    await asyncio.sleep(IDLE_WAIT_MS / 1000.0)
 
-        except asyncio.CancelledError:
-            logger.info("Worker detenido por cancelación")
-            self.is_running = False
-        except Exception as e:
-            logger.error(f"Error crítico en worker: {str(e)}", exc_info=True)
-            self.is_running = False
-            raise
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en desencolado: {str(e)}", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def _priority_dequeue_loop(self, priority_queue: asyncio.Queue):
+        """
+        Desencola las campañas prioritarias en orden de llegada y las entrega
+        a las tareas de envío reservadas.
+
+        Sin mensajes prioritarios espera el aviso de encolado (pub/sub).
+
+        Args:
+            priority_queue: Cola local que consumen las tareas de envío prioritarias
+        """
+        while self.is_running:
+            try:
+                await self._wait_for_room(priority_queue, 1, self._priority_slot_freed)
+                room = priority_queue.maxsize - priority_queue.qsize()
+
+                self._priority_enqueued.clear()
+                counts = await self.redis.get_queue_counts_by_campaign(priority=True)
+
+                dequeued = 0
+                paused = False
+                for campaign_id, (queued, pending) in counts.items():
+                    if room <= 0:
+                        break
+                    # Sender o phone_id con el circuito abierto: queda en cola
+                    if queued > 0 and await self.is_campaign_paused(campaign_id):
+                        paused = True
+                        continue
+                    count = min(queued, room)
+                    batch = await self.dequeue_batch(campaign_id, count) if count > 0 else []
+
+                    await self._hand_off(priority_queue, campaign_id, batch)
+                    dequeued += len(batch)
+                    room -= len(batch)
+
+                    # Cola vaciada: retirar del registro de prioritarias
+                    if len(batch) < count or pending == 0:
+                        await self.redis.deactivate_campaign(campaign_id, priority=True)
+                        self._metadata_cache.pop(campaign_id, None)
+
+                if paused and not dequeued:
+                    # Volver a revisar los circuitos sin esperar un aviso de encolado
+                    await asyncio.sleep(IDLE_WAIT_MS / 1000.0)
+                elif not dequeued:
+                    await self._wait_for_enqueue(self._priority_enqueued)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en desencolado prioritario: {str(e)}", exc_info=True)
+                await asyncio.sleep(1)
+
+    def _prefetch_limit(self, send_queue: asyncio.Queue) -> int:
+        """
+        Mensajes masivos que el worker puede retener: la cola local completa
+        o, con control adaptativo, PREFETCH_PER_SLOT por envío que admite su
+        límite actual (si el límite baja, se desencola menos).
+        """
+        if not self.concurrency_controller:
+            return send_queue.maxsize
+        return min(send_queue.maxsize, PREFETCH_PER_SLOT * self.concurrency_controller.limit)
+
+    def _prefetch_room(self, send_queue: asyncio.Queue) -> int:
+        """Mensajes masivos que se pueden desencolar ahora"""
+        room = send_queue.maxsize - send_queue.qsize()
+        if self.concurrency_controller:
+            held = send_queue.qsize() + self._busy_senders
+            room = min(room, self._prefetch_limit(send_queue) - held)
+        return room
+
+    async def _wait_for_prefetch_room(self, send_queue: asyncio.Queue):
+        """Espera lugar para un lote (o para lo que admita el límite, si es menor)"""
+        while self._prefetch_room(send_queue) < min(self.batch_size, self._prefetch_limit(send_queue)):
+            self._slot_freed.clear()
+            await self._slot_freed.wait()
+
+    @staticmethod
+    async def _wait_for_room(send_queue: asyncio.Queue, room: int, slot_freed: asyncio.Event):
+        """Espera (sin consultar en ciclo) a que la cola local tenga lugar para `room` mensajes"""
+        while send_queue.maxsize - send_queue.qsize() < room:
+            slot_freed.clear()
+            await slot_freed.wait()
+
+    async def _hand_off(self, send_queue: asyncio.Queue, campaign_id: str, batch: list):
+        """Entrega un lote a las tareas de envío; sus leases se renuevan hasta terminar"""
+        for lease_id, message in batch:
+            self._held[lease_id] = campaign_id
+            await send_queue.put((campaign_id, lease_id, message))
+
+    async def _lease_renewal_loop(self):
+        """
+        Renueva cada tercio de `lease_timeout` los leases de los mensajes
+        retenidos en esta réplica (en cola local, esperando turno del rate
+        limiter o un slot de envío), así no vencen ni se envían dos veces
+        aunque la espera local supere el lease.
+
+        Un lease que se perdió igual (réplica pausada más que el lease) se
+        marca para no enviar ese mensaje: ya lo tiene otra réplica.
+        """
+        interval = max(0.05, self.redis.lease_timeout / 3)
+        while self.is_running:
+            await asyncio.sleep(interval)
+            by_campaign: Dict[str, List[str]] = {}
+            for lease_id, campaign_id in list(self._held.items()):
+                by_campaign.setdefault(campaign_id, []).append(lease_id)
+
+            for campaign_id, lease_ids in by_campaign.items():
+                try:
+                    lost = await self.redis.renew_leases(campaign_id, lease_ids, self.consumer_name)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error al renovar leases de '{campaign_id}': {str(e)}")
+                    continue
+                for lease_id in lost:
+                    # Los que terminaron durante la renovación ya no están retenidos
+                    if self._held.pop(lease_id, None):
+                        self._lost_leases.add(lease_id)
+                if lost:
+                    logger.warning(f"[{campaign_id}] {len(lost)} leases vencidos antes de enviar: no se envían")
+
+    async def _credentials_invalidation_loop(self):
+        """
+        Descarta las credenciales en memoria de los buzones invalidados en
+        cualquier réplica (pub/sub de Redis).
+        """
+        while self.is_running:
+            try:
+                async for buzon_id in self._credentials_cache.shared.listen_invalidated():
+                    self._credentials_cache.invalidate(buzon_id)
+                    self.supabase.invalidate_credentials(buzon_id)
+                    logger.info(f"Credenciales del buzon '{buzon_id}' invalidadas en otra réplica")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en la suscripción a credenciales invalidadas: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def _enqueue_listener_loop(self):
+        """
+        Despierta a los desencoladores inactivos cuando se encola una campaña
+        en cualquier réplica (pub/sub de Redis).
+        """
+        while self.is_running:
+            try:
+                async for priority in self.redis.listen_enqueued():
+                    if priority is None or priority:
+                        self._priority_enqueued.set()
+                    if priority is None or not priority:
+                        self._enqueued.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en la suscripción a avisos de encolado: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def _circuit_status_loop(self):
+        """
+        Publica en Redis el estado de los circuitos de esta réplica cada
+        CIRCUIT_STATUS_INTERVAL segundos (y lo retira al detenerse), así la
+        API sin worker embebido informa el de los workers que envían.
+        """
+        try:
+            while self.is_running:
+                try:
+                    await self.redis.publish_circuit_status(self.consumer_name, self.get_circuit_status())
+                except Exception as e:
+                    logger.error(f"Error al publicar el estado de los circuitos: {str(e)}")
+                await asyncio.sleep(CIRCUIT_STATUS_INTERVAL)
+        finally:
+            try:
+                await self.redis.publish_circuit_status(self.consumer_name, None)
+            except Exception:
+                pass
+
+    def _schedule_retry_check(self, delay: float):
+        """Registra el vencimiento de un reintento programado por esta réplica"""
+        due = time.monotonic() + delay
+        if not self._retry_dues or due < self._retry_dues[0]:
+            self._retry_scheduled.set()
+        heapq.heappush(self._retry_dues, due)
+
+    async def _retry_loop(self):
+        """
+        Devuelve a sus colas los reintentos vencidos (de cualquier réplica).
+
+        Duerme hasta el próximo vencimiento conocido: el que informa Redis al
+        terminar cada pasada o uno programado por esta réplica después. Como
+        máximo espera `lease_reap_interval` segundos.
+        """
+        while self.is_running:
+            dues = [due for due in (self._next_retry_check, *self._retry_dues[:1]) if due is not None]
+            timeout = self.lease_reap_interval
+            if dues:
+                timeout = min(timeout, max(0.0, min(dues) - time.monotonic()))
+            self._retry_scheduled.clear()
+            try:
+                await asyncio.wait_for(self._retry_scheduled.wait(), timeout=timeout)
+                # Se programó un reintento que vence antes: recalcular la espera
+                continue
+            except asyncio.TimeoutError:
+                pass
+
+            # Los vencidos de esta réplica quedan cubiertos por esta pasada
+            now = time.monotonic()
+            while self._retry_dues and self._retry_dues[0] <= now:
+                heapq.heappop(self._retry_dues)
+
+            try:
+                _, next_due = await self.redis.promote_due_retries()
+                self._next_retry_check = None if next_due is None else time.monotonic() + next_due
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error al devolver reintentos vencidos: {str(e)}")
+                self._next_retry_check = None
+
+    async def _wait_for_enqueue(self, event: asyncio.Event):
+        """
+        Espera un aviso de encolado. Sin avisos, vuelve cada
+        `lease_reap_interval` segundos para recuperar leases vencidos y por si
+        se perdió un aviso (el pub/sub no los guarda durante una reconexión).
+        """
+        try:
+            await asyncio.wait_for(event.wait(), timeout=self.lease_reap_interval)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _sender_loop(self, send_queue: asyncio.Queue, priority: bool = False):
+        """
+        Tarea del pool de envío: procesa mensajes de la cola local uno a uno.
+
+        Args:
+            send_queue: Cola local de tuplas (campaign_id, lease_id, mensaje)
+            priority: Tarea reservada del carril prioritario
+        """
+        slot_freed = self._priority_slot_freed if priority else self._slot_freed
+        while True:
+            campaign_id, lease_id, message = await send_queue.get()
+            slot_freed.set()
+            if not priority:
+                self._busy_senders += 1
+            try:
+                # Lease perdido mientras esperaba: otra réplica envía el mensaje
+                if lease_id in self._lost_leases:
+                    self._lost_leases.discard(lease_id)
+                    continue
+                await self.process_message(campaign_id, message, lease_id, priority)
+            except Exception as e:
+                logger.error(f"Error inesperado en tarea de envío ('{campaign_id}'): {str(e)}", exc_info=True)
+            finally:
+                self._held.pop(lease_id, None)
+                if not priority:
+                    self._busy_senders -= 1
+                send_queue.task_done()
+                slot_freed.set()
+
+    def get_concurrency_status(self) -> Optional[Dict]:
+        """Estado del control adaptativo de concurrencia (None si está desactivado)"""
+        if not self.concurrency_controller:
+            return None
+        return self.concurrency_controller.get_status()
+
+    def get_circuit_status(self) -> Optional[Dict]:
+        """Estado de los circuitos de cada sender (None si están desactivados)"""
+        get_status = getattr(self.whatsapp, "get_circuit_status", None)
+        return get_status() if get_status else None
+
+    async def get_published_circuit_status(self) -> Optional[Dict]:
+        """
+        Estado de los circuitos de los workers que envían (publicado en
+        Redis), combinado por circuito con el estado más grave. Para la API
+        sin worker embebido, cuyos propios circuitos nunca cambian.
+
+        Returns:
+            Estado combinado o None si los circuitos están desactivados o
+            ningún worker publicó su estado
+        """
+        if self.get_circuit_status() is None:
+            return None
+        statuses = await self.redis.get_published_circuit_status(CIRCUIT_STATUS_MAX_AGE)
+        return merge_circuit_status(statuses.values())
+
+    def get_http_stats(self) -> Optional[Dict]:
+        """Métricas del pool HTTP de los envíos (None si el cliente no las tiene)"""
+        get_stats = getattr(self.whatsapp, "get_http_stats", None)
+        return get_stats() if get_stats else None
+
+    async def get_results_status(self) -> Optional[Dict]:
+        """Escritura de resultados de envío en Supabase (None si está desactivada)"""
+        if not self.results_flusher:
+            return None
+        return await self.results_flusher.get_status()
 
     def get_uptime_seconds(self) -> int:
         """Retorna el tiempo de ejecución del worker en segundos"""
@@ -0,0 +1,77 @@
+"""
+Formato compacto de mensajes en cola
+"""
+from typing import Any, Dict, List, Optional
+
+# Versión del formato posicional (primer elemento de cada fila encolada)
+MESSAGE_FORMAT_VERSION = 1
+
+# Campos por fila, en el orden en que se guardan
+ROW_FIELDS = (
+    "numero",
+    "cedula",
+    "estatus_servicio",
+    "variable1",
+    "variable2",
+    "variable3",
+    "variable4",
+    "variable5",
+    "url_imagen"
+)
+
+# Campos comunes a toda la campaña (solo en campaign:{id}:metadata) y su default
+CAMPAIGN_FIELDS = {"plantilla": None, "buzon": None, "idioma": "es"}
+
+
+def encode_row(row: Dict) -> List:
+    """
+    Convierte una fila de campaña al formato compacto.
+
+    Formato: [versión, numero, cedula, estatus_servicio, variable1..5, url_imagen],
+    sin los None finales. Los campos de campaña no se incluyen.
+
+    Args:
+        row: Diccionario con los campos de la fila
+
+    Returns:
+        Lista posicional lista para serializar
+    """
+    values = [row.get(field) for field in ROW_FIELDS]
+    while values and values[-1] is None:
+        values.pop()
+    return [MESSAGE_FORMAT_VERSION, *values]
+
+
+def decode_message(item: Any, metadata: Optional[Dict]) -> Dict:
+    """
+    Reconstruye el mensaje completo a partir de una fila compacta y la
+    metadata de su campaña.
+
+    Los mensajes en formato completo (diccionario: mensajes individuales con
+    credenciales o encolados antes del formato compacto) se devuelven tal cual.
+
+    Args:
+        item: Fila compacta o mensaje completo
+        metadata: Metadata de la campaña (plantilla, buzon, idioma)
+
+    Returns:
+        Diccionario con el mensaje completo
+
+    Raises:
+        ValueError: Si el formato o la versión no son reconocidos
+    """
+    if isinstance(item, dict):
+        return item
+
+    if not isinstance(item, list) or not item or item[0] != MESSAGE_FORMAT_VERSION:
+        raise ValueError(f"Formato de mensaje no reconocido: {str(item)[:200]}")
+
+    message = dict.fromkeys(ROW_FIELDS)
+    message.update(zip(ROW_FIELDS, item[1:]))
+
+    metadata = metadata or {}
+    for field, default in CAMPAIGN_FIELDS.items():
+        # La metadata guarda "" para valores ausentes
+        message[field] = metadata.get(field) or default
+
+    return message
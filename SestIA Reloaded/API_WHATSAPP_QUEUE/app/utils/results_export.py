@@ -0,0 +1,73 @@
+"""
+Exportación de resultados de envío en CSV o NDJSON, página por página
+"""
+import csv
+import io
+from typing import AsyncIterator, Dict, List, Optional
+
+import orjson
+
+# Columnas exportadas, en orden
+EXPORT_COLUMNS = ["numero", "estado", "wamid", "error", "status_code", "intento", "buzon", "creado_en"]
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson"
+}
+
+
+def encode_csv(rows: List[Dict], header: bool = False) -> bytes:
+    """Filas como CSV (con la fila de encabezados si header)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows([row.get(column) for column in EXPORT_COLUMNS] for row in rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def encode_ndjson(rows: List[Dict]) -> bytes:
+    """Filas como NDJSON (un objeto JSON por línea)"""
+    return b"".join(
+        orjson.dumps({column: row.get(column) for column in EXPORT_COLUMNS}) + b"\n"
+        for row in rows
+    )
+
+
+async def stream_results(
+    first_page: List[Dict],
+    pages: AsyncIterator[List[Dict]],
+    formato: str = "csv",
+    unsaved: Optional[Dict[str, Dict]] = None
+) -> AsyncIterator[bytes]:
+    """
+    Cuerpo de la exportación: un bloque por página, sin juntar la campaña en
+    memoria.
+
+    Args:
+        first_page: Primera página, ya leída (puede estar vacía)
+        pages: Páginas siguientes
+        formato: csv o ndjson
+        unsaved: Resultados que seguían en Redis al empezar (stream_id ->
+            resultado); van al final, salvo los que ya aparecieron en Supabase
+
+    Yields:
+        Bloques del archivo
+    """
+    unsaved = dict(unsaved or {})
+
+    def saved(rows: List[Dict]) -> List[Dict]:
+        """Filas de Supabase; las que también seguían en Redis ya no se agregan al final"""
+        for row in rows:
+            unsaved.pop(row.get("stream_id"), None)
+        return rows
+
+    encode = encode_csv if formato == "csv" else encode_ndjson
+    if formato == "csv":
+        yield encode_csv(saved(first_page), header=True)
+    elif first_page:
+        yield encode_ndjson(saved(first_page))
+    async for rows in pages:
+        yield encode(saved(rows))
+    if unsaved:
+        yield encode(list(unsaved.values()))
@@ -0,0 +1,182 @@
+"""
+Proceso worker independiente de la API: envía los mensajes encolados sin
+levantar FastAPI.
+
+Ejecutar: python -m app.worker [--processes N]
+
+Con N > 1 un supervisor lanza N procesos de envío (uno por core) y reinicia
+los que terminan inesperadamente. Cada proceso tiene sus propias conexiones y
+su propio nombre de consumidor en los leases; el reparto entre procesos se
+coordina en Redis igual que entre réplicas de la API. Para que solo envíen
+estos procesos, desactivar el worker embebido de la API con
+EMBEDDED_WORKER=false.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import signal
+import sys
+import time
+from typing import Dict
+
+from app.config import settings
+
+logger = logging.getLogger("app.worker")
+
+# Espera antes de reiniciar un proceso caído (se duplica si vuelve a caer
+# antes de RESTART_RESET_SECONDS)
+RESTART_BASE_DELAY_SECONDS = 1.0
+RESTART_MAX_DELAY_SECONDS = 30.0
+RESTART_RESET_SECONDS = 60.0
+
+# Tiempo para que los procesos escriban stats y acks pendientes al detenerse
+SHUTDOWN_TIMEOUT_SECONDS = 30.0
+
+
+def configure_logging(process_name: str):
+    """Configura el logging del proceso (mismo formato que la API)"""
+    logging.basicConfig(
+        level=logging.DEBUG if settings.DEBUG else logging.INFO,
+        format=f"[{settings.INSTANCE_ID}/{process_name}] %(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        handlers=[
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+
+
+async def run_worker(index: int):
+    """
+    Conecta los servicios y ejecuta el worker hasta recibir SIGTERM/SIGINT.
+
+    Args:
+        index: Número del proceso (se agrega al nombre de consumidor)
+    """
+    # Los servicios se crean en cada proceso, no en el supervisor
+    from app.container import redis_service, supabase_service, whatsapp_service, worker_service
+
+    worker_service.consumer_name = f"{worker_service.consumer_name}-w{index}"
+    logger.info(f"Iniciando worker {worker_service.consumer_name} - Backend de colas: {settings.QUEUE_BACKEND}")
+
+    await redis_service.connect()
+    await supabase_service.connect()
+    await supabase_service.start_credentials_refresh()
+    await whatsapp_service.connect()
+
+    worker_task = asyncio.create_task(worker_service.start_worker())
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker_task.cancel)
+
+    try:
+        await worker_task
+    except asyncio.CancelledError:
+        pass
+    finally:
+        logger.info("Cerrando conexiones...")
+        await redis_service.disconnect()
+        await supabase_service.disconnect()
+        await whatsapp_service.disconnect()
+        logger.info("Worker detenido")
+
+
+def _process_main(index: int):
+    """Punto de entrada de cada proceso de envío lanzado por el supervisor"""
+    configure_logging(f"w{index}")
+    asyncio.run(run_worker(index))
+
+
+def supervise(processes: int):
+    """
+    Lanza `processes` procesos de envío y los mantiene vivos.
+
+    - Un proceso que termina sin que se haya pedido detener el supervisor se
+      reinicia con backoff exponencial
+    - SIGTERM/SIGINT se reenvían a los procesos, que terminan sus envíos en
+      curso y escriben las stats pendientes antes de salir
+
+    Args:
+        processes: Cantidad de procesos de envío
+    """
+    context = multiprocessing.get_context("spawn")
+    children: Dict[int, multiprocessing.Process] = {}
+    started_at: Dict[int, float] = {}
+    restart_at: Dict[int, float] = {}
+    restart_delay: Dict[int, float] = {}
+    stopping = False
+
+    def start(index: int):
+        process = context.Process(target=_process_main, args=(index,), name=f"worker-{index}")
+        process.start()
+        children[index] = process
+        started_at[index] = time.monotonic()
+        logger.info(f"Proceso de envío {index} iniciado (pid {process.pid})")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        logger.info(f"Señal {signal.Signals(signum).name} recibida: deteniendo {len(children)} procesos...")
+        for process in children.values():
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info(f"Supervisor iniciado - {processes} procesos de envío")
+    for index in range(processes):
+        start(index)
+
+    while not stopping:
+        time.sleep(0.5)
+        now = time.monotonic()
+        for index, process in list(children.items()):
+            if stopping or process.is_alive():
+                continue
+            if index not in restart_at:
+                # Un proceso que duró lo suficiente reinicia el backoff
+                if now - started_at[index] >= RESTART_RESET_SECONDS:
+                    restart_delay[index] = RESTART_BASE_DELAY_SECONDS
+                delay = restart_delay.get(index, RESTART_BASE_DELAY_SECONDS)
+                restart_delay[index] = min(delay * 2, RESTART_MAX_DELAY_SECONDS)
+                restart_at[index] = now + delay
+                logger.warning(
+                    f"Proceso de envío {index} terminó (código {process.exitcode}), "
+                    f"reiniciando en {delay:.0f}s"
+                )
+            elif now >= restart_at[index]:
+                del restart_at[index]
+                start(index)
+
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT_SECONDS
+    for index, process in children.items():
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.warning(f"Proceso de envío {index} no terminó a tiempo, forzando cierre")
+            process.kill()
+            process.join()
+    logger.info("Supervisor detenido")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de envíos WhatsApp, independiente de la API")
+    parser.add_argument(
+        "--processes", "-p",
+        type=int,
+        default=settings.WORKER_PROCESSES,
+        help="Procesos de envío (default: WORKER_PROCESSES)"
+    )
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        configure_logging("w0")
+        asyncio.run(run_worker(0))
+    else:
+        configure_logging("supervisor")
+        supervise(args.processes)
+
+
+if __name__ == "__main__":
+    main()
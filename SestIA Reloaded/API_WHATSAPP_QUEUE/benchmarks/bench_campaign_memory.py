@@ -0,0 +1,75 @@
+"""
+Benchmark: memoria de Redis por campaña según el formato de mensaje.
+
+Compara el formato anterior (cada mensaje repite plantilla, buzon, idioma y
+todas las claves opcionales, con null) con el formato compacto (fila
+posicional versionada; los campos de campaña solo en la metadata). Ambos
+se serializan sin espacios, como hace hoy `enqueue_campaign`; el formato
+anterior además llevaba espacios, así que la reducción real es mayor.
+
+Con BENCH_REDIS_URL se mide con MEMORY USAGE (exacto, incluye overhead de la
+lista). Con FakeRedis, que no implementa MEMORY, se reporta la suma de bytes
+de los mensajes guardados (cota inferior de la memoria de la cola).
+
+Ejecutar: python -m benchmarks.bench_campaign_memory [mensajes]
+Ejemplo:  BENCH_REDIS_URL=redis://localhost:6379/15 python -m benchmarks.bench_campaign_memory 100000
+"""
+import asyncio
+import os
+import sys
+
+from app.utils.message_codec import encode_row
+from benchmarks.common import make_redis_service, sample_message
+
+DEFAULT_SIZE = 100_000
+METADATA = {"plantilla": "promo_fibra_visual", "buzon": "14", "idioma": "es"}
+
+
+async def queue_bytes(service, campaign_id: str) -> int:
+    """Memoria ocupada por la cola de la campaña"""
+    client = service.redis_client
+    queue_key = f"campaign:{campaign_id}"
+    if os.getenv("BENCH_REDIS_URL"):
+        return await client.memory_usage(queue_key, samples=0)
+
+    total = 0
+    length = await client.llen(queue_key)
+    for start in range(0, length, 10_000):
+        for message_json in await client.lrange(queue_key, start, start + 9_999):
+            total += len(message_json.encode("utf-8"))
+    return total
+
+
+async def measure(size: int, compact: bool) -> int:
+    """Encola una campaña de `size` mensajes y retorna los bytes de su cola"""
+    service = await make_redis_service()
+    if compact:
+        messages = (encode_row(sample_message(i)) for i in range(size))
+    else:
+        messages = (sample_message(i) for i in range(size))
+    total = await service.enqueue_campaign("bench", messages, METADATA)
+    assert total == size
+
+    used = await queue_bytes(service, "bench")
+    await service.redis_client.flushdb()
+    await service.disconnect()
+    return used
+
+
+async def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SIZE
+    source = "MEMORY USAGE" if os.getenv("BENCH_REDIS_URL") else "bytes de mensajes (FakeRedis)"
+    print(f"Memoria de la cola para {size} mensajes - {source}\n")
+
+    full = await measure(size, compact=False)
+    compact = await measure(size, compact=True)
+
+    print(f"{'formato':>10} | {'total (MB)':>10} | {'bytes/mensaje':>13}")
+    print("-" * 40)
+    print(f"{'anterior':>10} | {full / (1024 * 1024):>10.2f} | {full / size:>13.1f}")
+    print(f"{'compacto':>10} | {compact / (1024 * 1024):>10.2f} | {compact / size:>13.1f}")
+    print(f"\nReducción: {full / compact:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""
+Benchmark: consultas a Supabase y latencia de credenciales en el camino
+crítico, con consulta por buzon vs precarga en memoria.
+
+Un PostgREST local simulado tiene N buzones y responde en LOOKUP_MS.
+Llegan CAMPAIGNS creaciones de campaña (cada una valida su buzon, como
+/api/crear-campana) y el worker arranca con el cache frío y pide las
+credenciales de cada buzon, con CONCURRENCY consultas simultáneas. Sin
+precarga cada validación y cada buzon nuevo del worker es una consulta en el
+camino crítico; con precarga todo sale de memoria tras una carga paginada al
+iniciar.
+
+Ejecutar: python -m benchmarks.bench_credential_preload [buzones]
+"""
+import asyncio
+import logging
+import random
+import statistics
+import sys
+import time
+
+from app.services.credential_cache import CredentialCache
+from app.services.supabase_service import SupabaseService
+from benchmarks.common import FAKE_SUPABASE_KEY, credential_rows, start_fake_postgrest
+
+LOOKUP_MS = 50
+CAMPAIGNS = 500
+CONCURRENCY = 50
+PAGE_SIZE = 100
+
+
+def percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+async def run(server, buzones: int, preload: bool):
+    service = SupabaseService(
+        server.url,
+        FAKE_SUPABASE_KEY,
+        refresh_interval_seconds=300 if preload else 0,
+        page_size=PAGE_SIZE
+    )
+    await service.connect()
+    requests_before = server.requests
+
+    started = time.monotonic()
+    await service.start_credentials_refresh()
+    startup = time.monotonic() - started
+
+    latencies = []
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def timed(coro):
+        async with semaphore:
+            started = time.monotonic()
+            assert await coro
+            latencies.append(time.monotonic() - started)
+
+    # Creaciones de campaña (validan el buzon) y worker con el cache frío
+    random.seed(1)
+    cache = CredentialCache(loader=service.get_credentials)
+    await asyncio.gather(
+        *(timed(service.get_credentials(str(random.randrange(buzones)))) for _ in range(CAMPAIGNS)),
+        *(timed(cache.get_or_load(str(buzon))) for buzon in range(buzones))
+    )
+
+    requests = server.requests - requests_before
+    await service.disconnect()
+    return startup, requests, latencies
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.ERROR)
+    buzones = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    server = start_fake_postgrest(credential_rows(buzones), latency_ms=LOOKUP_MS)
+    print(
+        f"{buzones} buzones, {CAMPAIGNS} campañas creadas + worker con cache frío "
+        f"(Supabase responde en {LOOKUP_MS} ms, páginas de {PAGE_SIZE})\n"
+    )
+    print(f"{'modo':>11} | {'carga inicial (ms)':>18} | {'consultas':>9} | {'p50 (ms)':>8} | {'p99 (ms)':>8}")
+    print("-" * 68)
+    for preload in (False, True):
+        startup, requests, latencies = await run(server, buzones, preload)
+        name = "precarga" if preload else "por buzon"
+        latencies_ms = [latency * 1000 for latency in latencies]
+        print(
+            f"{name:>11} | {startup * 1000:>18.0f} | {requests:>9} | "
+            f"{statistics.median(latencies_ms):>8.2f} | {percentile(latencies_ms, 0.99):>8.2f}"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+"""
+Benchmark: tiempo de desencolado por lote vs RTT de Redis.
+
+Compara el desencolado anterior (un LPOP por mensaje) con el desencolado
+en bloque del worker (lease_messages: LPOP count y lease en un solo script,
+un round trip por lote).
+
+Ejecutar: python -m benchmarks.bench_dequeue
+"""
+import asyncio
+import json
+
+from benchmarks.common import Timer, make_redis_service, sample_message
+
+BATCH_SIZE = 100
+BATCHES = 5
+RTTS_MS = [0.0, 0.5, 1.0, 2.0, 5.0]
+
+
+async def dequeue_one_by_one(service, campaign_id: str, size: int) -> list:
+    """Desencolado anterior: un round trip por mensaje"""
+    batch = []
+    for _ in range(size):
+        message_json = await service.redis_client.lpop(service._queue_key(campaign_id))
+        if not message_json:
+            break
+        batch.append(json.loads(message_json))
+    return batch
+
+
+async def measure(rtt_ms: float, bulk: bool) -> float:
+    """Retorna el tiempo promedio (ms) para desencolar un lote"""
+    service = await make_redis_service(rtt_ms=rtt_ms)
+    messages = [sample_message(i) for i in range(BATCH_SIZE * BATCHES)]
+    await service.enqueue_campaign("bench", messages, {"plantilla": "promo_fibra_visual", "buzon": "14"})
+
+    with Timer() as timer:
+        for _ in range(BATCHES):
+            if bulk:
+                batch = await service.lease_messages("bench", BATCH_SIZE, "bench")
+            else:
+                batch = await dequeue_one_by_one(service, "bench", BATCH_SIZE)
+            assert len(batch) == BATCH_SIZE
+
+    await service.disconnect()
+    return timer.elapsed / BATCHES * 1000
+
+
+async def main():
+    print(f"Desencolado de lotes de {BATCH_SIZE} mensajes (promedio de {BATCHES} lotes)\n")
+    print(f"{'RTT (ms)':>9} | {'1 LPOP/mensaje (ms)':>20} | {'lease lote (ms)':>16} | {'speedup':>8}")
+    print("-" * 63)
+    for rtt_ms in RTTS_MS:
+        legacy = await measure(rtt_ms, bulk=False)
+        bulk = await measure(rtt_ms, bulk=True)
+        print(f"{rtt_ms:>9.1f} | {legacy:>20.2f} | {bulk:>16.2f} | {legacy / bulk:>7.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
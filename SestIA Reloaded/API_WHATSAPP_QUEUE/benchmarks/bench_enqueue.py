@@ -0,0 +1,74 @@
+"""
+Benchmark: memoria pico y tiempo de encolado de campañas grandes.
+
+Compara el encolado anterior (lista completa serializada + un solo RPUSH
+gigante) con el encolado por bloques en pipeline + commit atómico.
+
+La memoria se mide con tracemalloc como pico transitorio del cliente
+(pico durante el encolado menos la memoria retenida al terminar), para
+no contar los datos que FakeRedis guarda en el mismo proceso.
+
+Ejecutar: python -m benchmarks.bench_enqueue [tamaños...]
+Ejemplo:  python -m benchmarks.bench_enqueue 10000 100000 1000000
+"""
+import asyncio
+import gc
+import json
+import sys
+import tracemalloc
+
+from benchmarks.common import Timer, make_redis_service, sample_message
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+async def legacy_enqueue(service, campaign_id: str, messages: list, metadata: dict) -> int:
+    """Encolado anterior: un RPUSH con todos los mensajes y dos HSET separados"""
+    client = service.redis_client
+    serialized_messages = [json.dumps(msg) for msg in messages]
+    await client.rpush(f"campaign:{campaign_id}", *serialized_messages)
+    await client.hset(f"campaign:{campaign_id}:metadata", mapping=metadata)
+    await client.hset(f"campaign:{campaign_id}:stats", mapping={"total": len(messages), "enviados": 0, "fallidos": 0})
+    return len(messages)
+
+
+async def measure(size: int, chunked: bool):
+    """Retorna (segundos, MB pico transitorio)"""
+    service = await make_redis_service()
+    metadata = {"plantilla": "promo_fibra_visual", "buzon": "14", "idioma": "es"}
+    gc.collect()
+
+    tracemalloc.start()
+    with Timer() as timer:
+        if chunked:
+            # Generador: así llegan los mensajes desde las rutas
+            messages = (sample_message(i) for i in range(size))
+            total = await service.enqueue_campaign("bench", messages, metadata)
+        else:
+            messages = [sample_message(i) for i in range(size)]
+            total = await legacy_enqueue(service, "bench", messages, metadata)
+            del messages
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert total == size
+    assert await service.redis_client.llen("campaign:bench") == size
+    await service.redis_client.flushdb()
+    await service.disconnect()
+    return timer.elapsed, (peak - current) / (1024 * 1024)
+
+
+async def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print("Encolado de campañas (tiempo con tracemalloc activo)\n")
+    print(f"{'mensajes':>10} | {'anterior (s)':>12} | {'pico ant. (MB)':>14} | {'bloques (s)':>11} | {'pico bloques (MB)':>17}")
+    print("-" * 77)
+    for size in sizes:
+        legacy_time, legacy_peak = await measure(size, chunked=False)
+        chunked_time, chunked_peak = await measure(size, chunked=True)
+        print(f"{size:>10} | {legacy_time:>12.2f} | {legacy_peak:>14.1f} | {chunked_time:>11.2f} | {chunked_peak:>17.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
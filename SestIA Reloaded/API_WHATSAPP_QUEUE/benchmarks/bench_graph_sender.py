@@ -0,0 +1,112 @@
+"""
+Benchmark: envío por el middleware vs directo a la Graph API de Meta.
+
+Una Graph API local simulada responde en META_MS. El middleware simulado
+(en otro proceso, como el de Railway) agrega el salto de red HOP_MS, atiende
+como máximo MIDDLEWARE_CAPACITY envíos a la vez y reenvía cada mensaje a la
+Graph API simulada. Se hacen SENDS envíos con CONCURRENCY en vuelo por cada
+camino y se comparan envíos/s y latencia.
+
+Ejecutar: python -m benchmarks.bench_graph_sender [envíos] [concurrencia] [capacidad_middleware]
+"""
+import asyncio
+import json
+import logging
+import sys
+import time
+
+from app.services.meta_graph_service import MetaGraphService
+from app.services.whatsapp_service import WhatsAppService
+from benchmarks.common import FakeHttpServer, graph_api_handler, sample_message
+
+META_MS = 150
+HOP_MS = 40
+CREDENTIALS = {"token": "t", "phone_id": "p"}
+
+
+class ForwardingMiddleware:
+    """
+    Middleware simulado: traduce el cuerpo de /enviar-mensaje a un mensaje de
+    plantilla y lo reenvía a la Graph API (con MetaGraphService, creado dentro
+    del proceso del servidor)
+    """
+
+    def __init__(self, graph_url: str, capacity: int):
+        self.graph_url = graph_url
+        self.capacity = capacity
+        self.graph = None
+
+    async def __call__(self, method, path, headers, body):
+        if method != "POST":
+            return 200, {}
+        if self.graph is None:
+            self.graph = MetaGraphService(graph_url=self.graph_url, max_connections=self.capacity)
+            await self.graph.connect()
+
+        data = json.loads(body)
+        message = {"numero": data["numero"], "plantilla": data["template_name"], "idioma": data.get("idioma", "es")}
+        for i, variable in enumerate(data.get("variables", []), start=1):
+            message[f"variable{i}"] = variable
+        if data.get("url_imagen"):
+            message["url_imagen"] = data["url_imagen"]
+
+        result = await self.graph.send_message({"token": data["token"], "phone_id": data["phone_id"]}, message)
+        if result["success"]:
+            return 200, {"status": "success", "id": result["wamid"]}
+        return 500, {"status": "error", "meta_error": result["error"]}
+
+
+async def run(sender: WhatsAppService, sends: int, concurrency: int):
+    await sender.connect()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def send(i: int):
+        async with semaphore:
+            started = time.monotonic()
+            result = await sender.send_message(CREDENTIALS, sample_message(i))
+            assert result["success"], result
+            latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*(send(i) for i in range(sends)))
+    elapsed = time.monotonic() - started
+    await sender.disconnect()
+
+    latencies.sort()
+    return sends / elapsed, latencies[len(latencies) // 2] * 1000, latencies[int(0.99 * len(latencies))] * 1000
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.ERROR)
+    sends = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    capacity = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    graph_server = FakeHttpServer(latency_ms=META_MS, handler=graph_api_handler).start(process=True)
+    middleware_server = FakeHttpServer(
+        latency_ms=HOP_MS,
+        handler=ForwardingMiddleware(graph_server.url, capacity),
+        max_concurrency=capacity
+    ).start(process=True)
+
+    print(
+        f"{sends} envíos, {concurrency} en vuelo (Meta responde en {META_MS} ms; "
+        f"middleware: +{HOP_MS} ms, {capacity} envíos a la vez)\n"
+    )
+    print(f"{'camino':>22} | {'msg/s':>6} | {'p50 (ms)':>8} | {'p99 (ms)':>8}")
+    print("-" * 54)
+    paths = (
+        ("worker → middleware", WhatsAppService(f"{middleware_server.url}/enviar-mensaje", max_connections=concurrency)),
+        ("worker → Graph API", MetaGraphService(graph_url=graph_server.url, max_connections=concurrency))
+    )
+    for name, sender in paths:
+        rate, p50, p99 = await run(sender, sends, concurrency)
+        print(f"{name:>22} | {rate:>6.0f} | {p50:>8.1f} | {p99:>8.1f}")
+
+    middleware_server.shutdown()
+    graph_server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""
+Benchmark: pool de conexiones del cliente HTTP de los envíos.
+
+Un middleware local simulado (en otro proceso) responde en LATENCY_MS. Se
+hacen SENDS envíos con CONCURRENCY en vuelo (como WORKER_CONCURRENCY) con:
+
+- el cliente anterior: httpx.AsyncClient(timeout=30.0), que admite 100
+  conexiones (20 en keep-alive) y encola el resto dentro de httpcore
+- un solo pool de httpcore con una conexión por envío en vuelo
+- el mismo número de conexiones en pools de 10 (ShardedTransport), con y
+  sin conexiones precalentadas
+
+La espera en el pool es latencia que el middleware nunca ve; la CPU por
+envío limita cuántos envíos/s puede sostener un core.
+
+Ejecutar: python -m benchmarks.bench_http_pool [envíos] [concurrencia]
+"""
+import asyncio
+import logging
+import sys
+import time
+
+import httpx
+
+from app.services.whatsapp_service import WhatsAppService
+from benchmarks.common import FakeHttpServer, sample_message
+
+LATENCY_MS = 300
+CREDENTIALS = {"token": "t", "phone_id": "p"}
+
+
+async def run(server: FakeHttpServer, sends: int, concurrency: int, default_client: bool = False, **http_options):
+    service = WhatsAppService(f"{server.url}/enviar-mensaje", **http_options)
+    if default_client:
+        service.client = httpx.AsyncClient(timeout=30.0)
+    connections_before = server.connections
+    await service.connect()
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def send(i: int):
+        async with semaphore:
+            started = time.monotonic()
+            result = await service.send_message(CREDENTIALS, sample_message(i))
+            assert result["success"], result
+            latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    cpu_started = time.process_time()
+    await asyncio.gather(*(send(i) for i in range(sends)))
+    elapsed = time.monotonic() - started
+    cpu = time.process_time() - cpu_started
+    await service.disconnect()
+
+    latencies.sort()
+    stats = service.get_http_stats()
+    return {
+        "rate": sends / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p95": latencies[int(0.95 * len(latencies))] * 1000,
+        "cpu_ms": cpu / sends * 1000,
+        "pool_p95": stats["espera_pool_ms"]["p95"],
+        "server_p50": stats["servidor_ms"]["p50"],
+        "connections": server.connections - connections_before,
+        "in_path": stats["conexiones_nuevas"]
+    }
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.ERROR)
+    sends = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    server = FakeHttpServer(latency_ms=LATENCY_MS).start(process=True)
+
+    print(f"{sends} envíos, {concurrency} en vuelo (middleware responde en {LATENCY_MS} ms)\n")
+    print(
+        f"{'cliente':>24} | {'msg/s':>6} | {'p50 (ms)':>8} | {'p95 (ms)':>8} | {'CPU/envío (ms)':>14} | "
+        f"{'pool p95':>8} | {'servidor p50':>12} | {'conexiones':>10} | {'al enviar':>9}"
+    )
+    print("-" * 127)
+    configs = (
+        ("httpx por defecto", {"default_client": True}),
+        (f"1 pool de {concurrency}", {"max_connections": concurrency, "connections_per_pool": concurrency}),
+        (f"{concurrency} en pools de 10", {"max_connections": concurrency}),
+        ("pools de 10 precalentados", {"max_connections": concurrency, "warmup_connections": concurrency})
+    )
+    for name, options in configs:
+        r = await run(server, sends, concurrency, **options)
+        print(
+            f"{name:>24} | {r['rate']:>6.0f} | {r['p50']:>8.1f} | {r['p95']:>8.1f} | {r['cpu_ms']:>14.2f} | "
+            f"{r['pool_p95']:>8.1f} | {r['server_p50']:>12.1f} | {r['connections']:>10} | {r['in_path']:>9}"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""
+Benchmark: latencia del primer envío de una campaña nueva con workers
+inactivos y carga sobre Redis mientras no hay campañas.
+
+Dos réplicas del worker esperan sin campañas; otra instancia (la API) encola
+campañas de un mensaje, alternando campañas masivas y mensajes individuales.
+Se mide el tiempo desde el encolado hasta el envío y los comandos que los
+workers envían a Redis mientras están inactivos.
+
+Ejecutar: python -m benchmarks.bench_idle_wakeup [campañas]
+"""
+import asyncio
+import logging
+import statistics
+import sys
+import time
+
+from app.services.redis_service import RedisService
+from app.services.worker import WorkerService
+from app.utils.message_codec import encode_row
+from benchmarks.common import make_redis_service, sample_message
+
+REPLICAS = 2
+IDLE_SECONDS = 3
+
+
+class LatencyWhatsApp:
+    """Sender simulado: mide la latencia desde el encolado"""
+
+    def __init__(self, enqueued_at: dict, latencies: list):
+        self.enqueued_at = enqueued_at
+        self.latencies = latencies
+
+    async def send_message(self, credentials, message_data):
+        self.latencies.append(time.monotonic() - self.enqueued_at[message_data["numero"]])
+        return {"success": True, "wamid": "wamid.x", "error": None, "status_code": 200}
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.ERROR)
+    campaigns = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    redis = await make_redis_service(rtt_ms=0.5)
+    # La API usa su propio RedisService sobre el mismo servidor
+    api = RedisService(redis_url="")
+    api.redis_client = redis.redis_client
+    await api.connect()
+
+    enqueued_at, latencies = {}, []
+    workers = []
+    for i in range(REPLICAS):
+        worker = WorkerService(
+            redis=redis,
+            supabase=None,
+            whatsapp=LatencyWhatsApp(enqueued_at, latencies),
+            delay_ms=0,
+            consumer_name=f"replica-{i}"
+        )
+        worker._credentials_cache["14"] = {"token": "t", "phone_id": "p"}
+        workers.append(worker)
+    tasks = [asyncio.create_task(worker.start_worker()) for worker in workers]
+
+    # Carga sobre Redis con los workers inactivos
+    await asyncio.sleep(0.5)
+    before = redis.redis_client.round_trips
+    await asyncio.sleep(IDLE_SECONDS)
+    idle_commands = (redis.redis_client.round_trips - before) / IDLE_SECONDS
+
+    for i in range(campaigns):
+        message = sample_message(i)
+        enqueued_at[message["numero"]] = time.monotonic()
+        if i % 2:
+            message.update({"token": "t", "phone_id": "p", "buzon": None})
+            await api.enqueue_campaign(f"individual-{i}", [message], {}, priority=True)
+        else:
+            await api.enqueue_campaign(f"masiva-{i}", [encode_row(message)], message)
+        # Esperar a que los workers vuelvan a quedar inactivos
+        while len(latencies) <= i:
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0.2)
+
+    for worker, task in zip(workers, tasks):
+        worker.is_running = False
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await redis.disconnect()
+
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    print(f"{REPLICAS} réplicas inactivas, {campaigns} campañas de un mensaje (RTT Redis 0.5 ms)")
+    print(f"Comandos a Redis por segundo sin campañas: {idle_commands:.1f}")
+    print(
+        f"Encolado -> envío: p50 {statistics.median(latencies_ms):.1f} ms, "
+        f"máx {latencies_ms[-1]:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,151 @@
+"""
+Benchmark: CPU por mensaje para armar el payload del envío.
+
+Compara el armado anterior (extraer variables con str()/strip() repetidos,
+un dict nuevo por mensaje y el json de la stdlib que usa httpx con json=)
+con el prefijo precompilado por campaña + campos del mensaje codificados con
+orjson, para el middleware y para la Graph API. Mide solo el payload y el
+armado completo de la request httpx (sin red; URL y headers del destino ya
+parseados en el camino precompilado), y verifica que ambos JSON sean
+equivalentes.
+
+Ejecutar: python -m benchmarks.bench_payload_encoding [mensajes]
+"""
+import json
+import sys
+import time
+
+import httpx
+
+from app.services.meta_graph_service import MetaGraphService
+from app.services.whatsapp_service import JSON_HEADERS, WhatsAppService
+from benchmarks.common import sample_message
+
+CREDENTIALS = {"token": "EAAG" + "x" * 200, "phone_id": "114233445566778"}
+ROUNDS = 5
+
+
+def previous_variables(message_data):
+    """Extracción de variables anterior"""
+    variables = []
+    for i in range(1, 11):
+        var_value = message_data.get(f"variable{i}")
+        if var_value is not None and str(var_value).strip():
+            variables.append(str(var_value).strip())
+        else:
+            break
+    return variables
+
+
+def previous_middleware_payload(credentials, message_data):
+    """Payload anterior del middleware (dict por mensaje)"""
+    payload = {
+        "token": credentials["token"],
+        "phone_id": credentials["phone_id"],
+        "numero": message_data["numero"],
+        "template_name": message_data["plantilla"],
+        "idioma": message_data.get("idioma", "es")
+    }
+    variables = previous_variables(message_data)
+    if variables:
+        payload["variables"] = variables
+    url_imagen = message_data.get("url_imagen")
+    if url_imagen and str(url_imagen).strip():
+        payload["url_imagen"] = str(url_imagen).strip()
+    return payload
+
+
+def previous_graph_payload(credentials, message_data):
+    """Mensaje de plantilla armado como dict por mensaje"""
+    components = []
+    url_imagen = message_data.get("url_imagen")
+    if url_imagen and str(url_imagen).strip():
+        components.append({"type": "header", "parameters": [{"type": "image", "image": {"link": str(url_imagen).strip()}}]})
+    variables = previous_variables(message_data)
+    if variables:
+        components.append({"type": "body", "parameters": [{"type": "text", "text": v} for v in variables]})
+    template = {"name": message_data["plantilla"], "language": {"code": message_data.get("idioma", "es")}}
+    if components:
+        template["components"] = components
+    return {
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": message_data["numero"],
+        "type": "template",
+        "template": template
+    }
+
+
+def stdlib_json(payload) -> bytes:
+    """Lo que hace httpx con json= (httpx._content.encode_json)"""
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+
+def per_message_us(function, messages) -> float:
+    """Mejor de ROUNDS pasadas, en µs de CPU por mensaje"""
+    best = float("inf")
+    for _ in range(ROUNDS):
+        started = time.process_time()
+        for message in messages:
+            function(message)
+        best = min(best, time.process_time() - started)
+    return best / len(messages) * 1_000_000
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    messages = [sample_message(i) for i in range(total)]
+    for i, message in enumerate(messages):
+        message["variable3"] = f"Plan {i % 7} Mbps"
+        if i % 2:
+            message["url_imagen"] = "https://i.imgur.com/ejemplo-fibex.jpg"
+
+    middleware = WhatsAppService("http://middleware.local/enviar-mensaje")
+    graph = MetaGraphService(graph_url="http://graph.local")
+    client = httpx.AsyncClient()
+    url = "http://middleware.local/enviar-mensaje"
+
+    def graph_request(message):
+        target_url, headers = graph._target(CREDENTIALS)
+        return client.build_request("POST", target_url, content=graph._build_body(CREDENTIALS, message), headers=headers)
+
+    cases = (
+        (
+            "middleware",
+            lambda m: stdlib_json(previous_middleware_payload(CREDENTIALS, m)),
+            lambda m: middleware._build_body(CREDENTIALS, m),
+            lambda m: client.build_request("POST", url, json=previous_middleware_payload(CREDENTIALS, m), headers={"Content-Type": "application/json"}),
+            lambda m: client.build_request("POST", middleware._endpoint_url, content=middleware._build_body(CREDENTIALS, m), headers=JSON_HEADERS)
+        ),
+        (
+            "Graph API",
+            lambda m: stdlib_json(previous_graph_payload(CREDENTIALS, m)),
+            lambda m: graph._build_body(CREDENTIALS, m),
+            lambda m: client.build_request(
+                "POST",
+                f"http://graph.local/v21.0/{CREDENTIALS['phone_id']}/messages",
+                json=previous_graph_payload(CREDENTIALS, m),
+                headers={"Authorization": f"Bearer {CREDENTIALS['token']}"}
+            ),
+            graph_request
+        )
+    )
+
+    print(f"{total} mensajes (3 variables, la mitad con imagen), CPU por mensaje (mejor de {ROUNDS})\n")
+    print(f"{'destino':>10} | {'etapa':>16} | {'anterior (µs)':>13} | {'precompilado (µs)':>17} | {'mensajes/s por core':>19}")
+    print("-" * 88)
+    for name, old_body, new_body, old_request, new_request in cases:
+        for message in messages:
+            assert json.loads(old_body(message)) == json.loads(new_body(message)), message
+
+        for stage, old, new in (("payload", old_body, new_body), ("request httpx", old_request, new_request)):
+            old_us = per_message_us(old, messages)
+            new_us = per_message_us(new, messages)
+            print(
+                f"{name:>10} | {stage:>16} | {old_us:>13.2f} | {new_us:>17.2f} | "
+                f"{1_000_000 / old_us:>8.0f} → {1_000_000 / new_us:>8.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark: latencia de encolado a envío de mensajes individuales durante una
+campaña masiva.
+
+Se encola una campaña de 100k mensajes (límite de 80 msg/s por phone_id, así
+la cola local del worker está siempre llena) y, mientras se procesa, llegan
+mensajes individuales como los de /api/encolar-mensaje (credenciales
+directas, una campaña por mensaje). Se compara registrarlos como campañas
+masivas (comportamiento anterior) con el carril prioritario, usando para el
+mensaje individual otro phone_id o el mismo de la campaña masiva.
+
+Ejecutar: python -m benchmarks.bench_priority_lane [mensajes_masivos] [individuales]
+"""
+import asyncio
+import logging
+import statistics
+import sys
+import time
+
+from app.services.rate_limiter import RateLimiter
+from app.services.worker import WorkerService
+from app.utils.message_codec import encode_row
+from benchmarks.common import make_redis_service, sample_message
+
+RATE = 80
+INDIVIDUAL_INTERVAL = 0.05
+
+
+class LatencyWhatsApp:
+    """Sender simulado: mide la latencia desde el encolado de los mensajes individuales"""
+
+    def __init__(self):
+        self.latencies = []
+
+    async def send_message(self, credentials, message_data):
+        if "enqueued_at" in message_data:
+            self.latencies.append(time.monotonic() - message_data["enqueued_at"])
+        await asyncio.sleep(0.05)
+        return {"success": True, "wamid": "wamid.x", "error": None, "status_code": 200}
+
+
+def percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+async def run(bulk_size: int, individuals: int, priority: bool, phone_id: str):
+    redis = await make_redis_service()
+    await redis.enqueue_campaign(
+        "masiva",
+        (encode_row(sample_message(i)) for i in range(bulk_size)),
+        {"plantilla": "p", "buzon": "14", "idioma": "es"}
+    )
+
+    whatsapp = LatencyWhatsApp()
+    worker = WorkerService(
+        redis=redis,
+        supabase=None,
+        whatsapp=whatsapp,
+        delay_ms=0,
+        rate_limiter=RateLimiter(redis, default_rate=RATE)
+    )
+    worker._credentials_cache["14"] = {"token": "t", "phone_id": "phone-masiva"}
+    task = asyncio.create_task(worker.start_worker())
+
+    # Dejar que la campaña masiva llene la cola local y el bucket
+    await asyncio.sleep(2)
+    for i in range(individuals):
+        message = {
+            "numero": f"58414{i:07d}",
+            "plantilla": "notificacion",
+            "idioma": "es",
+            "token": "t",
+            "phone_id": phone_id,
+            "buzon": None,
+            "enqueued_at": time.monotonic()
+        }
+        await redis.enqueue_campaign(f"individual-{i}", [message], {"plantilla": "notificacion"}, priority=priority)
+        await asyncio.sleep(INDIVIDUAL_INTERVAL)
+
+    deadline = time.monotonic() + 60
+    while len(whatsapp.latencies) < individuals and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+    worker.is_running = False
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await redis.disconnect()
+    return whatsapp.latencies
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.ERROR)
+    bulk_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    individuals = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print(
+        f"Campaña masiva de {bulk_size} mensajes ({RATE} msg/s por phone_id) y "
+        f"{individuals} mensajes individuales cada {INDIVIDUAL_INTERVAL * 1000:.0f} ms\n"
+    )
+    print(f"{'carril':>12} | {'phone_id individual':>19} | {'enviados':>8} | {'p50 (ms)':>9} | {'p99 (ms)':>9}")
+    print("-" * 70)
+    for priority in (False, True):
+        for phone_id, phone_name in (("phone-individual", "otro"), ("phone-masiva", "mismo")):
+            latencies = await run(bulk_size, individuals, priority, phone_id)
+            name = "prioritario" if priority else "masivo"
+            p50 = statistics.median(latencies) * 1000 if latencies else float("nan")
+            p99 = percentile(latencies, 0.99) * 1000 if latencies else float("nan")
+            print(
+                f"{name:>12} | {phone_name:>19} | {len(latencies):>8} | "
+                f"{p50:>9.0f} | {p99:>9.0f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
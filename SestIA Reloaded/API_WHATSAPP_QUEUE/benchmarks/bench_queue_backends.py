@@ -0,0 +1,62 @@
+"""
+Benchmark: throughput de cola, backend de listas vs Redis Streams.
+
+Simula 3 réplicas del worker consumiendo la misma campaña: cada una lee
+lotes con lease y confirma cada mensaje (sin envío real), hasta vaciar la
+cola. Mide mensajes/segundo solo de operaciones de cola.
+
+Ejecutar: python -m benchmarks.bench_queue_backends [mensajes] [rtt_ms]
+"""
+import asyncio
+import sys
+
+from benchmarks.common import Timer, make_redis_service, sample_message
+
+REPLICAS = 3
+BATCH_SIZE = 100
+
+
+async def consume(service, consumer: str) -> int:
+    """Lee lotes con lease y confirma mensaje a mensaje hasta vaciar la cola"""
+    processed = 0
+    while True:
+        leased = await service.lease_messages("bench", BATCH_SIZE, consumer)
+        if not leased:
+            return processed
+        await asyncio.gather(*(service.ack_messages("bench", [lease_id]) for lease_id, _ in leased))
+        processed += len(leased)
+
+
+async def measure(backend: str, total: int, rtt_ms: float):
+    service = await make_redis_service(rtt_ms=rtt_ms, backend=backend)
+
+    with Timer() as enqueue_timer:
+        await service.enqueue_campaign(
+            "bench",
+            (sample_message(i) for i in range(total)),
+            {"plantilla": "promo_fibra_visual", "buzon": "14"}
+        )
+
+    with Timer() as consume_timer:
+        counts = await asyncio.gather(*(consume(service, f"replica-{i}") for i in range(REPLICAS)))
+
+    assert sum(counts) == total, f"{backend}: {sum(counts)} de {total}"
+    assert await service._count_pending("bench") == 0
+    await service.redis_client.flushdb()
+    await service.disconnect()
+    return total / enqueue_timer.elapsed, total / consume_timer.elapsed, counts
+
+
+async def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    rtt_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    print(f"{total} mensajes, {REPLICAS} réplicas, lotes de {BATCH_SIZE}, RTT {rtt_ms} ms\n")
+    print(f"{'backend':>8} | {'encolado (msg/s)':>16} | {'consumo (msg/s)':>15} | reparto por réplica")
+    print("-" * 72)
+    for backend in ("list", "stream"):
+        enqueue_rate, consume_rate, counts = await measure(backend, total, rtt_ms)
+        print(f"{backend:>8} | {enqueue_rate:>16.0f} | {consume_rate:>15.0f} | {counts}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+"""
+Benchmark: exportación de resultados de una campaña desde Supabase.
+
+Compara armar el archivo completo en memoria (leer todas las páginas en una
+lista y codificar al final, como parse_csv al cargar) con la exportación por
+streaming del endpoint /api/estado-cola/{campaign_id}/resultados
+(SupabaseService.iter_results + stream_results: una página por bloque y la
+siguiente pedida mientras se codifica la actual). PostgREST simulado con
+LATENCY_MS por página de 1000 filas.
+
+Mide el tiempo hasta el primer byte, el tiempo total y el pico de memoria de
+Python (tracemalloc, en una pasada aparte), y verifica que ambos archivos
+sean iguales.
+
+Ejecutar: python -m benchmarks.bench_results_export [filas]
+"""
+import asyncio
+import logging
+import sys
+import time
+import tracemalloc
+
+from app.services.supabase_service import SupabaseService
+from app.utils.results_export import encode_csv, encode_ndjson, stream_results
+from benchmarks.common import FAKE_SUPABASE_KEY, start_fake_postgrest
+
+LATENCY_MS = 20
+PAGE_SIZE = 1000
+
+
+def result_rows(count: int):
+    """Filas de envios_resultados de una campaña (1 de cada 10 fallida)"""
+    return [
+        {
+            "id": i,
+            "stream_id": f"1760000000000-{i}",
+            "campaign_id": "campana",
+            "numero": f"58412{i:07d}",
+            "estado": "fallido" if i % 10 == 0 else "enviado",
+            "wamid": None if i % 10 == 0 else f"wamid.HBgMNTg0MTI{i:010d}FQIAERgSQ0Q2",
+            "error": "Meta 131026: Message undeliverable" if i % 10 == 0 else None,
+            "status_code": 400 if i % 10 == 0 else 200,
+            "intento": 1,
+            "buzon": "14",
+            "creado_en": "2026-10-17T12:00:00.123456+00:00"
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+async def full_list_export(supabase: SupabaseService, formato: str):
+    """Archivo completo en memoria: todas las filas en una lista y una sola codificación"""
+    rows = []
+    async for page in supabase.iter_results("campana"):
+        rows.extend(page)
+    yield encode_csv(rows, header=True) if formato == "csv" else encode_ndjson(rows)
+
+
+async def streaming_export(supabase: SupabaseService, formato: str):
+    """Como el endpoint: primera página antes de responder, después un bloque por página"""
+    pages = supabase.iter_results("campana")
+    try:
+        first_page = await pages.__anext__()
+    except StopAsyncIteration:
+        first_page = []
+    try:
+        async for chunk in stream_results(first_page, pages, formato):
+            yield chunk
+    finally:
+        await pages.aclose()
+
+
+async def measure(export, supabase: SupabaseService, formato: str):
+    """Primer byte (ms), total (s), bytes y contenido del archivo"""
+    started = time.perf_counter()
+    first_byte = None
+    chunks = []
+    async for chunk in export(supabase, formato):
+        if first_byte is None:
+            first_byte = (time.perf_counter() - started) * 1000
+        chunks.append(chunk)
+    return first_byte, time.perf_counter() - started, b"".join(chunks)
+
+
+async def peak_memory(export, supabase: SupabaseService, formato: str) -> float:
+    """Pico de memoria de Python (MB) exportando sin guardar el archivo (se envía y se descarta)"""
+    tracemalloc.start()
+    async for _ in export(supabase, formato):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.ERROR)
+    counts = [int(sys.argv[1])] if len(sys.argv) > 1 else [10_000, 100_000]
+
+    print(f"PostgREST simulado: {LATENCY_MS} ms por página de {PAGE_SIZE} filas\n")
+    print(f"{'filas':>7} | {'formato':>7} | {'exportación':>14} | {'primer byte (ms)':>16} | {'total (s)':>9} | {'MB':>6} | pico memoria (MB)")
+    print("-" * 96)
+    for count in counts:
+        server = start_fake_postgrest(result_rows(count), latency_ms=LATENCY_MS)
+        supabase = SupabaseService(server.url, FAKE_SUPABASE_KEY, page_size=PAGE_SIZE)
+        await supabase.connect()
+
+        for formato in ("csv", "ndjson"):
+            files = {}
+            for name, export in (("lista completa", full_list_export), ("streaming", streaming_export)):
+                first_byte, total, content = await measure(export, supabase, formato)
+                memory = await peak_memory(export, supabase, formato)
+                files[name] = content
+                print(
+                    f"{count:>7} | {formato:>7} | {name:>14} | {first_byte:>16.1f} | {total:>9.2f} | "
+                    f"{len(content) / 1024 / 1024:>6.1f} | {memory:>8.1f}"
+                )
+            assert files["lista completa"] == files["streaming"], "Los archivos difieren"
+            lines = files["streaming"].count(b"\n")
+            assert lines == count + (1 if formato == "csv" else 0), lines
+
+        failed = [row async for page in supabase.iter_results("campana", estado="fallido") for row in page]
+        assert len(failed) == count // 10 and all(row["estado"] == "fallido" for row in failed)
+        await supabase.disconnect()
+        server.shutdown()
+
+    print("\nOK: mismos archivos; con streaming el primer byte llega tras una página y la memoria no crece con la campaña")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
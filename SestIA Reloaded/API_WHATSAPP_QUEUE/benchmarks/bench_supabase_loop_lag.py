@@ -0,0 +1,87 @@
+"""
+Benchmark: lag del event loop durante consultas de credenciales y health
+checks a Supabase.
+
+Un PostgREST local simulado responde en LOOKUP_MS. Mientras se hacen
+consultas de credenciales (como /api/crear-campana o el worker con el cache
+frío) y health checks (como /health), una tarea mide cuánto se atrasa un
+timer de 5 ms: ese atraso es el que sufren los envíos en vuelo y las demás
+requests HTTP. Se compara el cliente síncrono de Supabase (comportamiento
+anterior) con SupabaseService sobre el cliente asíncrono.
+
+Ejecutar: python -m benchmarks.bench_supabase_loop_lag [consultas]
+"""
+import asyncio
+import logging
+import statistics
+import sys
+import time
+
+from supabase import create_client
+
+from app.services.supabase_service import SupabaseService
+from benchmarks.common import FAKE_SUPABASE_KEY, credential_rows, start_fake_postgrest
+
+LOOKUP_MS = 100
+TICK_SECONDS = 0.005
+
+
+class SyncSupabaseService(SupabaseService):
+    """Comportamiento anterior: cliente síncrono dentro de métodos async"""
+
+    async def connect(self):
+        self.client = create_client(self.supabase_url, self.supabase_key)
+
+    async def disconnect(self):
+        self.client = None
+
+    async def _execute(self, query):
+        return query.execute()
+
+
+async def measure(service: SupabaseService, lookups: int):
+    await service.connect()
+    lags = []
+    running = True
+
+    async def ticker():
+        while running:
+            started = time.monotonic()
+            await asyncio.sleep(TICK_SECONDS)
+            lags.append(time.monotonic() - started - TICK_SECONDS)
+
+    tick_task = asyncio.create_task(ticker())
+    started = time.monotonic()
+    await asyncio.gather(
+        *(service.get_credentials(str(i)) for i in range(lookups)),
+        *(service.health_check() for _ in range(lookups // 4))
+    )
+    elapsed = time.monotonic() - started
+    running = False
+    await tick_task
+    await service.disconnect()
+
+    lags_ms = sorted(lag * 1000 for lag in lags)
+    p99 = lags_ms[min(len(lags_ms) - 1, int(0.99 * len(lags_ms)))]
+    return elapsed, statistics.median(lags_ms), p99, lags_ms[-1]
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.ERROR)
+    lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    server = start_fake_postgrest(credential_rows(lookups), latency_ms=LOOKUP_MS)
+
+    print(
+        f"{lookups} consultas de credenciales + {lookups // 4} health checks simultáneos "
+        f"(PostgREST responde en {LOOKUP_MS} ms)\n"
+    )
+    print(f"{'cliente':>9} | {'tiempo (s)':>10} | {'lag p50 (ms)':>12} | {'lag p99 (ms)':>12} | {'lag máx (ms)':>12}")
+    print("-" * 68)
+    for name, service_class in (("síncrono", SyncSupabaseService), ("asíncrono", SupabaseService)):
+        elapsed, p50, p99, worst = await measure(service_class(server.url, FAKE_SUPABASE_KEY, refresh_interval_seconds=0), lookups)
+        print(f"{name:>9} | {elapsed:>10.2f} | {p50:>12.1f} | {p99:>12.1f} | {worst:>12.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,119 @@
+"""
+Benchmark: worker por ciclos (lotes + gather) vs pool continuo de envío.
+
+Un sender simulado responde con latencia de cola larga: la mayoría de los
+envíos tardan decenas de ms y un porcentaje pequeño se queda colgado hasta
+el timeout. En el modelo por ciclos cada envío lento frena el ciclo
+completo; en el pool continuo solo ocupa un slot.
+
+Ejecutar: python -m benchmarks.bench_worker_pool [mensajes] [timeout_s] [pct_lentos]
+Ejemplo:  python -m benchmarks.bench_worker_pool 10000 5 1
+"""
+import asyncio
+import logging
+import random
+import sys
+
+from app.services.worker import WorkerService
+from app.utils.message_codec import encode_row
+from benchmarks.common import Timer, make_redis_service, sample_message
+
+CAMPAIGNS = 5
+BATCH_SIZE = 100
+MAX_CONCURRENT_BATCHES = 5
+
+
+class LongTailWhatsApp:
+    """Sender simulado con latencia de cola larga (semilla fija)"""
+
+    def __init__(self, timeout: float, slow_ratio: float):
+        self.timeout = timeout
+        self.slow_ratio = slow_ratio
+        self.random = random.Random(42)
+
+    async def send_message(self, credentials, message_data):
+        if self.random.random() < self.slow_ratio:
+            await asyncio.sleep(self.timeout)
+            return {"success": False, "wamid": None, "error": "Timeout al enviar mensaje"}
+        await asyncio.sleep(self.random.lognormvariate(-3.2, 0.5))  # mediana ~40 ms
+        return {"success": True, "wamid": f"wamid.{message_data['numero']}", "error": None}
+
+
+async def setup(total: int, timeout: float, slow_ratio: float) -> WorkerService:
+    redis = await make_redis_service(rtt_ms=0.5)
+    per_campaign = total // CAMPAIGNS
+    for c in range(CAMPAIGNS):
+        rows = (encode_row(sample_message(c * per_campaign + i)) for i in range(per_campaign))
+        await redis.enqueue_campaign(f"bench-{c}", rows, {"plantilla": "p", "buzon": "14", "idioma": "es"})
+
+    worker = WorkerService(
+        redis=redis,
+        supabase=None,
+        whatsapp=LongTailWhatsApp(timeout, slow_ratio),
+        delay_ms=0,
+        batch_size=BATCH_SIZE,
+        max_concurrent_batches=MAX_CONCURRENT_BATCHES
+    )
+    worker._credentials_cache["14"] = {"token": "t", "phone_id": "p"}
+    return worker
+
+
+async def processed(worker: WorkerService) -> int:
+    total = 0
+    for c in range(CAMPAIGNS):
+        stats = await worker.redis.get_campaign_stats(f"bench-{c}")
+        total += stats["enviados"] + stats["fallidos"]
+    return total
+
+
+async def run_lockstep(worker: WorkerService, total: int):
+    """Modelo anterior: un lote por campaña, gather y siguiente ciclo"""
+    worker.stats.start()
+    while True:
+        pending = await worker.redis.get_pending_by_campaign()
+        campaigns = [cid for cid, length in pending.items() if length > 0]
+        if not campaigns:
+            break
+        batches = []
+        for campaign_id in campaigns[:worker.max_concurrent_batches]:
+            batch = await worker.dequeue_batch(campaign_id, worker.batch_size)
+            if batch:
+                batches.append(worker.process_batch(campaign_id, batch))
+        await asyncio.gather(*batches)
+        await worker.stats.flush()
+    await worker.stats.stop()
+    assert await processed(worker) == total
+
+
+async def run_pool(worker: WorkerService, total: int):
+    """Modelo actual: start_worker con pool continuo"""
+    task = asyncio.create_task(worker.start_worker())
+    while await processed(worker) < total:
+        await asyncio.sleep(0.05)
+    worker.is_running = False
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.ERROR)
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    timeout = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    slow_pct = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+    print(
+        f"{total} mensajes en {CAMPAIGNS} campañas, {BATCH_SIZE * MAX_CONCURRENT_BATCHES} slots, "
+        f"{slow_pct}% de envíos colgados {timeout}s\n"
+    )
+    print(f"{'modelo':>12} | {'tiempo (s)':>10} | {'msg/s':>8}")
+    print("-" * 38)
+    for name, runner in (("por ciclos", run_lockstep), ("pool", run_pool)):
+        worker = await setup(total, timeout, slow_pct / 100)
+        with Timer() as timer:
+            await runner(worker, total)
+        await worker.redis.redis_client.flushdb()
+        await worker.redis.disconnect()
+        print(f"{name:>12} | {timer.elapsed:>10.1f} | {total / timer.elapsed:>8.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,330 @@
+"""
+Utilidades compartidas por los benchmarks.
+
+Los benchmarks usan FakeRedis con una latencia de red simulada (RTT) por
+comando, de modo que se pueda medir el efecto de los round trips sin tener
+un Redis remoto. Si se define la variable BENCH_REDIS_URL se usa un Redis real.
+Para Supabase hay un PostgREST local simulado con latencia fija, y para el
+middleware de WhatsApp un servidor HTTP local con keep-alive.
+"""
+import asyncio
+import bisect
+import inspect
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import fakeredis.aioredis
+import redis.asyncio as redis
+
+from app.services.redis_service import RedisService
+from app.services.redis_stream_service import RedisStreamService
+
+
+class LatencyFakeRedis(fakeredis.aioredis.FakeRedis):
+    """FakeRedis que agrega un RTT fijo a cada comando y a cada pipeline"""
+
+    def __init__(self, rtt_ms: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.rtt = rtt_ms / 1000.0
+        self.round_trips = 0
+
+    async def execute_command(self, *args, **options):
+        self.round_trips += 1
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+        return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        pipe = super().pipeline(transaction=transaction, shard_hint=shard_hint)
+        original_execute = pipe.execute
+        client = self
+
+        async def execute(raise_on_error: bool = True):
+            client.round_trips += 1
+            if client.rtt:
+                await asyncio.sleep(client.rtt)
+            return await original_execute(raise_on_error=raise_on_error)
+
+        pipe.execute = execute
+        return pipe
+
+
+async def make_redis_service(
+    rtt_ms: float = 0.0,
+    campaign_ttl: int = 604800,
+    backend: str = "list"
+) -> RedisService:
+    """
+    Crea un RedisService (o RedisStreamService si backend="stream") conectado
+    a FakeRedis con RTT simulado, o a BENCH_REDIS_URL si está definida.
+    """
+    service_class = RedisStreamService if backend == "stream" else RedisService
+    service = service_class(redis_url=os.getenv("BENCH_REDIS_URL", ""), campaign_ttl=campaign_ttl)
+    bench_url = os.getenv("BENCH_REDIS_URL")
+    if bench_url:
+        service.redis_client = redis.from_url(bench_url, encoding="utf-8", decode_responses=True)
+        await service.redis_client.flushdb()
+    else:
+        service.redis_client = LatencyFakeRedis(rtt_ms=rtt_ms, decode_responses=True)
+    await service.connect()
+    return service
+
+
+def sample_message(i: int) -> dict:
+    """Mensaje de campaña con el formato que generan las rutas"""
+    return {
+        "numero": f"58412{i:07d}",
+        "plantilla": "promo_fibra_visual",
+        "buzon": "14",
+        "idioma": "es",
+        "cedula": f"{10000000 + i}",
+        "estatus_servicio": "activo",
+        "variable1": f"Cliente {i}",
+        "variable2": "25.00 USD",
+        "variable3": None,
+        "variable4": None,
+        "variable5": None,
+        "url_imagen": None
+    }
+
+
+class Timer:
+    """Context manager que mide tiempo transcurrido en segundos"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.elapsed: Optional[float] = None
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        return False
+
+
+# API key con formato JWT (el cliente de Supabase valida el formato)
+FAKE_SUPABASE_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.firma"
+
+
+def credential_rows(count: int) -> List[dict]:
+    """Filas de instancias_inputs para `count` buzones (custom_name "0", "1", ...)"""
+    return [
+        {"key": f"token-{i},phone-{i},waba-{i}", "nameid": f"canal_{i}", "custom_name": str(i), "canal": i}
+        for i in range(count)
+    ]
+
+
+class FakePostgrestHandler(BaseHTTPRequestHandler):
+    """
+    Responde consultas GET de PostgREST (filtros eq y gt, offset y limit)
+    tras la latencia simulada. Las filas con "id" deben estar ordenadas por
+    id: id=gt.N se resuelve con búsqueda binaria, como con un índice.
+    """
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        time.sleep(server.latency)
+
+        params = parse_qs(urlparse(self.path).query)
+        start = 0
+        filters = []
+        for column, values in params.items():
+            if column in ("select", "order", "offset", "limit"):
+                continue
+            operator, _, value = values[0].partition(".")
+            if column == "id" and operator == "gt" and server.ids is not None:
+                start = bisect.bisect_right(server.ids, int(value))
+            elif operator == "eq":
+                filters.append(lambda row, column=column, value=value: str(row.get(column)) == value)
+            elif operator == "gt":
+                filters.append(lambda row, column=column, value=value: row[column] > int(value))
+
+        rows = (row for row in itertools.islice(server.rows, start, None) if all(f(row) for f in filters))
+        offset = int(params.get("offset", ["0"])[0])
+        limit = int(params["limit"][0]) if "limit" in params else None
+        body = json.dumps(list(itertools.islice(rows, offset, None if limit is None else offset + limit))).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakePostgrestServer(ThreadingHTTPServer):
+    """PostgREST local simulado: cuenta requests y agrega `latency_ms` a cada una"""
+
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, rows: List[dict], latency_ms: float = 0.0):
+        super().__init__(("127.0.0.1", 0), FakePostgrestHandler)
+        self.rows = rows
+        self.ids = [row["id"] for row in rows] if rows and "id" in rows[0] else None
+        self.latency = latency_ms / 1000.0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+def start_fake_postgrest(rows: List[dict], latency_ms: float = 0.0) -> FakePostgrestServer:
+    """Inicia un FakePostgrestServer en un thread (detener con server.shutdown())"""
+    server = FakePostgrestServer(rows, latency_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+
+def middleware_handler(method: str, path: str, headers: dict, body: bytes):
+    """Respuesta del middleware de WhatsApp a un envío aceptado"""
+    return 200, {"id": f"wamid.{time.monotonic_ns()}"}
+
+
+# Errores de la Graph API simulada por número destino: (HTTP, código de Meta, mensaje)
+GRAPH_STUB_ERRORS = {
+    "580000130429": (400, 130429, "Rate limit hit"),
+    "580000000190": (401, 190, "Error validating access token: Session has expired"),
+    "580000131026": (400, 131026, "Message undeliverable"),
+    "580000131000": (500, 131000, "Something went wrong"),
+}
+
+
+def graph_api_handler(method: str, path: str, headers: dict, body: bytes):
+    """
+    Graph API de Meta simulada: POST /{version}/{phone_id}/messages con token
+    Bearer. Responde como la Cloud API (messages[0].id o error con código de
+    Meta, ver GRAPH_STUB_ERRORS).
+    """
+    if method != "POST":
+        return 200, {}
+    message = json.loads(body)
+    error = GRAPH_STUB_ERRORS.get(message.get("to"))
+    if not headers.get("authorization", "").startswith("Bearer "):
+        error = (401, 190, "Missing access token")
+    if error:
+        status, code, text = error
+        return status, {"error": {"message": text, "type": "OAuthException", "code": code, "fbtrace_id": "stub"}}
+    return 200, {
+        "messaging_product": "whatsapp",
+        "contacts": [{"input": message["to"], "wa_id": message["to"]}],
+        "messages": [{"id": f"wamid.{time.monotonic_ns()}"}]
+    }
+
+
+class FakeHttpServer:
+    """
+    Servidor HTTP/1.1 local con keep-alive y su propio event loop. Responde
+    tras `latency_ms` con lo que devuelva `handler(method, path, headers, body)
+    -> (status, dict)` (función o corrutina; por defecto, el middleware de
+    WhatsApp) y cuenta conexiones y requests. Con `max_concurrency` atiende
+    como máximo esa cantidad de requests a la vez (capacidad del servidor).
+
+    start() lo corre en un thread; start(process=True) en otro proceso, para
+    que no compita por el GIL con el cliente medido (un thread con cientos de
+    conexiones frena al event loop del benchmark).
+    """
+
+    def __init__(self, latency_ms: float = 0.0, handler: Callable = middleware_handler, max_concurrency: int = 0):
+        self.latency = latency_ms / 1000.0
+        self.handler = handler
+        self.max_concurrency = max_concurrency
+        self._capacity: Optional[asyncio.Semaphore] = None
+        self._connections = multiprocessing.Value("i", 0)
+        self._requests = multiprocessing.Value("i", 0)
+        self._port = multiprocessing.Value("i", 0)
+        self._ready = multiprocessing.Event()
+        self._process: Optional[multiprocessing.Process] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def connections(self) -> int:
+        return self._connections.value
+
+    @property
+    def requests(self) -> int:
+        return self._requests.value
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._port.value}"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.value += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self._requests.value += 1
+                status, data = await self._respond(method, path, headers, body)
+                payload = json.dumps(data).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode()
+                    + (payload if method != "HEAD" else b"")
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, method: str, path: str, headers: dict, body: bytes):
+        if self._capacity:
+            async with self._capacity:
+                return await self._call_handler(method, path, headers, body)
+        return await self._call_handler(method, path, headers, body)
+
+    async def _call_handler(self, method: str, path: str, headers: dict, body: bytes):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        result = self.handler(method, path, headers, body)
+        return await result if inspect.isawaitable(result) else result
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        if self.max_concurrency:
+            self._capacity = asyncio.Semaphore(self.max_concurrency)
+        server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, "127.0.0.1", 0, backlog=4096)
+        )
+        self._port.value = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    def start(self, process: bool = False) -> "FakeHttpServer":
+        if process:
+            self._process = multiprocessing.Process(target=self._run, daemon=True)
+            self._process.start()
+        else:
+            threading.Thread(target=self._run, daemon=True).start()
+        self._ready.wait()
+        return self
+
+    def shutdown(self):
+        if self._process:
+            self._process.terminate()
+            self._process.join()
+        elif self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
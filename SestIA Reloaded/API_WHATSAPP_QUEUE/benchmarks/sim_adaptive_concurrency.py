@@ -0,0 +1,96 @@
+"""
+Simulación: control adaptativo de concurrencia frente a un middleware saturable.
+
+El middleware simulado atiende bien hasta CAPACIDAD envíos simultáneos; por
+encima la latencia crece y, pasado 1.5x, responde 503. Se compara el límite
+fijo (500 en vuelo) con el control AIMD partiendo de 125 y se reporta el
+límite al que converge, errores y throughput.
+
+Ejecutar: python -m benchmarks.sim_adaptive_concurrency [mensajes] [capacidad]
+"""
+import asyncio
+import logging
+import sys
+
+from app.services.concurrency_controller import ConcurrencyController
+from app.services.worker import WorkerService
+from app.utils.message_codec import encode_row
+from benchmarks.common import Timer, make_redis_service, sample_message
+
+CONCURRENCY = 500
+
+
+class SaturableWhatsApp:
+    """Middleware simulado con capacidad limitada de envíos simultáneos"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_flight = 0
+
+    async def send_message(self, credentials, message_data):
+        self.in_flight += 1
+        try:
+            load = self.in_flight / self.capacity
+            if load > 1.5:
+                await asyncio.sleep(0.01)
+                return {"success": False, "wamid": None, "error": "HTTP 503", "status_code": 503}
+            await asyncio.sleep(0.05 * max(1.0, load) ** 4)
+            return {"success": True, "wamid": "wamid.x", "error": None, "status_code": 200}
+        finally:
+            self.in_flight -= 1
+
+
+async def run(total: int, capacity: int, adaptive: bool):
+    redis = await make_redis_service()
+    await redis.enqueue_campaign(
+        "carga",
+        (encode_row(sample_message(i)) for i in range(total)),
+        {"plantilla": "p", "buzon": "14", "idioma": "es"}
+    )
+    controller = ConcurrencyController(max_limit=CONCURRENCY, latency_target_ms=200) if adaptive else None
+    worker = WorkerService(
+        redis=redis,
+        supabase=None,
+        whatsapp=SaturableWhatsApp(capacity),
+        delay_ms=0,
+        concurrency=CONCURRENCY,
+        concurrency_controller=controller
+    )
+    worker._credentials_cache["14"] = {"token": "t", "phone_id": "p"}
+
+    with Timer() as timer:
+        task = asyncio.create_task(worker.start_worker())
+        while (await redis.get_campaign_stats("carga"))["pendientes"] > 0:
+            await asyncio.sleep(0.1)
+        worker.is_running = False
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    stats = await redis.get_campaign_stats("carga")
+    await redis.disconnect()
+    return timer.elapsed, stats, controller
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.ERROR)
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    capacity = int(sys.argv[2]) if len(sys.argv) > 2 else 80
+    print(f"{total} mensajes, middleware con capacidad {capacity} envíos simultáneos\n")
+    print(f"{'modelo':>10} | {'tiempo (s)':>10} | {'enviados/s':>10} | {'fallidos':>8} | límite final")
+    print("-" * 62)
+    for adaptive in (False, True):
+        elapsed, stats, controller = await run(total, capacity, adaptive)
+        final = controller.limit if controller else CONCURRENCY
+        name = "AIMD" if adaptive else "fijo"
+        print(
+            f"{name:>10} | {elapsed:>10.1f} | {stats['enviados'] / elapsed:>10.0f} | "
+            f"{stats['fallidos']:>8} | {final}"
+        )
+        if controller:
+            print("\nDecisiones recientes:")
+            for decision in controller.get_status()["decisiones"][-8:]:
+                print(f"  {decision['accion']:>9}: {decision['limite_anterior']} -> {decision['limite']} ({decision['motivo']})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
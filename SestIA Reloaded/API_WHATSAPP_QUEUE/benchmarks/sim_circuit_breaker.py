@@ -0,0 +1,124 @@
+"""
+Simulación: caída prolongada del middleware y un phone_id degradado.
+
+El middleware deja de responder (error de conexión) durante OUTAGE_SECONDS a
+partir del primer segundo de envío; aparte, el phone_id de la segunda campaña
+responde 500 durante toda la simulación salvo los últimos segundos. Se
+compara el worker sin circuitos (solo reintentos con backoff) con los
+circuitos del middleware y por phone_id: llamadas HTTP inútiles durante la
+caída, mensajes perdidos al agotar los reintentos y envíos de la campaña sana
+mientras el otro phone_id falla.
+
+Ejecutar: python -m benchmarks.sim_circuit_breaker [list|stream] [mensajes]
+"""
+import asyncio
+import logging
+import sys
+import time
+from collections import Counter
+
+from app.services.circuit_breaker import CircuitBreakers
+from app.services.whatsapp_service import WhatsAppService
+from app.services.worker import WorkerService
+from app.utils.message_codec import encode_row
+from benchmarks.common import make_redis_service, sample_message
+
+OUTAGE_START = 1.0
+OUTAGE_SECONDS = 8.0
+BAD_PHONE_SECONDS = 12.0
+
+
+class FlakyMiddleware(WhatsAppService):
+    """WhatsAppService real (con sus circuitos) sobre un middleware simulado"""
+
+    def __init__(self, circuit_breakers):
+        super().__init__(api_url="http://middleware", circuit_breakers=circuit_breakers)
+        self.start = None
+        self.calls_during_outage = 0
+        self.calls_to_bad_phone = 0
+        self.delivered = Counter()
+
+    async def _post_message(self, credentials, message_data):
+        now = time.monotonic()
+        if self.start is None:
+            self.start = now
+        elapsed = now - self.start
+        await asyncio.sleep(0.05)
+        if OUTAGE_START <= elapsed < OUTAGE_START + OUTAGE_SECONDS:
+            self.calls_during_outage += 1
+            return {"success": False, "wamid": None, "error": "Error de conexión", "status_code": None, "retryable": True}
+        if credentials["phone_id"] == "phone-malo" and elapsed < BAD_PHONE_SECONDS:
+            self.calls_to_bad_phone += 1
+            return {"success": False, "wamid": None, "error": "HTTP 500", "status_code": 500, "retryable": True}
+        self.delivered[message_data["numero"]] += 1
+        return {"success": True, "wamid": "wamid.x", "error": None, "status_code": 200, "retryable": False}
+
+
+async def run(backend: str, total: int, with_breakers: bool):
+    redis = await make_redis_service(backend=backend)
+    for campaign_id, buzon, offset in (("sana", "14", 0), ("degradada", "15", total)):
+        await redis.enqueue_campaign(
+            campaign_id,
+            (encode_row(sample_message(offset + i)) for i in range(total)),
+            {"plantilla": "p", "buzon": buzon, "idioma": "es"}
+        )
+    breakers = CircuitBreakers(open_seconds=2.0) if with_breakers else None
+    whatsapp = FlakyMiddleware(breakers)
+    worker = WorkerService(
+        redis=redis,
+        supabase=None,
+        whatsapp=whatsapp,
+        delay_ms=0,
+        concurrency=100,
+        retry_max_attempts=5,
+        retry_base_delay_ms=500,
+        retry_max_delay_ms=4000
+    )
+    worker._credentials_cache["14"] = {"token": "t", "phone_id": "phone-sano"}
+    worker._credentials_cache["15"] = {"token": "t", "phone_id": "phone-malo"}
+
+    started = time.monotonic()
+    task = asyncio.create_task(worker.start_worker())
+    while True:
+        stats = [await redis.get_campaign_stats(cid) for cid in ("sana", "degradada")]
+        if all(s["pendientes"] == 0 for s in stats):
+            break
+        await asyncio.sleep(0.1)
+    elapsed = time.monotonic() - started
+    worker.is_running = False
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await redis.disconnect()
+    return elapsed, stats, whatsapp
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.ERROR)
+    backend = sys.argv[1] if len(sys.argv) > 1 else "list"
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 5_000
+    print(
+        f"[{backend}] 2 campañas de {total} mensajes, middleware caído {OUTAGE_SECONDS:.0f}s, "
+        f"phone_id de la campaña degradada con 500 durante {BAD_PHONE_SECONDS:.0f}s\n"
+    )
+    print(
+        f"{'circuitos':>9} | {'tiempo (s)':>10} | {'llamadas en caída':>17} | {'llamadas phone malo':>19} | "
+        f"{'fallidos':>8} | {'reintentos':>10} | duplicados"
+    )
+    print("-" * 106)
+    for with_breakers in (False, True):
+        elapsed, stats, whatsapp = await run(backend, total, with_breakers)
+        failed = sum(s["fallidos"] for s in stats)
+        retries = sum(s["reintentos"] for s in stats)
+        duplicates = sum(count - 1 for count in whatsapp.delivered.values() if count > 1)
+        print(
+            f"{'sí' if with_breakers else 'no':>9} | {elapsed:>10.1f} | {whatsapp.calls_during_outage:>17} | "
+            f"{whatsapp.calls_to_bad_phone:>19} | {failed:>8} | {retries:>10} | {duplicates}"
+        )
+
+    assert failed == 0, "Mensajes perdidos con los circuitos activos"
+    assert len(whatsapp.delivered) == 2 * total and duplicates == 0
+    print("\nOK: con circuitos, ningún mensaje perdido ni duplicado y sin martillar el middleware caído")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
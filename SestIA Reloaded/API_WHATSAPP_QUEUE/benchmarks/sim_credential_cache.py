@@ -0,0 +1,151 @@
+"""
+Simulación: consultas de credenciales a Supabase con el cache por buzon.
+
+1. Cache frío: CONCURRENT envíos simultáneos por buzon piden credenciales a
+   la vez; debe haber una sola consulta por buzon, y otra al vencer el TTL.
+2. Token rotado: a mitad de una campaña Supabase devuelve un token nuevo y
+   el middleware empieza a rechazar el viejo con 401. El primer 401 descarta
+   la entrada del cache y el resto de la campaña usa el token nuevo.
+
+Ejecutar: python -m benchmarks.sim_credential_cache [mensajes]
+"""
+import asyncio
+import logging
+import sys
+import time
+from collections import Counter
+
+from app.services.worker import WorkerService
+from app.utils.message_codec import encode_row
+from benchmarks.common import make_redis_service, sample_message
+
+BUZONES = ("14", "15", "16")
+CONCURRENT = 100
+TTL_SECONDS = 1.0
+LOOKUP_SECONDS = 0.05
+
+
+class FakeSupabase:
+    """Supabase simulado: cuenta consultas por buzon y permite rotar tokens"""
+
+    def __init__(self):
+        self.lookups = Counter()
+        self.token_version = Counter()
+
+    async def get_credentials(self, buzon_id):
+        self.lookups[buzon_id] += 1
+        await asyncio.sleep(LOOKUP_SECONDS)
+        return {"token": f"token-{buzon_id}-v{self.token_version[buzon_id]}", "phone_id": f"phone-{buzon_id}"}
+
+    def invalidate_credentials(self, buzon_id):
+        pass
+
+
+class TokenCheckingWhatsApp:
+    """Middleware simulado que solo acepta el token vigente de cada buzon"""
+
+    def __init__(self, supabase: FakeSupabase):
+        self.supabase = supabase
+        self.rejected = 0
+
+    async def send_message(self, credentials, message_data):
+        await asyncio.sleep(0.01)
+        buzon = credentials["phone_id"].split("-")[1]
+        if credentials["token"] != f"token-{buzon}-v{self.supabase.token_version[buzon]}":
+            self.rejected += 1
+            return {"success": False, "wamid": None, "error": "Token inválido", "status_code": 401, "retryable": False}
+        return {"success": True, "wamid": "wamid.x", "error": None, "status_code": 200, "retryable": False}
+
+
+async def cold_cache():
+    supabase = FakeSupabase()
+    worker = WorkerService(
+        redis=None,
+        supabase=supabase,
+        whatsapp=None,
+        delay_ms=0,
+        credentials_ttl_seconds=TTL_SECONDS
+    )
+
+    async def burst():
+        results = await asyncio.gather(*(
+            worker.get_cached_credentials(buzon) for buzon in BUZONES for _ in range(CONCURRENT)
+        ))
+        assert all(results)
+
+    started = time.monotonic()
+    await burst()
+    elapsed = time.monotonic() - started
+    first = dict(supabase.lookups)
+    await burst()
+    cached = dict(supabase.lookups)
+    await asyncio.sleep(TTL_SECONDS)
+    await burst()
+    expired = dict(supabase.lookups)
+
+    print(f"{len(BUZONES)} buzones x {CONCURRENT} envíos simultáneos (consulta de {LOOKUP_SECONDS * 1000:.0f} ms, TTL {TTL_SECONDS:.0f}s)")
+    print(f"  cache frío:        {sum(first.values()):>4} consultas ({elapsed * 1000:.0f} ms)")
+    print(f"  cache vigente:     {sum(cached.values()) - sum(first.values()):>4} consultas")
+    print(f"  después del TTL:   {sum(expired.values()) - sum(cached.values()):>4} consultas")
+    assert all(first[buzon] == 1 for buzon in BUZONES), first
+    assert cached == first
+    assert all(expired[buzon] == 2 for buzon in BUZONES), expired
+
+
+async def token_rotation(total: int):
+    redis = await make_redis_service()
+    for buzon in BUZONES:
+        await redis.enqueue_campaign(
+            f"campana-{buzon}",
+            (encode_row(sample_message(i)) for i in range(total)),
+            {"plantilla": "p", "buzon": buzon, "idioma": "es"}
+        )
+    supabase = FakeSupabase()
+    whatsapp = TokenCheckingWhatsApp(supabase)
+    worker = WorkerService(
+        redis=redis,
+        supabase=supabase,
+        whatsapp=whatsapp,
+        delay_ms=0,
+        concurrency=100,
+        credentials_ttl_seconds=3600
+    )
+    task = asyncio.create_task(worker.start_worker())
+
+    rotated = False
+    while True:
+        stats = [await redis.get_campaign_stats(f"campana-{buzon}") for buzon in BUZONES]
+        sent = sum(s["enviados"] + s["fallidos"] for s in stats)
+        if not rotated and sent >= len(BUZONES) * total // 2:
+            for buzon in BUZONES:
+                supabase.token_version[buzon] += 1
+            rotated = True
+        if all(s["pendientes"] == 0 for s in stats):
+            break
+        await asyncio.sleep(0.02)
+
+    worker.is_running = False
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await redis.disconnect()
+
+    failed = sum(s["fallidos"] for s in stats)
+    print(f"\nToken rotado a mitad de {len(BUZONES)} campañas de {total} mensajes (TTL 1 h)")
+    print(f"  consultas a Supabase: {sum(supabase.lookups.values())} ({dict(supabase.lookups)})")
+    print(f"  envíos rechazados con el token viejo: {whatsapp.rejected} de {len(BUZONES) * total}")
+    assert all(supabase.lookups[buzon] == 2 for buzon in BUZONES), supabase.lookups
+    assert failed == whatsapp.rejected
+    # Solo fallan los envíos que ya estaban en vuelo con el token viejo
+    assert whatsapp.rejected <= len(BUZONES) * 100
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.ERROR)
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    await cold_cache()
+    await token_rotation(total)
+    print("\nOK: una consulta por buzon por TTL y token rotado recargado tras el primer 401")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+"""
+Simulación: tiempo hasta el primer envío de campañas chicas encoladas
+detrás de campañas grandes.
+
+Se encolan GRANDES campañas grandes y después CHICAS campañas chicas. Se
+compara el reparto anterior (solo las primeras MAX_CONCURRENT_BATCHES
+campañas del registro, un lote cada una) con el deficit round-robin actual,
+midiendo para las campañas chicas el tiempo hasta el primer envío y hasta
+completarse.
+
+Ejecutar: python -m benchmarks.sim_fair_scheduling [mensajes_grandes]
+"""
+import asyncio
+import logging
+import statistics
+import sys
+import time
+
+from app.services.worker import WorkerService
+from app.utils.message_codec import encode_row
+from benchmarks.common import make_redis_service, sample_message
+
+GRANDES = 6
+CHICAS = 5
+MENSAJES_CHICAS = 50
+BATCH_SIZE = 100
+MAX_CONCURRENT_BATCHES = 5
+
+
+class FirstCampaignsScheduler:
+    """Reparto anterior: un lote para cada una de las primeras campañas"""
+
+    def __init__(self, batch_size: int, max_campaigns: int):
+        self.batch_size = batch_size
+        self.max_campaigns = max_campaigns
+
+    def plan(self, pending, weights, budget):
+        campaigns = [cid for cid, count in pending.items() if count > 0]
+        return [(cid, self.batch_size) for cid in campaigns[:self.max_campaigns]]
+
+
+class RecordingWhatsApp:
+    """Sender simulado: registra el instante del primer y último envío por campaña"""
+
+    def __init__(self):
+        self.first = {}
+        self.last = {}
+
+    async def send_message(self, credentials, message_data):
+        await asyncio.sleep(0.05)
+        campaign_id = message_data["cedula"]
+        now = time.monotonic()
+        self.first.setdefault(campaign_id, now)
+        self.last[campaign_id] = now
+        return {"success": True, "wamid": "wamid.x", "error": None, "status_code": 200}
+
+
+async def small_campaigns_done(redis, campaign_ids) -> bool:
+    for campaign_id in campaign_ids:
+        if (await redis.get_campaign_stats(campaign_id))["enviados"] < MENSAJES_CHICAS:
+            return False
+    return True
+
+
+async def run(big_size: int, legacy: bool):
+    redis = await make_redis_service()
+    metadata = {"plantilla": "p", "buzon": "14", "idioma": "es"}
+
+    # La cédula identifica la campaña en el sender simulado
+    def rows(campaign_id: str, size: int):
+        for i in range(size):
+            message = sample_message(i)
+            message["cedula"] = campaign_id
+            yield encode_row(message)
+
+    for c in range(GRANDES):
+        await redis.enqueue_campaign(f"grande-{c}", rows(f"grande-{c}", big_size), metadata)
+    for c in range(CHICAS):
+        await redis.enqueue_campaign(f"chica-{c}", rows(f"chica-{c}", MENSAJES_CHICAS), metadata)
+
+    whatsapp = RecordingWhatsApp()
+    worker = WorkerService(
+        redis=redis,
+        supabase=None,
+        whatsapp=whatsapp,
+        delay_ms=0,
+        batch_size=BATCH_SIZE,
+        max_concurrent_batches=MAX_CONCURRENT_BATCHES
+    )
+    worker._credentials_cache["14"] = {"token": "t", "phone_id": "p"}
+    if legacy:
+        worker.scheduler = FirstCampaignsScheduler(BATCH_SIZE, MAX_CONCURRENT_BATCHES)
+
+    small = [f"chica-{c}" for c in range(CHICAS)]
+    start = time.monotonic()
+    task = asyncio.create_task(worker.start_worker())
+    while not await small_campaigns_done(redis, small):
+        await asyncio.sleep(0.05)
+    worker.is_running = False
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await redis.disconnect()
+
+    first = [whatsapp.first[cid] - start for cid in small]
+    done = [whatsapp.last[cid] - start for cid in small]
+    return first, done
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.ERROR)
+    big_size = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    print(
+        f"{GRANDES} campañas de {big_size} mensajes encoladas antes que "
+        f"{CHICAS} campañas de {MENSAJES_CHICAS}\n"
+    )
+    print(f"{'reparto':>16} | {'1er envío medio (s)':>19} | {'1er envío máx (s)':>17} | {'chicas completas (s)':>20}")
+    print("-" * 83)
+    for name, legacy in (("primeras 5", True), ("DRR", False)):
+        first, done = await run(big_size, legacy)
+        print(f"{name:>16} | {statistics.mean(first):>19.2f} | {max(first):>17.2f} | {max(done):>20.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
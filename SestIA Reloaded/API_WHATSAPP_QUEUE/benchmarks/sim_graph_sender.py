@@ -0,0 +1,159 @@
+"""
+Simulación: envío directo a la Graph API de Meta contra una Graph API local
+simulada.
+
+1. Mensaje: MetaGraphService debe llamar a /{version}/{phone_id}/messages con
+   el token del buzon como Bearer y el mismo contenido que arma el middleware
+   (variables del cuerpo y cabecera con imagen).
+2. Errores de Meta: límites de envío (HTTP 400 con código 130429) y errores
+   temporales deben quedar reintentables; token vencido (190) como 401 para
+   que el worker descarte las credenciales; número inválido sin reintento.
+3. Selección por buzon: con WHATSAPP_SENDER_BUZON_OVERRIDES={"14": "graph"}
+   la campaña del buzon 14 sale directo a Meta y la del 15 por el middleware.
+
+Ejecutar: python -m benchmarks.sim_graph_sender [mensajes]
+"""
+import asyncio
+import json
+import logging
+import sys
+
+from app.services.meta_graph_service import MetaGraphService
+from app.services.sender_router import SenderRouter
+from app.services.whatsapp_service import WhatsAppService
+from app.services.worker import WorkerService
+from app.utils.message_codec import encode_row
+from benchmarks.common import FakeHttpServer, graph_api_handler, make_redis_service, sample_message
+
+CREDENTIALS = {"token": "token-14", "phone_id": "phone-14"}
+
+
+class RecordingGraphApi:
+    """Graph API simulada que guarda las requests recibidas"""
+
+    def __init__(self):
+        self.received = []
+
+    def __call__(self, method, path, headers, body):
+        if method == "POST":
+            self.received.append((path, headers, json.loads(body)))
+        return graph_api_handler(method, path, headers, body)
+
+
+class FakeSupabase:
+    """Credenciales por buzon"""
+
+    async def get_credentials(self, buzon_id):
+        return {"token": f"token-{buzon_id}", "phone_id": f"phone-{buzon_id}"}
+
+    def invalidate_credentials(self, buzon_id):
+        pass
+
+
+async def message_format(server: FakeHttpServer, graph: RecordingGraphApi):
+    service = MetaGraphService(graph_url=server.url, api_version="v21.0")
+    await service.connect()
+
+    message = dict(sample_message(1), url_imagen="https://i.imgur.com/promo.jpg")
+    result = await service.send_message(CREDENTIALS, message)
+    path, headers, body = graph.received[-1]
+    assert result["success"] and result["wamid"].startswith("wamid."), result
+    assert path == "/v21.0/phone-14/messages", path
+    assert headers["authorization"] == "Bearer token-14"
+    assert body == {
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": "584120000001",
+        "type": "template",
+        "template": {
+            "name": "promo_fibra_visual",
+            "language": {"code": "es"},
+            "components": [
+                {"type": "header", "parameters": [{"type": "image", "image": {"link": "https://i.imgur.com/promo.jpg"}}]},
+                {"type": "body", "parameters": [{"type": "text", "text": "Cliente 1"}, {"type": "text", "text": "25.00 USD"}]}
+            ]
+        }
+    }, body
+
+    plain = dict(sample_message(2), variable1=None, variable2=None)
+    assert (await service.send_message(CREDENTIALS, plain))["success"]
+    assert "components" not in graph.received[-1][2]["template"]
+    print("Mensaje: endpoint, token Bearer, variables del cuerpo e imagen de cabecera OK")
+
+    print(f"\n{'número':>13} | {'error de Meta':<45} | {'status':>6} | reintentable")
+    print("-" * 85)
+    expected = {
+        "580000130429": (429, True),
+        "580000000190": (401, False),
+        "580000131026": (400, False),
+        "580000131000": (503, True),
+    }
+    for numero, (status_code, retryable) in expected.items():
+        result = await service.send_message(CREDENTIALS, dict(sample_message(3), numero=numero))
+        print(f"{numero:>13} | {result['error'][:45]:<45} | {result['status_code']:>6} | {'sí' if result['retryable'] else 'no'}")
+        assert not result["success"]
+        assert (result["status_code"], result["retryable"]) == (status_code, retryable), result
+        assert WhatsAppService.is_auth_error_status(result["status_code"]) == (status_code == 401)
+
+    await service.disconnect()
+
+
+async def routing(graph_server: FakeHttpServer, graph: RecordingGraphApi, total: int):
+    middleware_server = FakeHttpServer().start()
+    router = SenderRouter(
+        senders={
+            "middleware": WhatsAppService(f"{middleware_server.url}/enviar-mensaje"),
+            "graph": MetaGraphService(graph_url=graph_server.url)
+        },
+        default="middleware",
+        buzon_senders={"14": "graph"}
+    )
+    await router.connect()
+
+    redis = await make_redis_service()
+    for buzon in ("14", "15"):
+        await redis.enqueue_campaign(
+            f"campana-{buzon}",
+            (encode_row(sample_message(i)) for i in range(total)),
+            {"plantilla": "promo_fibra_visual", "buzon": buzon, "idioma": "es"}
+        )
+    worker = WorkerService(redis=redis, supabase=FakeSupabase(), whatsapp=router, delay_ms=0, concurrency=50)
+    graph.received.clear()
+    task = asyncio.create_task(worker.start_worker())
+    while True:
+        stats = [await redis.get_campaign_stats(f"campana-{buzon}") for buzon in ("14", "15")]
+        if all(s["pendientes"] == 0 for s in stats):
+            break
+        await asyncio.sleep(0.05)
+
+    worker.is_running = False
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await router.disconnect()
+    await redis.disconnect()
+    middleware_server.shutdown()
+
+    http_stats = router.get_http_stats()
+    print(f"\nCampañas de {total} mensajes: buzon 14 → graph, buzon 15 → middleware")
+    print(f"  Graph API:  {len(graph.received)} envíos, phone_ids {sorted({path.split('/')[2] for path, _, _ in graph.received})}")
+    print(f"  middleware: {middleware_server.requests} envíos")
+    assert all(s["enviados"] == total for s in stats), stats
+    assert len(graph.received) == total and {path for path, _, _ in graph.received} == {"/v21.0/phone-14/messages"}
+    assert middleware_server.requests == total
+    assert http_stats["graph"]["solicitudes"] == total and http_stats["middleware"]["solicitudes"] == total
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.ERROR)
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    graph = RecordingGraphApi()
+    graph_server = FakeHttpServer(handler=graph).start()
+
+    await message_format(graph_server, graph)
+    await routing(graph_server, graph, total)
+    graph_server.shutdown()
+    print("\nOK: mensajes de plantilla directo a Meta, errores clasificados y sender elegido por buzon")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
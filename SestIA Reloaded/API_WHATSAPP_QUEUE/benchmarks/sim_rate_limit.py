@@ -0,0 +1,96 @@
+"""
+Simulación: límite de envíos por phone_id compartido entre réplicas.
+
+Tres réplicas del worker procesan la misma campaña (un solo phone_id) con
+RATE_LIMIT_PER_SECOND=100. Se verifica que el ritmo agregado respeta el
+límite (máximo de envíos en cualquier ventana de 1 s <= rate + ráfaga, y
+ritmo sostenido <= rate) y que ningún envío falla por el límite: los
+senders esperan su turno.
+
+Ejecutar: python -m benchmarks.sim_rate_limit [mensajes] [rate]
+"""
+import asyncio
+import bisect
+import logging
+import sys
+import time
+
+from app.services.rate_limiter import RateLimiter
+from app.services.worker import WorkerService
+from app.utils.message_codec import encode_row
+from benchmarks.common import make_redis_service, sample_message
+
+REPLICAS = 3
+
+
+class TimestampWhatsApp:
+    """Sender simulado: registra el instante de cada envío"""
+
+    def __init__(self, sent_at: list):
+        self.sent_at = sent_at
+
+    async def send_message(self, credentials, message_data):
+        self.sent_at.append(time.monotonic())
+        await asyncio.sleep(0.02)
+        return {"success": True, "wamid": f"wamid.{message_data['numero']}", "error": None}
+
+
+def max_per_second(timestamps: list) -> int:
+    """Máximo de envíos en cualquier ventana deslizante de 1 s"""
+    timestamps = sorted(timestamps)
+    return max(
+        bisect.bisect_left(timestamps, t + 1.0) - i
+        for i, t in enumerate(timestamps)
+    )
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.ERROR)
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 100.0
+
+    redis = await make_redis_service()
+    await redis.enqueue_campaign(
+        "limitada",
+        (encode_row(sample_message(i)) for i in range(total)),
+        {"plantilla": "p", "buzon": "14", "idioma": "es"}
+    )
+
+    sent_at = []
+    workers = []
+    for i in range(REPLICAS):
+        worker = WorkerService(
+            redis=redis,
+            supabase=None,
+            whatsapp=TimestampWhatsApp(sent_at),
+            delay_ms=0,
+            consumer_name=f"replica-{i}",
+            rate_limiter=RateLimiter(redis, default_rate=rate)
+        )
+        worker._credentials_cache["14"] = {"token": "t", "phone_id": "phone-14"}
+        workers.append(worker)
+
+    start = time.monotonic()
+    tasks = [asyncio.create_task(worker.start_worker()) for worker in workers]
+    while (await redis.get_campaign_stats("limitada"))["pendientes"] > 0:
+        await asyncio.sleep(0.05)
+    elapsed = max(sent_at) - start
+    for worker, task in zip(workers, tasks):
+        worker.is_running = False
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    stats = await redis.get_campaign_stats("limitada")
+    peak = max_per_second(sent_at)
+    print(f"{total} mensajes, {REPLICAS} réplicas, límite {rate:.0f} msg/s por phone_id")
+    print(f"Tiempo: {elapsed:.1f}s - ritmo medio: {total / elapsed:.0f} msg/s - pico en 1 s: {peak}")
+    print(f"Enviados: {stats['enviados']}, fallidos: {stats['fallidos']}")
+    assert stats["enviados"] == total and stats["fallidos"] == 0
+    # Ráfaga inicial = rate (RATE_LIMIT_BURST=0), después ritmo constante
+    assert peak <= 2 * rate, "Se superó el límite por phone_id"
+    assert elapsed >= (total - rate) / rate * 0.95, "Ritmo sostenido por encima del límite"
+    print("OK: límite respetado entre réplicas sin envíos fallidos")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
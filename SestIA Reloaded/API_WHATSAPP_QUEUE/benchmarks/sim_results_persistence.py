@@ -0,0 +1,211 @@
+"""
+Simulación: resultados por mensaje guardados en Supabase por lotes.
+
+Una campaña con números inválidos (400, terminados en 7) y números que
+fallan una vez con 503 (terminados en 3, se reintentan) se envía con el
+flusher de resultados contra una tabla de Supabase simulada que tarda
+SUPABASE_LATENCY_MS por inserción y se cae OUTAGE_SECONDS durante el envío
+(la primera inserción de la caída se guarda pero la respuesta se pierde).
+
+Verifica que:
+- cada número tiene exactamente un resultado definitivo (enviado o fallido)
+  y los reintentos quedan como filas "reintento" del intento anterior
+- la caída de Supabase no pierde ni duplica resultados
+- un lote leído por una réplica que se cae antes de guardarlo lo guarda el
+  siguiente flusher con el mismo consumidor
+- el envío de la campaña no espera a Supabase (ni durante la caída). Con
+  FakeRedis el XADD de cada resultado (~60 µs) corre en este proceso y suma
+  algo de CPU al envío; en Redis real ese costo es del servidor
+
+Ejecutar: python -m benchmarks.sim_results_persistence [mensajes]
+"""
+import asyncio
+import logging
+import sys
+import time
+from collections import Counter, defaultdict
+
+from app.services.results_flusher import ResultsFlusher
+from app.services.worker import WorkerService
+from app.utils.message_codec import encode_row
+from benchmarks.common import make_redis_service, sample_message
+
+SUPABASE_LATENCY_MS = 150
+OUTAGE_START = 1.0
+OUTAGE_SECONDS = 2.0
+
+
+class FakeResultsTable:
+    """Tabla de resultados simulada (upsert ignorando stream_id repetidos)"""
+
+    def __init__(self):
+        self.rows = {}
+        self.requests = 0
+        self.duplicates = 0
+        self.start = None
+        self.lost_response = False
+
+    async def insert_results(self, rows):
+        now = time.monotonic()
+        if self.start is None:
+            self.start = now
+        self.requests += 1
+        await asyncio.sleep(SUPABASE_LATENCY_MS / 1000)
+        in_outage = OUTAGE_START <= now - self.start < OUTAGE_START + OUTAGE_SECONDS
+        if in_outage and self.lost_response:
+            raise ConnectionError("Supabase no disponible")
+        for row in rows:
+            if row["stream_id"] in self.rows:
+                self.duplicates += 1
+            else:
+                self.rows[row["stream_id"]] = row
+        if in_outage:
+            # Guardado, pero la respuesta no llega: el lote se reintenta
+            self.lost_response = True
+            raise TimeoutError("Respuesta de Supabase perdida")
+
+
+class FlakyWhatsApp:
+    """Middleware simulado: 400 para números terminados en 7, un 503 para los terminados en 3"""
+
+    def __init__(self):
+        self.attempts = Counter()
+
+    async def send_message(self, credentials, message_data):
+        numero = message_data["numero"]
+        self.attempts[numero] += 1
+        await asyncio.sleep(0.02)
+        if numero.endswith("7"):
+            return {"success": False, "wamid": None, "error": "Número inválido", "status_code": 400, "retryable": False}
+        if numero.endswith("3") and self.attempts[numero] == 1:
+            return {"success": False, "wamid": None, "error": "HTTP 503", "status_code": 503, "retryable": True}
+        return {"success": True, "wamid": f"wamid.{numero}", "error": None, "status_code": 200, "retryable": False}
+
+
+async def run_campaign(total: int, persist: bool):
+    redis = await make_redis_service()
+    await redis.enqueue_campaign(
+        "campana",
+        (encode_row(sample_message(i)) for i in range(total)),
+        {"plantilla": "p", "buzon": "14", "idioma": "es"}
+    )
+    table = FakeResultsTable()
+    flusher = ResultsFlusher(
+        redis=redis,
+        supabase=table,
+        batch_size=500,
+        flush_interval_ms=200,
+        max_backoff_seconds=1.0
+    ) if persist else None
+    worker = WorkerService(
+        redis=redis,
+        supabase=None,
+        whatsapp=FlakyWhatsApp(),
+        delay_ms=0,
+        concurrency=100,
+        retry_base_delay_ms=200,
+        retry_max_delay_ms=1000,
+        results_flusher=flusher
+    )
+    worker._credentials_cache["14"] = {"token": "t", "phone_id": "p"}
+
+    started = time.monotonic()
+    task = asyncio.create_task(worker.start_worker())
+    while (await redis.get_campaign_stats("campana"))["pendientes"] > 0:
+        await asyncio.sleep(0.05)
+    elapsed = time.monotonic() - started
+
+    # Con la campaña enviada, esperar a que se guarde todo lo acumulado
+    if flusher:
+        while await redis.get_results_backlog() > 0:
+            await asyncio.sleep(0.05)
+    saved = time.monotonic() - started
+    worker.is_running = False
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    stats = await redis.get_campaign_stats("campana")
+    status = await worker.get_results_status()
+    await redis.disconnect()
+    return elapsed, saved, stats, table, status
+
+
+async def crash_recovery():
+    """Un lote leído y no guardado (réplica caída) lo guarda el siguiente flusher"""
+    redis = await make_redis_service()
+    await redis.ensure_results_group()
+    outcomes = [{"campaign_id": "c", "numero": str(i), "estado": "enviado"} for i in range(120)]
+    await redis.apply_results({"c": {
+        "enviados": len(outcomes), "fallidos": 0, "reintentos": 0, "ultimo_envio": None,
+        "retries": [], "outcomes": outcomes, "leases": []
+    }})
+
+    class DownTable:
+        async def insert_results(self, rows):
+            raise ConnectionError("Supabase no disponible")
+
+    crashed = ResultsFlusher(redis=redis, supabase=DownTable(), batch_size=100)
+    crashed.consumer_name = "worker-1"
+    try:
+        await crashed.flush()
+    except ConnectionError:
+        pass
+
+    table = FakeResultsTable()
+    table.start = -1e9  # Sin caída
+    restarted = ResultsFlusher(redis=redis, supabase=table, batch_size=100)
+    restarted.consumer_name = "worker-1"
+    while await restarted.flush():
+        pass
+
+    numbers = sorted(int(row["numero"]) for row in table.rows.values())
+    backlog = await redis.get_results_backlog()
+    await redis.disconnect()
+    print(f"\nRéplica caída con un lote de 100 leído: {len(numbers)} resultados guardados al reiniciar, {backlog} en Redis")
+    assert numbers == list(range(120)) and backlog == 0
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.CRITICAL)
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    print(
+        f"{total} mensajes, Supabase {SUPABASE_LATENCY_MS} ms por inserción y caído "
+        f"{OUTAGE_SECONDS:.0f}s desde el segundo {OUTAGE_START:.0f}\n"
+    )
+    print(f"{'resultados':>10} | {'envío (s)':>9} | {'guardado (s)':>12} | {'filas':>6} | {'inserciones':>11} | {'errores':>7} | duplicados ignorados")
+    print("-" * 94)
+    for persist in (False, True):
+        elapsed, saved, stats, table, status = await run_campaign(total, persist)
+        print(
+            f"{'sí' if persist else 'no':>10} | {elapsed:>9.2f} | {saved if persist else 0:>12.2f} | {len(table.rows):>6} | "
+            f"{table.requests:>11} | {status['errores'] if status else 0:>7} | {table.duplicates}"
+        )
+        if not persist:
+            baseline = elapsed
+
+    final = defaultdict(list)
+    retried = Counter()
+    for row in table.rows.values():
+        if row["estado"] == "reintento":
+            retried[row["numero"]] += 1
+            assert row["intento"] == 1 and row["error"] == "HTTP 503", row
+        else:
+            final[row["numero"]].append(row)
+
+    invalid = sum(1 for i in range(total) if sample_message(i)["numero"].endswith("7"))
+    assert len(final) == total and all(len(rows) == 1 for rows in final.values()), "Resultado definitivo perdido o duplicado"
+    assert sum(1 for rows in final.values() if rows[0]["estado"] == "fallido") == stats["fallidos"] == invalid
+    assert all(rows[0]["wamid"] == f"wamid.{numero}" for numero, rows in final.items() if rows[0]["estado"] == "enviado")
+    assert retried == Counter(numero for numero in final if numero.endswith("3"))
+    assert all(final[numero][0]["intento"] == 2 for numero in retried)
+    assert status["errores"] > 0 and table.duplicates > 0 and status["pendientes"] == 0
+    assert elapsed - baseline < OUTAGE_SECONDS / 2, "El envío esperó a Supabase"
+    print(f"\n{len(final)} resultados definitivos ({invalid} fallidos) + {len(retried)} reintentos, sin pérdidas ni duplicados")
+
+    await crash_recovery()
+    print("\nOK: resultados completos en Supabase por lotes, sin frenar el envío")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
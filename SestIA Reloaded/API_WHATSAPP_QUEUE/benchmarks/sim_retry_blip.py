@@ -0,0 +1,103 @@
+"""
+Simulación: caída breve del middleware durante una campaña.
+
+El middleware responde 503 durante BLIP_SECONDS a partir del primer segundo
+de envío; además rechaza con 400 (error permanente del mensaje) los números
+terminados en 7. Se compara el worker sin reintentos con la cola de
+reintentos con backoff y se verifica que, con reintentos, cada número válido
+se envía exactamente una vez y solo los 400 quedan como fallidos.
+
+Ejecutar: python -m benchmarks.sim_retry_blip [list|stream] [mensajes]
+"""
+import asyncio
+import logging
+import sys
+import time
+from collections import Counter
+
+from app.services.worker import WorkerService
+from app.utils.message_codec import encode_row
+from benchmarks.common import make_redis_service, sample_message
+
+BLIP_START = 1.0
+BLIP_SECONDS = 2.0
+
+
+class BlipWhatsApp:
+    """Middleware simulado con una caída temporal y números inválidos"""
+
+    def __init__(self):
+        self.start = None
+        self.delivered = Counter()
+
+    async def send_message(self, credentials, message_data):
+        now = time.monotonic()
+        if self.start is None:
+            self.start = now
+        await asyncio.sleep(0.05)
+        if BLIP_START <= now - self.start < BLIP_START + BLIP_SECONDS:
+            return {"success": False, "wamid": None, "error": "HTTP 503", "status_code": 503, "retryable": True}
+        if message_data["numero"].endswith("7"):
+            return {"success": False, "wamid": None, "error": "Número inválido", "status_code": 400, "retryable": False}
+        self.delivered[message_data["numero"]] += 1
+        return {"success": True, "wamid": "wamid.x", "error": None, "status_code": 200, "retryable": False}
+
+
+async def run(backend: str, total: int, max_attempts: int):
+    redis = await make_redis_service(backend=backend)
+    await redis.enqueue_campaign(
+        "campana",
+        (encode_row(sample_message(i)) for i in range(total)),
+        {"plantilla": "p", "buzon": "14", "idioma": "es"}
+    )
+    whatsapp = BlipWhatsApp()
+    worker = WorkerService(
+        redis=redis,
+        supabase=None,
+        whatsapp=whatsapp,
+        delay_ms=0,
+        concurrency=100,
+        retry_max_attempts=max_attempts,
+        retry_base_delay_ms=500,
+        retry_max_delay_ms=4000
+    )
+    worker._credentials_cache["14"] = {"token": "t", "phone_id": "p"}
+
+    started = time.monotonic()
+    task = asyncio.create_task(worker.start_worker())
+    while (await redis.get_campaign_stats("campana"))["pendientes"] > 0:
+        await asyncio.sleep(0.1)
+    elapsed = time.monotonic() - started
+    worker.is_running = False
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    stats = await redis.get_campaign_stats("campana")
+    await redis.disconnect()
+    return elapsed, stats, whatsapp.delivered
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.ERROR)
+    backend = sys.argv[1] if len(sys.argv) > 1 else "list"
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    invalid = sum(1 for i in range(total) if sample_message(i)["numero"].endswith("7"))
+    print(f"[{backend}] {total} mensajes ({invalid} inválidos), middleware caído {BLIP_SECONDS:.0f}s\n")
+    print(f"{'máx reint.':>10} | {'tiempo (s)':>10} | {'enviados':>8} | {'fallidos':>8} | {'reintentos':>10} | duplicados")
+    print("-" * 72)
+    for max_attempts in (0, 5):
+        elapsed, stats, delivered = await run(backend, total, max_attempts)
+        duplicates = sum(count - 1 for count in delivered.values() if count > 1)
+        print(
+            f"{max_attempts:>10} | {elapsed:>10.1f} | {stats['enviados']:>8} | {stats['fallidos']:>8} | "
+            f"{stats['reintentos']:>10} | {duplicates}"
+        )
+
+    assert stats["enviados"] == total - invalid == len(delivered), "Mensajes válidos sin enviar"
+    assert stats["fallidos"] == invalid, "Fallos permanentes reintentados o transitorios perdidos"
+    assert duplicates == 0
+    print("\nOK: ningún mensaje válido perdido por la caída, sin envíos duplicados")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+"""
+Simulación: cache de credenciales compartido en Redis entre réplicas.
+
+1. Deploy: REPLICAS réplicas arrancan una tras otra con el cache en memoria
+   vacío y envían campañas de BUZONES buzones. Se cuentan las consultas a
+   Supabase con y sin el cache compartido, y se verifica que en Redis los
+   tokens no quedan en texto plano.
+2. Invalidación: una réplica recibe un 401 con el token de un buzon; las
+   demás deben descartar su copia en memoria por pub/sub.
+
+Ejecutar: python -m benchmarks.sim_shared_credentials
+"""
+import asyncio
+import logging
+from collections import Counter
+
+from cryptography.fernet import Fernet
+
+from app.services.credential_cache import SharedCredentialStore
+from app.services.redis_scripts import CREDENTIALS_KEY_PREFIX
+from app.services.redis_service import RedisService
+from app.services.worker import WorkerService
+from benchmarks.common import make_redis_service
+
+REPLICAS = 3
+BUZONES = [str(buzon) for buzon in range(20)]
+LOOKUP_SECONDS = 0.05
+
+
+class FakeSupabase:
+    """Supabase simulado: cuenta consultas por buzon"""
+
+    def __init__(self):
+        self.lookups = Counter()
+
+    async def get_credentials(self, buzon_id):
+        self.lookups[buzon_id] += 1
+        await asyncio.sleep(LOOKUP_SECONDS)
+        return {"token": f"EAAG-secreto-{buzon_id}", "phone_id": f"phone-{buzon_id}"}
+
+    def invalidate_credentials(self, buzon_id):
+        pass
+
+
+async def make_replica(redis: RedisService, supabase: FakeSupabase, key: bytes, shared: bool) -> WorkerService:
+    """Réplica con su propio RedisService sobre el mismo servidor"""
+    replica_redis = RedisService(redis_url="")
+    replica_redis.redis_client = redis.redis_client
+    await replica_redis.connect()
+    return WorkerService(
+        redis=replica_redis,
+        supabase=supabase,
+        whatsapp=None,
+        delay_ms=0,
+        shared_credentials=SharedCredentialStore(replica_redis, key.decode()) if shared else None
+    )
+
+
+async def rolling_deploy(shared: bool) -> int:
+    redis = await make_redis_service()
+    supabase = FakeSupabase()
+    key = Fernet.generate_key()
+    for _ in range(REPLICAS):
+        replica = await make_replica(redis, supabase, key, shared)
+        await asyncio.gather(*(replica.get_cached_credentials(buzon) for buzon in BUZONES for _ in range(10)))
+
+    if shared:
+        raw = await redis.redis_client.get(f"{CREDENTIALS_KEY_PREFIX}{BUZONES[0]}")
+        assert raw and "EAAG" not in raw and "phone" not in raw, "Credenciales en texto plano en Redis"
+    await redis.disconnect()
+    return sum(supabase.lookups.values())
+
+
+async def cross_replica_invalidation():
+    redis = await make_redis_service()
+    supabase = FakeSupabase()
+    key = Fernet.generate_key()
+    replicas = [await make_replica(redis, supabase, key, shared=True) for _ in range(REPLICAS)]
+    for replica in replicas:
+        replica.is_running = True
+        await replica.get_cached_credentials("7")
+    listeners = [asyncio.create_task(replica._credentials_invalidation_loop()) for replica in replicas]
+    await asyncio.sleep(0.1)
+
+    await replicas[0].invalidate_credentials("7")
+    await asyncio.sleep(0.1)
+    remaining = sum("7" in replica._credentials_cache for replica in replicas)
+    in_redis = await redis.redis_client.exists(f"{CREDENTIALS_KEY_PREFIX}7")
+
+    for listener in listeners:
+        listener.cancel()
+    await asyncio.gather(*listeners, return_exceptions=True)
+    await redis.disconnect()
+
+    print(f"\nInvalidación del buzon '7' en la réplica 0: réplicas con copia en memoria {remaining}/{REPLICAS}, en Redis: {bool(in_redis)}")
+    assert remaining == 0 and not in_redis
+
+
+async def main():
+    logging.getLogger("app").setLevel(logging.ERROR)
+    print(f"Deploy de {REPLICAS} réplicas con cache frío, {len(BUZONES)} buzones\n")
+    print(f"{'cache compartido':>16} | consultas a Supabase")
+    print("-" * 40)
+    for shared in (False, True):
+        lookups = await rolling_deploy(shared)
+        print(f"{'sí' if shared else 'no':>16} | {lookups}")
+    assert lookups == len(BUZONES)
+
+    await cross_replica_invalidation()
+    print("\nOK: una consulta por buzon para todas las réplicas, cifradas en Redis e invalidadas en todas")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""
+Configuración de las pruebas: FakeRedis en memoria (sin Redis real) y
+ejecución de las pruebas async con asyncio.run.
+
+Ejecutar desde API_WHATSAPP_QUEUE: python -m pytest tests
+"""
+import asyncio
+import inspect
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+
+from app.services.redis_service import RedisService
+from app.services.redis_stream_service import RedisStreamService
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    """Ejecuta las pruebas `async def` en un event loop nuevo"""
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    kwargs = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+    asyncio.run(pyfuncitem.obj(**kwargs))
+    return True
+
+
+async def connect_redis_service(backend: str = "list", **options) -> RedisService:
+    """RedisService (o RedisStreamService) conectado a un FakeRedis propio"""
+    service_class = RedisStreamService if backend == "stream" else RedisService
+    service = service_class(redis_url="", **options)
+    service.redis_client = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    await service.connect()
+    return service
+
+
+@pytest.fixture
+def redis_factory():
+    """Crea servicios de Redis sobre FakeRedis: await redis_factory("stream", lease_timeout=...)"""
+    return connect_redis_service
+
+
+def campaign_message(i: int) -> dict:
+    """Mensaje con credenciales directas (no consulta Supabase)"""
+    return {
+        "numero": f"58412{i:07d}",
+        "plantilla": "promo_fibra_visual",
+        "idioma": "es",
+        "token": "token-14",
+        "phone_id": "phone-14"
+    }
+
+
+@pytest.fixture
+def messages():
+    """Mensajes de campaña numerados: messages(10)"""
+    return lambda count: [campaign_message(i) for i in range(count)]
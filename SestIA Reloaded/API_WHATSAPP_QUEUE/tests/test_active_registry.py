@@ -0,0 +1,75 @@
+"""
+Registro de campañas activas: los pendientes por campaña cuentan lo mismo que
+`get_campaign_stats` (en cola, en vuelo y reintentos programados) en ambos
+backends, y el reparto usa solo lo desencolable.
+"""
+import asyncio
+import time
+
+import pytest
+
+
+@pytest.mark.parametrize("backend", ["list", "stream"])
+async def test_registry_counts_inflight_and_retries(redis_factory, messages, backend):
+    redis = await redis_factory(backend)
+    await redis.enqueue_campaign("c", messages(3), {"plantilla": "p"})
+
+    # Todo en vuelo: la campaña sigue activa con sus 3 pendientes
+    leased = await redis.lease_messages("c", 3, "replica-a")
+    assert await redis.get_pending_by_campaign() == {"c": 3}
+    assert await redis.get_active_campaigns() == ["c"]
+
+    # Uno enviado, uno reprogramado y uno todavía en vuelo
+    (sent_id, _), (retry_id, retry_message), _ = leased
+    await redis.apply_results({"c": {
+        "enviados": 1,
+        "fallidos": 0,
+        "reintentos": 1,
+        "ultimo_envio": None,
+        "retries": [(retry_message, int(time.time() * 1000) + 60000)],
+        "leases": [sent_id, retry_id]
+    }})
+    assert await redis.get_pending_by_campaign() == {"c": 2}
+    assert await redis.get_queue_counts_by_campaign() == {"c": (0, 2)}
+    assert await redis.get_total_pending_messages() == 2
+    assert (await redis.get_campaign_stats("c"))["pendientes"] == 2
+    assert not await redis.deactivate_campaign("c")
+    await redis.disconnect()
+
+
+@pytest.mark.parametrize("backend", ["list", "stream"])
+async def test_due_retries_are_promoted_to_their_queue(redis_factory, messages, backend):
+    redis = await redis_factory(backend)
+    await redis.enqueue_campaign("c", messages(2), {"plantilla": "p"})
+    leased = await redis.lease_messages("c", 2, "replica-a")
+    await redis.apply_results({"c": {
+        "enviados": 0,
+        "fallidos": 0,
+        "reintentos": 2,
+        "ultimo_envio": None,
+        "retries": [(message, 0) for _, message in leased],
+        "leases": [lease_id for lease_id, _ in leased]
+    }})
+
+    promoted, next_due = await redis.promote_due_retries()
+    assert (promoted, next_due) == (2, None)
+    assert len(await redis.lease_messages("c", 2, "replica-b")) == 2
+    await redis.disconnect()
+
+
+@pytest.mark.parametrize("backend", ["list", "stream"])
+async def test_queue_counts_separate_dequeuable_from_pending(redis_factory, messages, backend):
+    redis = await redis_factory(backend, lease_timeout=0.2)
+    await redis.enqueue_campaign("en-vuelo", messages(3), {"plantilla": "p"})
+    await redis.enqueue_campaign("en-cola", messages(2), {"plantilla": "p"})
+
+    # Todo lo de "en-vuelo" tomado: pendiente, pero nada para repartir
+    await redis.lease_messages("en-vuelo", 3, "replica-a")
+    assert await redis.get_queue_counts_by_campaign() == {"en-vuelo": (0, 3), "en-cola": (2, 2)}
+
+    # Lease vencido: vuelve a ser desencolable (reaper en listas, XAUTOCLAIM en streams)
+    await asyncio.sleep(0.3)
+    await redis.requeue_expired_leases()
+    assert (await redis.get_queue_counts_by_campaign())["en-vuelo"] == (3, 3)
+    assert len(await redis.lease_messages("en-vuelo", 3, "replica-b")) == 3
+    await redis.disconnect()
@@ -0,0 +1,93 @@
+"""
+Encolado por bloques: una carga grande sobre una campaña con cola existente
+se mueve por bloques (sin copiarla entera en un script) y se cuenta una vez;
+un encolado vacío no deja colas sin registrar y uno sobre una campaña activa
+no cambia la plantilla de sus filas ya encoladas.
+"""
+import pytest
+
+from app.utils.message_codec import decode_message, encode_row
+
+
+def staging_queues(keys):
+    """Listas/streams temporales (sin las marcas de commit, que vencen solas)"""
+    return [key for key in keys if not key.endswith(":commit")]
+
+
+@pytest.mark.parametrize("backend", ["list", "stream"])
+async def test_staged_enqueue_into_existing_queue(redis_factory, messages, backend):
+    redis = await redis_factory(backend, enqueue_chunk_size=4)
+    await redis.enqueue_campaign("c", messages(3), {"plantilla": "p"})
+
+    # Cola existente: la carga de 10 (3 bloques) se mueve por bloques al final
+    calls = []
+    move = redis._move_staged_script
+
+    async def counting_move(**kwargs):
+        calls.append(kwargs["args"][0])
+        return await move(**kwargs)
+
+    redis._move_staged_script = counting_move
+    await redis.enqueue_campaign("c", messages(13)[3:], {"plantilla": "p"})
+    assert calls == [4, 4, 4]
+
+    stats = await redis.get_campaign_stats("c")
+    assert (stats["total"], stats["pendientes"]) == (13, 13)
+    leased = await redis.lease_messages("c", 20, "replica-a")
+    assert [message["numero"] for _, message in leased] == [m["numero"] for m in messages(13)]
+    assert not staging_queues(await redis.redis_client.keys("staging:*"))
+    await redis.disconnect()
+
+
+@pytest.mark.parametrize("backend", ["list", "stream"])
+async def test_staged_enqueue_into_new_queue_is_renamed(redis_factory, messages, backend):
+    redis = await redis_factory(backend, enqueue_chunk_size=4)
+    assert await redis.enqueue_campaign("c", iter(messages(10)), {"plantilla": "p"}) == 10
+    stats = await redis.get_campaign_stats("c")
+    assert (stats["total"], stats["pendientes"]) == (10, 10)
+    assert await redis.get_active_campaigns() == ["c"]
+    assert not staging_queues(await redis.redis_client.keys("staging:*"))
+    await redis.disconnect()
+
+
+@pytest.mark.parametrize("backend", ["list", "stream"])
+async def test_empty_enqueue_leaves_no_queue(redis_factory, backend):
+    redis = await redis_factory(backend)
+    assert await redis.enqueue_campaign("c", [], {"plantilla": "p"}) == 0
+    assert not await redis.redis_client.exists(redis._queue_key("c"))
+    assert await redis.get_pending_by_campaign() == {}
+    await redis.disconnect()
+
+
+@pytest.mark.parametrize("backend", ["list", "stream"])
+async def test_reenqueue_into_active_campaign_keeps_campaign_fields(redis_factory, backend):
+    redis = await redis_factory(backend)
+    metadata = {"plantilla": "promo", "buzon": "14", "idioma": "es"}
+    await redis.enqueue_campaign("c", [encode_row({"numero": "1"})], metadata)
+
+    # Misma campaña activa con otra plantilla: rechazado sin tocar la cola
+    with pytest.raises(ValueError):
+        await redis.enqueue_campaign("c", [encode_row({"numero": "2"})], dict(metadata, plantilla="otra"))
+    assert (await redis.get_campaign_stats("c"))["total"] == 1
+
+    # Mismos campos (otro peso): se agrega
+    await redis.enqueue_campaign("c", [encode_row({"numero": "3"})], dict(metadata, peso=2.0))
+
+    # Mensaje individual (formato completo) con el ID de la campaña masiva
+    individual = {"numero": "4", "plantilla": "aviso", "idioma": "en", "buzon": None}
+    await redis.enqueue_campaign(
+        "c", [individual], {"plantilla": "aviso", "idioma": "en"}, priority=True, self_contained=True
+    )
+
+    stored = await redis.get_campaign_metadata("c")
+    assert (stored["plantilla"], stored["buzon"], stored["idioma"], stored["peso"]) == ("promo", "14", "es", "2.0")
+    leased = await redis.lease_messages("c", 10, "replica-a")
+    decoded = [decode_message(message, stored) for _, message in leased]
+    assert [(m["numero"], m["plantilla"]) for m in decoded] == [("1", "promo"), ("3", "promo"), ("4", "aviso")]
+
+    # Ya vacía y dada de baja, el ID se puede reutilizar con otra plantilla
+    await redis.ack_messages("c", [lease_id for lease_id, _ in leased])
+    assert await redis.deactivate_campaign("c")
+    await redis.enqueue_campaign("c", [encode_row({"numero": "5"})], dict(metadata, plantilla="otra"))
+    assert (await redis.get_campaign_metadata("c"))["plantilla"] == "otra"
+    await redis.disconnect()
@@ -0,0 +1,60 @@
+"""
+Estado de los circuitos publicado por los workers independientes: la API sin
+worker embebido informa, por circuito, el del worker en el estado más grave.
+"""
+from app.services.circuit_breaker import CircuitBreakers, OPEN, CLOSED
+from app.services.sender_router import SenderRouter
+from app.services.whatsapp_service import WhatsAppService
+from app.services.worker import CIRCUIT_STATUS_MAX_AGE, WorkerService
+
+FAILED = {"success": False, "status_code": None, "retryable": True}
+THROTTLED = {"success": False, "status_code": 429, "retryable": True}
+
+
+def make_worker(redis, name):
+    worker = WorkerService(
+        redis=redis,
+        supabase=None,
+        whatsapp=SenderRouter({"middleware": WhatsAppService(
+            api_url="http://middleware",
+            circuit_breakers=CircuitBreakers(failure_threshold=2, open_seconds=60)
+        )}),
+        delay_ms=0
+    )
+    worker.consumer_name = name
+    return worker
+
+
+async def test_api_reports_worst_published_circuits(redis_factory):
+    redis = await redis_factory("list")
+    api = make_worker(redis, "api")
+    healthy, degraded = make_worker(redis, "w0"), make_worker(redis, "w1")
+
+    # Ningún worker publicó: sin estado (no "cerrado" por defecto)
+    assert await api.get_published_circuit_status() is None
+
+    for _ in range(2):
+        degraded.circuit_breakers_for({}).record("phone-1", FAILED)
+        healthy.circuit_breakers_for({}).record("phone-2", THROTTLED)
+    for worker in (healthy, degraded):
+        await redis.publish_circuit_status(worker.consumer_name, worker.get_circuit_status())
+
+    merged = await api.get_published_circuit_status()
+    assert merged["middleware"]["servicio"]["estado"] == OPEN
+    assert merged["middleware"]["phone_ids"]["phone-2"]["estado"] == OPEN
+    assert merged["middleware"]["phone_ids"]["phone-1"]["estado"] == CLOSED
+
+    # Un worker que se detiene retira su estado
+    await redis.publish_circuit_status("w1", None)
+    assert (await api.get_published_circuit_status())["middleware"]["servicio"]["estado"] == CLOSED
+    await redis.disconnect()
+
+
+async def test_stale_published_circuits_are_dropped(redis_factory):
+    redis = await redis_factory("list")
+    await redis.publish_circuit_status("w0", make_worker(redis, "w0").get_circuit_status())
+
+    assert await redis.get_published_circuit_status(CIRCUIT_STATUS_MAX_AGE)
+    assert await redis.get_published_circuit_status(-1) == {}
+    assert await redis.get_published_circuit_status(CIRCUIT_STATUS_MAX_AGE) == {}
+    await redis.disconnect()
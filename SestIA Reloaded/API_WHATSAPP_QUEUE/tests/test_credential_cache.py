@@ -0,0 +1,162 @@
+"""
+Cache de credenciales del worker: una consulta a Supabase por buzon y por TTL
+aunque muchos envíos las pidan a la vez, y un token rotado se recarga tras el
+primer 401. La precarga de Supabase pagina por id y no repite ni omite buzones.
+"""
+import asyncio
+from collections import Counter
+
+from app.services.supabase_service import SupabaseService
+from app.services.worker import WorkerService
+from app.utils.message_codec import encode_row
+
+BUZONES = ("14", "15", "16")
+TTL_SECONDS = 0.3
+
+
+class FakeSupabase:
+    """Supabase simulado: cuenta consultas por buzon y permite rotar tokens"""
+
+    def __init__(self):
+        self.lookups = Counter()
+        self.token_version = Counter()
+
+    async def get_credentials(self, buzon_id):
+        self.lookups[buzon_id] += 1
+        await asyncio.sleep(0.02)
+        return {"token": f"token-{buzon_id}-v{self.token_version[buzon_id]}", "phone_id": f"phone-{buzon_id}"}
+
+    def invalidate_credentials(self, buzon_id):
+        pass
+
+
+class TokenCheckingWhatsApp:
+    """Middleware simulado que solo acepta el token vigente de cada buzon"""
+
+    def __init__(self, supabase: FakeSupabase):
+        self.supabase = supabase
+        self.rejected = 0
+
+    async def send_message(self, credentials, message_data):
+        await asyncio.sleep(0.005)
+        buzon = credentials["phone_id"].split("-")[1]
+        if credentials["token"] != f"token-{buzon}-v{self.supabase.token_version[buzon]}":
+            self.rejected += 1
+            return {"success": False, "wamid": None, "error": "Token inválido", "status_code": 401, "retryable": False}
+        return {"success": True, "wamid": "wamid.x", "error": None, "status_code": 200, "retryable": False}
+
+
+class FakeQuery:
+    """Consulta PostgREST simulada sobre filas en memoria (gt/order/limit)"""
+
+    def __init__(self, rows, pages):
+        self.rows = rows
+        self.pages = pages
+
+    def select(self, columns):
+        return self
+
+    def gt(self, column, value):
+        self.rows = [row for row in self.rows if row[column] > value]
+        return self
+
+    def order(self, column):
+        self.rows = sorted(self.rows, key=lambda row: row[column])
+        return self
+
+    def limit(self, count):
+        self.rows = self.rows[:count]
+        return self
+
+    async def execute(self):
+        self.pages.append([row["id"] for row in self.rows])
+        return type("Result", (), {"data": self.rows})()
+
+
+async def test_preload_pages_by_unique_id():
+    # Todos los buzones de WhatsApp comparten canal 14
+    rows = [
+        {"id": i, "canal": 14, "key": f"token-{i},phone-{i}", "nameid": f"n{i}", "custom_name": f"buzon-{i}"}
+        for i in (7, 3, 9, 1, 5)
+    ]
+    pages = []
+    supabase = SupabaseService("", "", page_size=2)
+    supabase.client = type("Client", (), {"table": lambda self, name: FakeQuery(rows, pages)})()
+
+    assert await supabase.load_all_credentials() == 5
+    assert pages == [[1, 3], [5, 7], [9]]
+    assert (await supabase.get_credentials("buzon-9"))["token"] == "token-9"
+
+
+async def test_one_lookup_per_buzon_per_ttl_under_concurrency():
+    supabase = FakeSupabase()
+    worker = WorkerService(
+        redis=None,
+        supabase=supabase,
+        whatsapp=None,
+        delay_ms=0,
+        credentials_ttl_seconds=TTL_SECONDS
+    )
+
+    async def burst():
+        results = await asyncio.gather(*(
+            worker.get_cached_credentials(buzon) for buzon in BUZONES for _ in range(50)
+        ))
+        assert all(results)
+
+    # Cache frío: 50 pedidos simultáneos por buzon, una sola consulta
+    await burst()
+    assert supabase.lookups == {buzon: 1 for buzon in BUZONES}
+
+    # Cache vigente: sin consultas
+    await burst()
+    assert supabase.lookups == {buzon: 1 for buzon in BUZONES}
+
+    # Vencido el TTL: una consulta más por buzon
+    await asyncio.sleep(TTL_SECONDS + 0.05)
+    await burst()
+    assert supabase.lookups == {buzon: 2 for buzon in BUZONES}
+
+
+async def test_rotated_token_is_reloaded_after_first_401(redis_factory):
+    total = 200
+    redis = await redis_factory("list")
+    for buzon in BUZONES:
+        await redis.enqueue_campaign(
+            f"campana-{buzon}",
+            (encode_row({"numero": f"58412{i:07d}"}) for i in range(total)),
+            {"plantilla": "p", "buzon": buzon, "idioma": "es"}
+        )
+    supabase = FakeSupabase()
+    whatsapp = TokenCheckingWhatsApp(supabase)
+    worker = WorkerService(
+        redis=redis,
+        supabase=supabase,
+        whatsapp=whatsapp,
+        delay_ms=0,
+        concurrency=20,
+        stats_flush_interval_ms=20,
+        credentials_ttl_seconds=3600
+    )
+    task = asyncio.create_task(worker.start_worker())
+
+    rotated = False
+    while True:
+        stats = [await redis.get_campaign_stats(f"campana-{buzon}") for buzon in BUZONES]
+        if not rotated and sum(s["enviados"] for s in stats) >= len(BUZONES) * total // 2:
+            for buzon in BUZONES:
+                supabase.token_version[buzon] += 1
+            rotated = True
+        if all(s["pendientes"] == 0 for s in stats):
+            break
+        await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    # TTL de 1 h: la segunda consulta por buzon es por el 401, no por vencimiento
+    assert supabase.lookups == {buzon: 2 for buzon in BUZONES}
+    # Solo fallan los envíos que ya tenían el token viejo (a lo sumo los retenidos)
+    assert sum(s["fallidos"] for s in stats) == whatsapp.rejected
+    assert 0 < whatsapp.rejected <= 2 * worker.concurrency
+    assert sum(s["enviados"] + s["fallidos"] for s in stats) == len(BUZONES) * total
+    await redis.disconnect()
@@ -0,0 +1,254 @@
+"""
+Recuperación de mensajes en vuelo tras la caída de una réplica: leases del
+backend de listas (reaper) y entradas pendientes del backend de streams
+(XAUTOCLAIM), a nivel de RedisService y del worker completo.
+"""
+import asyncio
+from collections import Counter
+
+import pytest
+
+from app.services.redis_service import RedisService
+from app.services.worker import WorkerService
+
+LEASE_TIMEOUT = 0.3
+
+
+def numbers(leased):
+    return [message["numero"] for _, message in leased]
+
+
+async def test_list_expired_leases_are_redelivered_once(redis_factory, messages):
+    redis = await redis_factory("list", lease_timeout=LEASE_TIMEOUT)
+    await redis.enqueue_campaign("c", messages(10), {"plantilla": "p"})
+
+    # La réplica A toma 10 mensajes, confirma 4 y se cae con 6 en vuelo
+    leased = await redis.lease_messages("c", 10, "replica-a")
+    assert len(leased) == 10
+    await redis.ack_messages("c", [lease_id for lease_id, _ in leased[:4]])
+    lost = numbers(leased[4:])
+
+    # Con el lease vigente nada vuelve a la cola ni lo toma otra réplica
+    assert await redis.requeue_expired_leases() == 0
+    assert await redis.lease_messages("c", 10, "replica-b") == []
+    assert (await redis.get_campaign_stats("c"))["pendientes"] == 6
+
+    # Vencido el lease, el reaper devuelve solo los 6 sin confirmar
+    await asyncio.sleep(LEASE_TIMEOUT + 0.1)
+    assert await redis.requeue_expired_leases() == 6
+    redelivered = await redis.lease_messages("c", 10, "replica-b")
+    assert sorted(numbers(redelivered)) == sorted(lost)
+
+    await redis.ack_messages("c", [lease_id for lease_id, _ in redelivered])
+    await asyncio.sleep(LEASE_TIMEOUT + 0.1)
+    assert await redis.requeue_expired_leases() == 0
+    assert (await redis.get_campaign_stats("c"))["pendientes"] == 0
+    assert await redis.deactivate_campaign("c")
+    await redis.disconnect()
+
+
+async def test_renew_before_connect_is_handled():
+    redis = RedisService(redis_url="")
+    assert await redis.renew_leases("c", ["lease-1"], "replica-a") == []
+
+
+async def test_list_ack_after_reap_does_not_duplicate(redis_factory, messages):
+    redis = await redis_factory("list", lease_timeout=LEASE_TIMEOUT)
+    await redis.enqueue_campaign("c", messages(3), {"plantilla": "p"})
+    leased = await redis.lease_messages("c", 3, "replica-a")
+
+    await asyncio.sleep(LEASE_TIMEOUT + 0.1)
+    assert await redis.requeue_expired_leases() == 3
+
+    # El ack tardío de la réplica A no borra los mensajes ya devueltos a la cola
+    await redis.ack_messages("c", [lease_id for lease_id, _ in leased])
+    assert len(await redis.lease_messages("c", 3, "replica-b")) == 3
+    await redis.disconnect()
+
+
+async def test_stream_pending_entries_are_reclaimed_once(redis_factory, messages):
+    redis = await redis_factory("stream", lease_timeout=LEASE_TIMEOUT)
+    await redis.enqueue_campaign("c", messages(10), {"plantilla": "p"})
+
+    leased = await redis.lease_messages("c", 10, "replica-a")
+    assert len(leased) == 10
+    await redis.ack_messages("c", [entry_id for entry_id, _ in leased[:4]])
+    lost = numbers(leased[4:])
+
+    # Pendientes de A todavía vigentes: B no recibe nada
+    assert await redis.lease_messages("c", 10, "replica-b") == []
+
+    # Inactivas más que el lease: B las reclama con XAUTOCLAIM al leer
+    await asyncio.sleep(LEASE_TIMEOUT + 0.1)
+    reclaimed = await redis.lease_messages("c", 10, "replica-b")
+    assert sorted(numbers(reclaimed)) == sorted(lost)
+    pending = await redis.redis_client.xpending_range("campaign:c:stream", "workers", "-", "+", 100)
+    assert Counter(entry["consumer"] for entry in pending) == {"replica-b": 6}
+
+    await redis.ack_messages("c", [entry_id for entry_id, _ in reclaimed])
+    await asyncio.sleep(LEASE_TIMEOUT + 0.1)
+    assert await redis.lease_messages("c", 10, "replica-c") == []
+    assert (await redis.get_campaign_stats("c"))["pendientes"] == 0
+    assert await redis.deactivate_campaign("c")
+    await redis.disconnect()
+
+
+class HangingWhatsApp:
+    """Envía al instante los números pares; los impares quedan colgados (réplica que se cae)"""
+
+    def __init__(self, hang_odd: bool):
+        self.hang_odd = hang_odd
+        self.sent = Counter()
+
+    async def send_message(self, credentials, message_data):
+        numero = message_data["numero"]
+        if self.hang_odd and int(numero) % 2:
+            await asyncio.Event().wait()
+        self.sent[numero] += 1
+        return {"success": True, "wamid": f"wamid.{numero}", "error": None, "status_code": 200, "retryable": False}
+
+
+def make_worker(redis, whatsapp, consumer_name):
+    return WorkerService(
+        redis=redis,
+        supabase=None,
+        whatsapp=whatsapp,
+        delay_ms=0,
+        batch_size=20,
+        consumer_name=consumer_name,
+        lease_reap_interval=0.1,
+        stats_flush_interval_ms=20,
+        concurrency=20,
+        priority_concurrency=1
+    )
+
+
+async def wait_until(condition, timeout=10.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not await condition():
+        assert asyncio.get_running_loop().time() < deadline, "tiempo de espera agotado"
+        await asyncio.sleep(0.02)
+
+
+@pytest.mark.parametrize("backend", ["list", "stream"])
+async def test_worker_crash_mid_send_redelivers_unacked_exactly_once(redis_factory, messages, backend):
+    total = 40
+    redis = await redis_factory(backend, lease_timeout=LEASE_TIMEOUT)
+    await redis.enqueue_campaign("c", messages(total), {"plantilla": "p"})
+
+    # Réplica A: envía los pares y se cae con los impares en vuelo
+    whatsapp_a = HangingWhatsApp(hang_odd=True)
+    worker_a = make_worker(redis, whatsapp_a, "replica-a")
+    task_a = asyncio.create_task(worker_a.start_worker())
+
+    async def evens_counted():
+        return (await redis.get_campaign_stats("c"))["enviados"] == total // 2
+
+    await wait_until(evens_counted)
+    task_a.cancel()
+    await asyncio.gather(task_a, return_exceptions=True)
+
+    # Réplica B: recibe solo lo que A no confirmó, una vez cada mensaje
+    whatsapp_b = HangingWhatsApp(hang_odd=False)
+    worker_b = make_worker(redis, whatsapp_b, "replica-b")
+    task_b = asyncio.create_task(worker_b.start_worker())
+
+    async def completed():
+        return (await redis.get_campaign_stats("c"))["pendientes"] == 0
+
+    await wait_until(completed)
+    worker_b.is_running = False
+    task_b.cancel()
+    await asyncio.gather(task_b, return_exceptions=True)
+
+    odd = {m["numero"] for m in messages(total) if int(m["numero"]) % 2}
+    assert set(whatsapp_a.sent) == {m["numero"] for m in messages(total)} - odd
+    assert set(whatsapp_b.sent) == odd
+    assert all(count == 1 for count in (whatsapp_a.sent + whatsapp_b.sent).values())
+    stats = await redis.get_campaign_stats("c")
+    assert stats["enviados"] == total and stats["fallidos"] == 0
+    await redis.disconnect()
+
+
+async def test_stream_blocking_read_leases_new_entries(redis_factory, messages):
+    redis = await redis_factory("stream", lease_timeout=LEASE_TIMEOUT)
+    await redis.enqueue_campaign("c", messages(3), {"plantilla": "p"})
+    await redis.enqueue_campaign("d", messages(2), {"plantilla": "p"})
+    leased = await redis.lease_messages("c", 3, "replica-a")
+
+    # Todo lo de "c" en vuelo: la espera entrega lo nuevo de "d" con lease de B
+    waited = await redis.wait_for_messages(["c", "d"], 10, "replica-b", 100)
+    assert list(waited) == ["d"] and len(waited["d"]) == 2
+    assert await redis.lease_messages("d", 10, "replica-c") == []
+
+    # Sin entradas nuevas espera el plazo completo y no devuelve nada
+    started = asyncio.get_running_loop().time()
+    assert await redis.wait_for_messages(["c", "d"], 10, "replica-b", 100) == {}
+    assert asyncio.get_running_loop().time() - started >= 0.09
+
+    await redis.ack_messages("c", [entry_id for entry_id, _ in leased])
+    await redis.ack_messages("d", [entry_id for entry_id, _ in waited["d"]])
+    assert (await redis.get_campaign_stats("d"))["pendientes"] == 0
+    await redis.disconnect()
+
+
+@pytest.mark.parametrize("backend", ["list", "stream"])
+async def test_renewed_leases_are_not_redelivered(redis_factory, messages, backend):
+    redis = await redis_factory(backend, lease_timeout=LEASE_TIMEOUT)
+    await redis.enqueue_campaign("c", messages(5), {"plantilla": "p"})
+    lease_ids = [lease_id for lease_id, _ in await redis.lease_messages("c", 5, "replica-a")]
+
+    # Retenidos el doble del lease, renovando cada tercio: nadie los toma
+    for _ in range(6):
+        await asyncio.sleep(LEASE_TIMEOUT / 3)
+        assert await redis.renew_leases("c", lease_ids, "replica-a") == []
+    assert await redis.requeue_expired_leases() == 0
+    assert await redis.lease_messages("c", 5, "replica-b") == []
+
+    # Sin renovar vencen, otra réplica los toma y A los ve como perdidos
+    await asyncio.sleep(LEASE_TIMEOUT + 0.1)
+    await redis.requeue_expired_leases()
+    assert len(await redis.lease_messages("c", 5, "replica-b")) == 5
+    assert sorted(await redis.renew_leases("c", lease_ids, "replica-a")) == sorted(lease_ids)
+    await redis.disconnect()
+
+
+class SlowWhatsApp:
+    """Cada envío tarda más que el lease: los mensajes esperan en la cola local"""
+
+    def __init__(self, sent: Counter):
+        self.sent = sent
+
+    async def send_message(self, credentials, message_data):
+        await asyncio.sleep(LEASE_TIMEOUT * 1.5)
+        self.sent[message_data["numero"]] += 1
+        return {"success": True, "wamid": "wamid", "error": None, "status_code": 200, "retryable": False}
+
+
+@pytest.mark.parametrize("backend", ["list", "stream"])
+async def test_held_messages_outliving_lease_are_sent_once(redis_factory, messages, backend):
+    total = 12
+    redis = await redis_factory(backend, lease_timeout=LEASE_TIMEOUT)
+    await redis.enqueue_campaign("c", messages(total), {"plantilla": "p"})
+
+    # Dos réplicas con 2 envíos simultáneos: la mayoría de los mensajes
+    # retenidos espera varias veces el lease antes de enviarse
+    sent = Counter()
+    workers = []
+    for name in ("replica-a", "replica-b"):
+        worker = make_worker(redis, SlowWhatsApp(sent), name)
+        worker.concurrency = 2
+        workers.append(worker)
+    tasks = [asyncio.create_task(worker.start_worker()) for worker in workers]
+
+    async def completed():
+        return (await redis.get_campaign_stats("c"))["pendientes"] == 0
+
+    await wait_until(completed)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert sum(sent.values()) == total and all(count == 1 for count in sent.values())
+    assert (await redis.get_campaign_stats("c"))["enviados"] == total
+    await redis.disconnect()
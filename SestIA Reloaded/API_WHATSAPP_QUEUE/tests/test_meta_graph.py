@@ -0,0 +1,100 @@
+"""
+Envío directo a la Graph API (MetaGraphService) contra un transporte simulado:
+forma del mensaje de plantilla y traducción de los códigos de error de Meta al
+status que usan el worker y los circuitos.
+"""
+import httpx
+import orjson
+import pytest
+
+from app.services.meta_graph_service import MetaGraphService
+
+CREDENTIALS = {"token": "token-14", "phone_id": "phone-14"}
+
+
+def graph_service(handler) -> MetaGraphService:
+    """MetaGraphService con un cliente HTTP sobre httpx.MockTransport"""
+    service = MetaGraphService(graph_url="https://graph.test", api_version="v21.0")
+    service.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return service
+
+
+async def test_template_payload_with_variables_and_image():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"messages": [{"id": "wamid.1"}]})
+
+    service = graph_service(handler)
+    result = await service.send_message(CREDENTIALS, {
+        "numero": "584120000001",
+        "plantilla": "promo_fibra_visual",
+        "idioma": "es",
+        "variable1": " Ana ",
+        "variable2": 30,
+        "variable3": "",
+        "variable4": "ignorada",
+        "url_imagen": " https://cdn.test/promo.jpg "
+    })
+    await service.disconnect()
+
+    assert result["success"] and result["wamid"] == "wamid.1"
+    (request,) = requests
+    assert str(request.url) == "https://graph.test/v21.0/phone-14/messages"
+    assert request.headers["Authorization"] == "Bearer token-14"
+    assert orjson.loads(request.content) == {
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "type": "template",
+        "template": {
+            "name": "promo_fibra_visual",
+            "language": {"code": "es"},
+            "components": [
+                {"type": "header", "parameters": [{"type": "image", "image": {"link": "https://cdn.test/promo.jpg"}}]},
+                # Las variables se cortan en la primera vacía
+                {"type": "body", "parameters": [{"type": "text", "text": "Ana"}, {"type": "text", "text": "30"}]}
+            ]
+        },
+        "to": "584120000001"
+    }
+
+
+async def test_template_payload_without_components():
+    bodies = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        bodies.append(orjson.loads(request.content))
+        return httpx.Response(200, json={"messages": [{"id": "wamid.2"}]})
+
+    service = graph_service(handler)
+    await service.send_message(CREDENTIALS, {"numero": "584120000002", "plantilla": "aviso", "idioma": "en"})
+    await service.disconnect()
+
+    assert bodies == [{
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "type": "template",
+        "template": {"name": "aviso", "language": {"code": "en"}},
+        "to": "584120000002"
+    }]
+
+
+@pytest.mark.parametrize("http_status, error_code, status_code, retryable", [
+    (400, 130429, 429, True),   # Límite de envío de la Cloud API
+    (401, 190, 401, False),     # Token inválido o vencido
+    (500, 131000, 503, True),   # Error temporal de Meta
+    (400, 132001, 400, False),  # Plantilla inexistente: error del mensaje
+])
+async def test_meta_error_codes_are_mapped(http_status, error_code, status_code, retryable):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(http_status, json={"error": {"code": error_code, "message": "error de Meta"}})
+
+    service = graph_service(handler)
+    result = await service.send_message(CREDENTIALS, {"numero": "584120000003", "plantilla": "aviso", "idioma": "es"})
+    await service.disconnect()
+
+    assert not result["success"]
+    assert (result["status_code"], result["retryable"]) == (status_code, retryable)
+    assert result["error"] == f"Meta {error_code}: error de Meta"
+    assert service.is_auth_error_status(result["status_code"]) == (error_code == 190)
@@ -0,0 +1,40 @@
+"""
+Ráfaga del token bucket por phone_id: RATE_LIMIT_BURST se escala al rate de
+los buzones con override, y los buzones que comparten phone_id usan el menor
+rate.
+"""
+import asyncio
+
+from app.services.rate_limiter import RateLimiter
+
+
+async def test_buzon_override_scales_burst(redis_factory):
+    redis = await redis_factory("list")
+    limiter = RateLimiter(redis, default_rate=80, default_burst=160, buzon_rates={"22": 10})
+
+    assert limiter.get_burst(limiter.get_rate()) == 160
+    assert limiter.get_burst(limiter.get_rate("22")) == 20
+    assert RateLimiter(redis, default_rate=80).get_burst(10) == 10
+
+    # El buzon con override solo admite su ráfaga escalada sin esperar
+    waits = [await redis.reserve_send_token("phone-22", 10, limiter.get_burst(10)) for _ in range(21)]
+    assert waits[:20] == [0.0] * 20
+    assert waits[20] > 0
+    await redis.disconnect()
+
+
+async def test_shared_phone_id_uses_lowest_buzon_rate(redis_factory):
+    redis = await redis_factory("list")
+
+    # Buzon lento (10/s) y buzon rápido (100/s) en el mismo phone_id: el
+    # rápido no rellena el bucket a su rate ni con su ráfaga
+    assert await redis.reserve_send_token("phone-1", 10, 10, rate_hold_seconds=0.2) == 0.0
+    waits = [await redis.reserve_send_token("phone-1", 100, 100, rate_hold_seconds=0.2) for _ in range(10)]
+    assert waits[:9] == [0.0] * 9
+    assert waits[9] >= 0.05  # turno a 10/s, no a 100/s
+
+    # Sin envíos del buzon lento durante la vigencia, vuelve el rate del rápido
+    await asyncio.sleep(0.3)
+    await redis.reserve_send_token("phone-1", 100, 100, rate_hold_seconds=0.2)
+    assert await redis.redis_client.hget("ratelimit:phone-1", "rate") == "100"
+    await redis.disconnect()
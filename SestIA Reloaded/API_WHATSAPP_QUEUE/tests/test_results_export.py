@@ -0,0 +1,44 @@
+"""
+Exportación de resultados: los resultados de la campaña que siguen en Redis
+(sin guardar en Supabase) se agregan al final sin repetir los ya guardados.
+"""
+import orjson
+
+from app.utils.results_export import stream_results
+
+
+def outcome(campaign_id, numero, estado="enviado"):
+    return {"campaign_id": campaign_id, "numero": numero, "estado": estado, "intento": 1}
+
+
+def applied(campaign_id, outcomes):
+    return {campaign_id: {
+        "enviados": 0, "fallidos": 0, "reintentos": 0, "ultimo_envio": None,
+        "retries": [], "leases": [], "outcomes": outcomes
+    }}
+
+
+async def pages_of(*pages):
+    for page in pages:
+        yield page
+
+
+async def test_export_merges_unsaved_results(redis_factory):
+    redis = await redis_factory("list")
+    await redis.apply_results(applied("c", [outcome("c", "1"), outcome("c", "2", "fallido")]))
+    await redis.apply_results(applied("otra", [outcome("otra", "9")]))
+    await redis.apply_results(applied("c", [outcome("c", "3")]))
+
+    unsaved = await redis.get_unsaved_results("c", page_size=2)
+    assert [result["numero"] for result in unsaved.values()] == ["1", "2", "3"]
+    assert [r["numero"] for r in (await redis.get_unsaved_results("c", "fallido")).values()] == ["2"]
+
+    # "1" ya se guardó (y sigue en Redis sin confirmar): no se repite
+    first_id = next(iter(unsaved))
+    saved = [{"stream_id": "otro-id", "numero": "0", "estado": "enviado"}, {"stream_id": first_id, "numero": "1", "estado": "enviado"}]
+    body = b"".join([chunk async for chunk in stream_results(saved, pages_of(), "ndjson", unsaved)])
+    assert [orjson.loads(line)["numero"] for line in body.splitlines()] == ["0", "1", "2", "3"]
+
+    csv_body = b"".join([chunk async for chunk in stream_results([], pages_of(saved), "csv", unsaved)])
+    assert [line.split(b",")[0] for line in csv_body.splitlines()] == [b"numero", b"0", b"1", b"2", b"3"]
+    await redis.disconnect()
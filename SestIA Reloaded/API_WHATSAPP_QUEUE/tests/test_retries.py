@@ -0,0 +1,47 @@
+"""
+Reintentos: un fallo transitorio se reprograma y suma a "reintentos"; un
+mensaje retenido por circuito abierto se reprograma sin gastar un intento ni
+sumar al contador.
+"""
+from app.services.worker import WorkerService
+
+
+class FixedResult:
+    """WhatsAppService que responde siempre lo mismo"""
+
+    def __init__(self, **result):
+        self.result = dict({"success": False, "wamid": None, "error": None, "status_code": None}, **result)
+
+    async def send_message(self, credentials, message_data):
+        return self.result
+
+
+async def run_messages(redis, whatsapp, count):
+    worker = WorkerService(redis=redis, supabase=None, whatsapp=whatsapp, delay_ms=0)
+    for lease_id, message in await redis.lease_messages("c", count, "replica-a"):
+        await worker.process_message("c", message, lease_id)
+    await worker.stats.flush()
+    return await redis.get_campaign_stats("c")
+
+
+async def test_transient_failure_counts_retry(redis_factory, messages):
+    redis = await redis_factory("list")
+    await redis.enqueue_campaign("c", messages(3), {"plantilla": "p"})
+
+    stats = await run_messages(redis, FixedResult(status_code=503, retryable=True), 3)
+    assert (stats["reintentos"], stats["fallidos"], stats["pendientes"]) == (3, 0, 3)
+    await redis.disconnect()
+
+
+async def test_circuit_open_reschedules_without_counting(redis_factory, messages):
+    redis = await redis_factory("list")
+    await redis.enqueue_campaign("c", messages(3), {"plantilla": "p"})
+
+    stats = await run_messages(redis, FixedResult(retryable=True, circuit_open=True, retry_after=60.0), 3)
+    assert (stats["reintentos"], stats["fallidos"], stats["pendientes"]) == (0, 0, 3)
+
+    # Reprogramados tal cual, sin intento gastado
+    retries = await redis.redis_client.zrange("campaign:c:retry", 0, -1)
+    assert len(retries) == 3
+    assert all('"intentos"' not in raw for raw in retries)
+    await redis.disconnect()
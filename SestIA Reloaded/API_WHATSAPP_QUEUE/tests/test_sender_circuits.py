@@ -0,0 +1,84 @@
+"""
+Circuitos por sender: una racha de 503 de la Graph API abre solo el circuito
+del sender "graph" y pausa sus buzones; las campañas que envían por el
+middleware siguen saliendo.
+"""
+import asyncio
+
+import httpx
+
+from app.services.circuit_breaker import CircuitBreakers, OPEN, CLOSED
+from app.services.meta_graph_service import MetaGraphService
+from app.services.sender_router import SenderRouter
+from app.services.whatsapp_service import WhatsAppService
+from app.services.worker import WorkerService
+from app.utils.message_codec import encode_row
+
+
+async def test_graph_503_storm_does_not_stop_middleware_campaigns(redis_factory):
+    total = 100
+    redis = await redis_factory("list")
+    for campaign_id, buzon in (("por-middleware", "14"), ("por-graph", "15")):
+        await redis.enqueue_campaign(
+            campaign_id,
+            (encode_row({"numero": f"58412{i:07d}"}) for i in range(total)),
+            {"plantilla": "p", "buzon": buzon, "idioma": "es"}
+        )
+
+    graph_calls = []
+
+    def graph_handler(request: httpx.Request) -> httpx.Response:
+        # Error temporal de Meta (131000): se traduce a 503, fallo del servicio
+        graph_calls.append(request)
+        return httpx.Response(500, json={"error": {"code": 131000, "message": "Something went wrong"}})
+
+    def middleware_handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"id": "wamid.x"})
+
+    middleware = WhatsAppService(
+        api_url="http://middleware",
+        circuit_breakers=CircuitBreakers(service="middleware", failure_threshold=3, open_seconds=60)
+    )
+    middleware.client = httpx.AsyncClient(transport=httpx.MockTransport(middleware_handler))
+    graph = MetaGraphService(
+        graph_url="https://graph.test",
+        api_version="v21.0",
+        circuit_breakers=CircuitBreakers(service="graph", failure_threshold=3, open_seconds=60)
+    )
+    graph.client = httpx.AsyncClient(transport=httpx.MockTransport(graph_handler))
+    router = SenderRouter({"middleware": middleware, "graph": graph}, buzon_senders={"15": "graph"})
+
+    worker = WorkerService(
+        redis=redis,
+        supabase=None,
+        whatsapp=router,
+        delay_ms=0,
+        concurrency=10,
+        stats_flush_interval_ms=20,
+        retry_base_delay_ms=10
+    )
+    worker._credentials_cache["14"] = {"token": "t", "phone_id": "phone-14"}
+    worker._credentials_cache["15"] = {"token": "t", "phone_id": "phone-15"}
+    task = asyncio.create_task(worker.start_worker())
+
+    async def middleware_done():
+        while (await redis.get_campaign_stats("por-middleware"))["enviados"] < total:
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(middleware_done(), timeout=10)
+    worker.is_running = False
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    status = router.get_circuit_status()
+    assert status["graph"]["servicio"]["estado"] == OPEN
+    assert status["middleware"]["servicio"]["estado"] == CLOSED
+    # Abierto el circuito de graph, sus mensajes esperan sin llamar a la API
+    # ni gastar intentos
+    assert len(graph_calls) < 3 + worker.concurrency
+    graph_stats = await redis.get_campaign_stats("por-graph")
+    assert graph_stats["enviados"] == graph_stats["fallidos"] == 0
+    assert graph_stats["pendientes"] == total
+    await middleware.disconnect()
+    await graph.disconnect()
+    await redis.disconnect()
@@ -0,0 +1,84 @@
+"""
+Precarga del worker: con control adaptativo, los mensajes retenidos (cola
+local + envíos en curso) siguen el límite del controlador y no el tamaño de
+la cola local. Un error de Redis al desencolar no detiene el desencolador.
+"""
+import asyncio
+
+from app.services.concurrency_controller import ConcurrencyController
+from app.services.worker import PREFETCH_PER_SLOT, WorkerService
+
+
+class SlowWhatsApp:
+    async def send_message(self, credentials, message_data):
+        await asyncio.sleep(0.02)
+        return {"success": True, "wamid": "wamid", "error": None, "status_code": 200, "retryable": False}
+
+
+async def test_prefetch_follows_adaptive_limit(redis_factory, messages):
+    total = 80
+    redis = await redis_factory("list")
+    await redis.enqueue_campaign("c", messages(total), {"plantilla": "p"})
+
+    # Límite fijo en 3 durante la prueba (ventana de evaluación larga)
+    controller = ConcurrencyController(max_limit=40, min_limit=1, initial_limit=3, interval=60)
+    worker = WorkerService(
+        redis=redis,
+        supabase=None,
+        whatsapp=SlowWhatsApp(),
+        delay_ms=0,
+        batch_size=20,
+        concurrency=40,
+        priority_concurrency=1,
+        stats_flush_interval_ms=20,
+        concurrency_controller=controller
+    )
+    task = asyncio.create_task(worker.start_worker())
+
+    held = []
+    while (await redis.get_campaign_stats("c"))["pendientes"] > 0:
+        held.append(len(worker._held))
+        await asyncio.sleep(0.005)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    # Cola local de 40, pero nunca más de PREFETCH_PER_SLOT * límite retenidos
+    assert max(held) <= PREFETCH_PER_SLOT * controller.limit
+    assert controller.limit == 3
+    assert (await redis.get_campaign_stats("c"))["enviados"] == total
+    await redis.disconnect()
+
+
+async def test_dequeue_loop_survives_redis_error(redis_factory, messages):
+    redis = await redis_factory("list")
+    await redis.enqueue_campaign("c", messages(5), {"plantilla": "p"})
+
+    # El primer ciclo falla al leer el registro (ej: Redis reiniciando)
+    get_counts = redis.get_queue_counts_by_campaign
+    failures = []
+
+    async def flaky_counts(priority=False):
+        if not priority and not failures:
+            failures.append(priority)
+            raise ConnectionError("Redis no disponible")
+        return await get_counts(priority)
+
+    redis.get_queue_counts_by_campaign = flaky_counts
+    worker = WorkerService(
+        redis=redis,
+        supabase=None,
+        whatsapp=SlowWhatsApp(),
+        delay_ms=0,
+        stats_flush_interval_ms=20
+    )
+    task = asyncio.create_task(worker.start_worker())
+    for _ in range(300):
+        if (await redis.get_campaign_stats("c"))["enviados"] == 5:
+            break
+        await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    assert failures
+    assert (await redis.get_campaign_stats("c"))["enviados"] == 5
+    await redis.disconnect()